@@ -0,0 +1,147 @@
+"""插件冷启动基准测试
+
+在全新的子进程中分别测量：
+  1. 导入 AstrBot 框架（基线，不计入插件开销）
+  2. 导入插件模块的耗时和常驻内存增量
+  3. 构造 AstrbotPluginFileReaderPro 的耗时和常驻内存增量
+并检查构造完成后 pandas、pdfminer 等解析库是否已被导入（应在首次解析对应格式时才导入）。
+另在单独的子进程中测量一次性导入全部解析库的开销，作为旧的模块级导入方式的对照。
+
+用法：python benchmarks/bench_cold_start.py [--repeat 5] [--max-import-ms 0] [--max-rss-mb 0]
+
+需要在安装了 AstrBot 的环境中运行。设置 --max-import-ms / --max-rss-mb 后，
+插件导入加构造的中位耗时或内存增量超过阈值、或构造后已导入任何解析库时以非零状态退出，便于发现回退。
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+
+# 应按需导入的解析库
+PARSER_MODULES = ("pandas", "pdfminer", "docx", "docx2txt", "pptx", "chardet", "openpyxl", "magic")
+
+
+def rss_mb() -> float:
+    """当前进程的常驻内存（MB）"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def measure_plugin() -> dict:
+    """子进程：导入并构造插件"""
+    sys.path.insert(0, str(PLUGIN_DIR.parent))
+    import astrbot.api.star  # noqa: F401  框架本身的导入不计入插件开销
+    import astrbot.api.all  # noqa: F401
+
+    # 框架自身已导入的库不算作插件导入
+    preloaded = {name for name in PARSER_MODULES if name in sys.modules}
+    base_rss = rss_mb()
+    start = time.perf_counter()
+    module = importlib.import_module(f"{PLUGIN_DIR.name}.main")
+    import_ms = (time.perf_counter() - start) * 1000
+    import_rss = rss_mb()
+
+    plugin_cls = module.AstrbotPluginFileReaderPro
+    with tempfile.TemporaryDirectory(prefix="bench_cold_start_") as data_dir:
+        # 数据目录指向临时目录，避免写入真实的插件数据
+        plugin_cls._resolve_data_dir = lambda self: Path(data_dir)
+        start = time.perf_counter()
+        plugin = plugin_cls(type("Context", (), {})(), {})
+        init_ms = (time.perf_counter() - start) * 1000
+        init_rss = rss_mb()
+        loaded = sorted(name for name in PARSER_MODULES if name in sys.modules and name not in preloaded)
+        asyncio.run(plugin.terminate())
+
+    return {
+        "import_ms": import_ms,
+        "init_ms": init_ms,
+        "import_rss_mb": import_rss - base_rss,
+        "init_rss_mb": init_rss - import_rss,
+        "parsers_loaded": loaded,
+    }
+
+
+def measure_eager_parsers() -> dict:
+    """子进程：一次性导入全部解析库（旧的模块级导入方式的开销）"""
+    base_rss = rss_mb()
+    start = time.perf_counter()
+    import chardet  # noqa: F401
+    import docx2txt  # noqa: F401
+    import pandas  # noqa: F401
+    from docx import Document  # noqa: F401
+    from pdfminer.high_level import extract_pages, extract_text  # noqa: F401
+    from pdfminer.layout import LTTextContainer  # noqa: F401
+    from pptx import Presentation  # noqa: F401
+    return {"import_ms": (time.perf_counter() - start) * 1000, "rss_mb": rss_mb() - base_rss}
+
+
+def run_child(mode: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", mode],
+        check=True, capture_output=True, text=True, cwd=str(PLUGIN_DIR.parent),
+    ).stdout
+    # 插件构造时可能输出日志，结果在最后一行
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="冷启动次数（取中位数）")
+    parser.add_argument("--max-import-ms", type=float, default=0, help="导入加构造耗时上限（毫秒），0表示不检查")
+    parser.add_argument("--max-rss-mb", type=float, default=0, help="导入加构造内存增量上限（MB），0表示不检查")
+    parser.add_argument("--child", choices=("plugin", "parsers"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = measure_plugin() if args.child == "plugin" else measure_eager_parsers()
+        print(json.dumps(result))
+        return
+
+    runs = [run_child("plugin") for _ in range(args.repeat)]
+    eager = [run_child("parsers") for _ in range(args.repeat)]
+
+    def median(results, key):
+        return statistics.median(result[key] for result in results)
+
+    total_ms = statistics.median(run["import_ms"] + run["init_ms"] for run in runs)
+    total_rss = statistics.median(run["import_rss_mb"] + run["init_rss_mb"] for run in runs)
+    loaded = sorted({name for run in runs for name in run["parsers_loaded"]})
+
+    print(f"冷启动 {args.repeat} 次，中位数：")
+    print(f"  导入插件模块: {median(runs, 'import_ms'):8.1f} ms  {median(runs, 'import_rss_mb'):7.1f} MB")
+    print(f"  构造插件实例: {median(runs, 'init_ms'):8.1f} ms  {median(runs, 'init_rss_mb'):7.1f} MB")
+    print(f"  合计:         {total_ms:8.1f} ms  {total_rss:7.1f} MB")
+    print(f"  构造后已导入的解析库: {', '.join(loaded) if loaded else '无'}")
+    print(f"对照（一次性导入全部解析库）: {median(eager, 'import_ms'):8.1f} ms  {median(eager, 'rss_mb'):7.1f} MB")
+
+    failures = []
+    if args.max_import_ms and total_ms > args.max_import_ms:
+        failures.append(f"耗时 {total_ms:.1f}ms 超过上限 {args.max_import_ms}ms")
+    if args.max_rss_mb and total_rss > args.max_rss_mb:
+        failures.append(f"内存增量 {total_rss:.1f}MB 超过上限 {args.max_rss_mb}MB")
+    if (args.max_import_ms or args.max_rss_mb) and loaded:
+        failures.append(f"插件加载时导入了解析库: {', '.join(loaded)}")
+    if failures:
+        print("回退: " + "；".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
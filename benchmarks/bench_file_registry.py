@@ -0,0 +1,144 @@
+"""文件登记表基准测试（单条消息的请求路径）
+
+构造插件实例，在登记表中存入不同数量的文件，测量 on_request 处理一条消息的完整耗时：
+取当前对话的文件、过期判断、直接注入小文件的全文、上下文打包、增加使用轮数。
+当前对话的文件都是直接注入的小文件，不调用嵌入和重排序服务，测得的是插件自身的开销。
+
+对照组把 FileRegistry 换成按旧方式线性扫描全部文件的扁平登记表（取对话文件、
+判断目录引用都遍历全部键），其余请求路径完全相同。
+
+用法：python benchmarks/bench_file_registry.py [--files-per-conversation 3] [--repeat 500]
+
+需要在安装了 AstrBot 的环境中运行。
+"""
+
+import argparse
+import asyncio
+import importlib
+import logging
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+
+TOTALS = (100, 1_000, 10_000, 100_000)
+
+
+def load_plugin_module():
+    sys.path.insert(0, str(PLUGIN_DIR.parent))
+    return importlib.import_module(f"{PLUGIN_DIR.name}.main")
+
+
+def flat_registry_class(registry_cls):
+    class FlatRegistry(registry_cls):
+        """旧的扁平字典：按对话取文件和判断目录引用都要遍历全部键"""
+
+        def conversation_files(self, session_id, conversation_id):
+            return {file_name: store_dir for (s, c, file_name), store_dir in self.items()
+                    if s == session_id and c == conversation_id}
+
+        def conversation_keys(self, session_id, conversation_id):
+            return [key for key, _ in self.items() if key[0] == session_id and key[1] == conversation_id]
+
+        def session_keys(self, session_id):
+            return [key for key, _ in self.items() if key[0] == session_id]
+
+        def dir_refs(self, store_dir):
+            return sum(1 for _, d in self.items() if d == store_dir)
+
+    return FlatRegistry
+
+
+class ConversationManager:
+    def __init__(self):
+        self.current = {}
+
+    async def get_curr_conversation_id(self, session_id):
+        return self.current.get(session_id)
+
+    async def new_conversation(self, session_id):
+        raise AssertionError("基准测试中的会话都已有对话")
+
+
+class Event:
+    def __init__(self, session_id):
+        self.unified_msg_origin = session_id
+
+
+class Request:
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.contexts = []
+
+
+def populate(plugin, registry, total_files: int, files_per_conversation: int) -> list:
+    """登记 total_files 个直接注入的小文件，返回各对话的 (会话ID, 对话ID)"""
+    now = time.time()
+    conversations = []
+    for i in range(total_files):
+        conversation = i // files_per_conversation
+        session_id = f"session_{conversation // 4}"
+        conversation_id = f"conversation_{conversation}"
+        key = (session_id, conversation_id, f"file_{i}.txt_{int(now)}")
+        registry[key] = plugin._data_dir / session_id / conversation_id / key[2]
+        registry.set_inline(key, f"文件 {i} 的内容。" * 20)
+        plugin.expiry.add(key, now)
+        if i % files_per_conversation == 0:
+            conversations.append((session_id, conversation_id))
+    return conversations
+
+
+async def measure(plugin, targets) -> float:
+    start = time.perf_counter()
+    for session_id, conversation_id in targets:
+        plugin.context.conversation_manager.current[session_id] = conversation_id
+        await plugin.on_request(Event(session_id), Request("这些文件讲了什么？"))
+    return (time.perf_counter() - start) / len(targets) * 1e6
+
+
+async def run(module, args):
+    plugin_cls = module.AstrbotPluginFileReaderPro
+    registry_cls = module.FileRegistry
+    flat_cls = flat_registry_class(registry_cls)
+    random.seed(0)
+
+    print(f"{'文件总数':>10} {'扁平登记表(μs/消息)':>22} {'嵌套索引(μs/消息)':>20}")
+    with tempfile.TemporaryDirectory(prefix="bench_file_registry_") as data_dir:
+        # 数据目录指向临时目录，避免写入真实的插件数据
+        plugin_cls._resolve_data_dir = lambda self: Path(data_dir)
+        context = type("Context", (), {"conversation_manager": ConversationManager()})()
+        # 文件不因时间或轮数过期，每次请求走同样的路径
+        plugin = plugin_cls(context, {"file_retention_time": 10 ** 9, "file_max_rounds": 10 ** 9})
+        try:
+            for total in TOTALS:
+                results = []
+                for cls in (flat_cls, registry_cls):
+                    plugin.vec_dbs = cls()
+                    conversations = populate(plugin, plugin.vec_dbs, total, args.files_per_conversation)
+                    targets = [random.choice(conversations) for _ in range(args.repeat)]
+                    if cls is flat_cls:
+                        # 扁平登记表在大规模下很慢，减少次数以控制运行时间
+                        targets = targets[:max(20, args.repeat * 1000 // total)]
+                    results.append(await measure(plugin, targets))
+                print(f"{total:>10} {results[0]:>22.1f} {results[1]:>20.1f}")
+        finally:
+            await plugin.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files-per-conversation", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=500, help="每种规模测量的消息数")
+    args = parser.parse_args()
+
+    module = load_plugin_module()
+    # 请求路径上的日志照常格式化，但不输出到终端
+    logging.disable(logging.INFO)
+    asyncio.run(run(module, args))
+
+
+if __name__ == "__main__":
+    main()
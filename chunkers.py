@@ -0,0 +1,244 @@
+"""按文件类型选择的结构化分块器
+
+默认的递归字符分块器按长度切分并在相邻块之间重叠，会把函数、Markdown 小节和幻灯片从中间切开。
+这里先按文件结构切出单元（源代码的顶层定义、Markdown 的标题小节、演示文稿的幻灯片），
+再把相邻单元装箱到 chunk_size 以内，块之间不重叠；只有单个单元超长时才交给默认分块器继续切分，
+切出的后续块前补上所属的定义首行或标题，保留上下文。
+
+本模块不依赖 AstrBot，默认分块器由调用方传入（需提供 async chunk(text, chunk_size=...) -> List[str]）。
+"""
+
+import re
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+# 相邻单元合并到同一块时的分隔
+_UNIT_SEPARATOR = "\n\n"
+
+# 演示文稿中每张幻灯片的标记行（与 file_parsers.read_pptx_to_text 的输出一致）
+SLIDE_MARKER = re.compile(r"^=== 幻灯片 \d+ ===$")
+
+_MD_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_MD_FENCE = re.compile(r"^\s*(```|~~~)")
+
+# 顶层代码块开头不应是的闭合语句
+_CODE_CLOSERS = ("}", ")", "]", "end", "fi", "done", "esac")
+
+CODE_EXTENSIONS = (
+    "py", "java", "cpp", "c", "h", "hpp", "cs", "js", "ts", "php", "rb", "go", "rs", "swift",
+    "kt", "scala", "sh", "bash", "ps1", "bat", "cmd", "vbs", "sql",
+)
+MARKDOWN_EXTENSIONS = ("md", "markdown")
+SLIDE_EXTENSIONS = ("pptx", "ppt", "odp")
+
+
+class Unit(NamedTuple):
+    """结构单元
+
+    parents 为上级标题，块从该单元开始时补在块首；
+    title 为单元首行，单元超长被切开时与 parents 一起补在后续块首。
+    """
+    text: str
+    title: str = ""
+    parents: str = ""
+
+
+def _join(*parts: str) -> str:
+    return "\n".join(part for part in parts if part)
+
+
+def _indent_of(line: str) -> int:
+    return len(line) - len(line.lstrip(" \t"))
+
+
+def _split_blocks(lines: List[str], indent: int) -> List[List[str]]:
+    """在空行之后、缩进为 indent 的非闭合语句处切分代码行"""
+    blocks: List[List[str]] = []
+    current: List[str] = []
+    after_blank = False
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            after_blank = True
+            current.append(line)
+            continue
+        if (after_blank and current and _indent_of(line) == indent
+                and not stripped.startswith(_CODE_CLOSERS)):
+            blocks.append(current)
+            current = []
+        after_blank = False
+        current.append(line)
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def split_code_units(text: str) -> List[Unit]:
+    """按顶层定义切分源代码
+
+    各语言的函数、类等顶层定义之间几乎总有空行，因此在空行后的无缩进语句处切分，
+    紧贴定义的注释和装饰器会留在同一个单元中。
+    """
+    units = []
+    for block in _split_blocks(text.splitlines(), 0):
+        block_text = "\n".join(block).strip("\n")
+        if block_text.strip():
+            units.append(Unit(block_text, block_text.lstrip("\n").split("\n", 1)[0]))
+    return units
+
+
+def split_code_members(unit: Unit) -> List[Unit]:
+    """把超长的顶层定义按下一级缩进（方法、成员）切分，后续部分补上定义首行"""
+    lines = unit.text.splitlines()
+    body = [line for line in lines[1:] if line.strip()]
+    if not body:
+        return [unit]
+    indent = min(_indent_of(line) for line in body)
+    blocks = _split_blocks(lines, indent)
+    if len(blocks) < 2:
+        return [unit]
+    members = [Unit("\n".join(blocks[0]).strip("\n"), unit.title, unit.parents)]
+    for block in blocks[1:]:
+        block_text = "\n".join(block).strip("\n")
+        if block_text.strip():
+            # 成员首行保留原缩进，补在后续块首时与块内代码的缩进一致
+            members.append(Unit(block_text, block_text.split("\n", 1)[0], _join(unit.parents, unit.title)))
+    return members
+
+
+def split_markdown_sections(text: str) -> List[Unit]:
+    """按标题切分 Markdown，每个小节记录上级标题（代码块中的 # 不视为标题）"""
+    units = []
+    headings: List[tuple] = []  # [(级别, 标题行)]
+    current: List[str] = []
+    current_parents = ""
+    current_title = ""
+    in_fence = False
+
+    def flush():
+        section = "\n".join(current).strip("\n")
+        if section.strip():
+            units.append(Unit(section, current_title, current_parents))
+
+    for line in text.splitlines():
+        if _MD_FENCE.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else _MD_HEADING.match(line)
+        if match:
+            flush()
+            level = len(match.group(1))
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            current_parents = "\n".join(heading for _, heading in headings)
+            current_title = line.strip()
+            headings.append((level, current_title))
+            current = [line]
+        else:
+            current.append(line)
+    flush()
+    return units
+
+
+def split_slides(text: str) -> List[Unit]:
+    """按幻灯片标记切分演示文稿文本"""
+    units = []
+    current: List[str] = []
+    title = ""
+
+    def flush():
+        slide = "\n".join(current).strip("\n")
+        if slide.strip():
+            units.append(Unit(slide, title))
+
+    for line in text.splitlines():
+        if SLIDE_MARKER.match(line.strip()):
+            flush()
+            title = line.strip()
+            current = [line]
+        else:
+            current.append(line)
+    flush()
+    return units
+
+
+class StructuredChunker:
+    """先切结构单元，再把相邻单元装箱到 chunk_size 以内（块之间不重叠）"""
+
+    def __init__(self, split_units: Callable[[str], List[Unit]], chunk_size: int, fallback,
+                 split_oversized: Optional[Callable[[Unit], List[Unit]]] = None):
+        self.split_units = split_units
+        self.chunk_size = chunk_size
+        self.fallback = fallback
+        self.split_oversized = split_oversized
+
+    async def _pieces(self, unit: Unit) -> List[Unit]:
+        """把超长单元切成不超过 chunk_size 的片段，后续片段的 parents 带上单元首行"""
+        if self.split_oversized is not None:
+            members = self.split_oversized(unit)
+            if len(members) > 1:
+                pieces = []
+                for member in members:
+                    if len(_join(member.parents, member.text)) <= self.chunk_size:
+                        pieces.append(member)
+                    else:
+                        pieces.extend(await self._fallback_pieces(member))
+                return pieces
+        return await self._fallback_pieces(unit)
+
+    async def _fallback_pieces(self, unit: Unit) -> List[Unit]:
+        context = _join(unit.parents, unit.title)
+        room = max(self.chunk_size // 2, self.chunk_size - len(context) - 1)
+        # 默认分块器直接按 room 切分，给补在块首的标题留出空间
+        texts = [text for text in await self.fallback.chunk(unit.text, chunk_size=room) if text.strip()]
+        pieces = [Unit(texts[0], unit.title, unit.parents)] if texts else []
+        pieces.extend(Unit(piece, "", context) for piece in texts[1:])
+        return pieces
+
+    async def chunk(self, text: str) -> List[str]:
+        units = self.split_units(text)
+        if not units:
+            return []
+
+        pieces: List[Unit] = []
+        for unit in units:
+            if len(_join(unit.parents, unit.text)) <= self.chunk_size:
+                pieces.append(unit)
+            else:
+                pieces.extend(await self._pieces(unit))
+
+        chunks = []
+        current = ""
+        for piece in pieces:
+            if current and len(current) + len(_UNIT_SEPARATOR) + len(piece.text) <= self.chunk_size:
+                current += _UNIT_SEPARATOR + piece.text
+                continue
+            if current:
+                chunks.append(current)
+            # 块从某个单元开始时补上上级标题
+            current = _join(piece.parents, piece.text)
+        if current:
+            chunks.append(current)
+        return chunks
+
+
+class ChunkerRegistry:
+    """文件类型 -> 分块器，未登记的类型使用默认分块器"""
+
+    def __init__(self, default):
+        self.default = default
+        self._chunkers: Dict[str, object] = {}
+
+    def register(self, file_exts: Iterable[str], chunker):
+        for file_ext in file_exts:
+            self._chunkers[file_ext] = chunker
+
+    def get(self, file_ext: str):
+        return self._chunkers.get(file_ext, self.default)
+
+
+def create_chunker_registry(default, chunk_size: int) -> ChunkerRegistry:
+    """登记源代码、Markdown 和演示文稿的结构化分块器，其余类型使用 default"""
+    registry = ChunkerRegistry(default)
+    registry.register(CODE_EXTENSIONS, StructuredChunker(split_code_units, chunk_size, default, split_code_members))
+    registry.register(MARKDOWN_EXTENSIONS, StructuredChunker(split_markdown_sections, chunk_size, default))
+    registry.register(SLIDE_EXTENSIONS, StructuredChunker(split_slides, chunk_size, default))
+    return registry
@@ -0,0 +1,119 @@
+"""检索结果的上下文打包
+
+相邻分块之间有 chunk_overlap 个字符的重叠，逐条拼接检索结果会把重叠部分注入两次，总长度也没有上限。
+这里按 (文件, chunk_index) 排序，把同一文件中编号连续的分块合并为一段并去掉重叠，
+再按各段中最靠前的检索名次依次装入 token 预算，超出预算的段舍弃；入选的段按文件内的原始顺序输出。
+直接注入全文的小文件同样计入预算，并优先于检索片段装入。
+
+本模块不依赖 AstrBot，检索结果由调用方转换为 (文本, 文件名, 元数据)。
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    from .tokens import estimate_tokens
+except ImportError:
+    from tokens import estimate_tokens
+
+# 认定为分块重叠的最短公共部分（更短的首尾相同视为巧合，不去除）
+MIN_OVERLAP = 8
+
+
+class Span(NamedTuple):
+    """同一文件中编号连续的分块合并成的一段"""
+    file_name: str
+    db_file: str
+    start: Optional[int]  # 第一个分块的 chunk_index，没有编号的分块为 None
+    end: Optional[int]
+    text: str
+    rank: int  # 段内分块的最高检索名次（0 为最相关）
+    chunks: int
+
+
+class PackStats(NamedTuple):
+    chunks: int  # 输入的分块数（去除重复后）
+    spans: int  # 合并后的段数
+    overlap_chars: int  # 去除的重叠字符数
+    tokens: int  # 入选段的估算 token 数
+    dropped: int  # 超出预算被舍弃的段数
+
+
+def strip_overlap(previous: str, text: str, max_overlap: int) -> Tuple[str, int]:
+    """去掉 text 开头与 previous 结尾重叠的部分，返回 (剩余文本, 去除的字符数)"""
+    previous = previous.rstrip()
+    limit = min(max_overlap, len(previous), len(text))
+    for size in range(limit, min(MIN_OVERLAP, max_overlap) - 1, -1):
+        if size > 0 and previous.endswith(text[:size]):
+            return text[size:], size
+    return text, 0
+
+
+def merge_spans(items: Sequence[Tuple[str, str, dict]], chunk_overlap: int) -> Tuple[List[Span], int, int]:
+    """把按检索名次排列的 (文本, 文件名, 元数据) 合并为段，返回 (段列表, 分块数, 去除的重叠字符数)"""
+    chunks: Dict[tuple, Tuple[int, str, str, str, Optional[int]]] = {}
+    for rank, (text, file_name, metadata) in enumerate(items):
+        db_file = metadata.get("db_file") or file_name
+        chunk_index = metadata.get("chunk_index")
+        if not isinstance(chunk_index, int):
+            chunk_index = None
+        # 同一分块被多次检索到（如混合检索）时只保留名次最高的一次
+        key = (file_name, db_file, chunk_index) if chunk_index is not None else (file_name, db_file, None, rank)
+        if key not in chunks:
+            chunks[key] = (rank, text, file_name, db_file, chunk_index)
+
+    ordered = sorted(chunks.values(), key=lambda chunk: (
+        chunk[2], chunk[3], chunk[4] is None, chunk[4] if chunk[4] is not None else chunk[0]
+    ))
+    spans: List[Span] = []
+    overlap_chars = 0
+    for rank, text, file_name, db_file, chunk_index in ordered:
+        last = spans[-1] if spans else None
+        if (last is not None and chunk_index is not None and last.end is not None
+                and (last.file_name, last.db_file) == (file_name, db_file) and chunk_index == last.end + 1):
+            rest, removed = strip_overlap(last.text, text, chunk_overlap)
+            overlap_chars += removed
+            merged = last.text.rstrip() + rest if removed else last.text + "\n" + rest
+            spans[-1] = last._replace(
+                end=chunk_index, text=merged, rank=min(last.rank, rank), chunks=last.chunks + 1
+            )
+        else:
+            spans.append(Span(file_name, db_file, chunk_index, chunk_index, text, rank, 1))
+    return spans, len(chunks), overlap_chars
+
+
+def select_inline(contents: Sequence[Tuple[str, str]],
+                  token_budget: int) -> Tuple[List[Tuple[str, str]], int, List[str]]:
+    """按顺序把直接注入的 (文件名, 全文) 装入 token 预算，返回 (入选的文件, 占用的 token 数, 舍弃的文件名)"""
+    selected = []
+    used = 0
+    dropped = []
+    for file_name, text in contents:
+        tokens = estimate_tokens(text)
+        if token_budget > 0 and used + tokens > token_budget:
+            dropped.append(file_name)
+            continue
+        selected.append((file_name, text))
+        used += tokens
+    return selected, used, dropped
+
+
+def pack_context(items: Sequence[Tuple[str, str, dict]], chunk_overlap: int,
+                 token_budget: int, reserved_tokens: int = 0) -> Tuple[List[Span], PackStats]:
+    """合并分块并按检索名次装入 token 预算，返回按文件内顺序排列的段
+
+    token_budget 为 0 表示不限制；reserved_tokens 为预算中已被占用的部分（如直接注入的小文件）。
+    """
+    spans, chunk_count, overlap_chars = merge_spans(items, chunk_overlap)
+    selected = []
+    used = 0
+    dropped = 0
+    for span in sorted(spans, key=lambda span: span.rank):
+        tokens = estimate_tokens(span.text)
+        if token_budget > 0 and reserved_tokens + used + tokens > token_budget:
+            dropped += 1
+            continue
+        selected.append(span)
+        used += tokens
+    order = {id(span): position for position, span in enumerate(spans)}
+    selected.sort(key=lambda span: order[id(span)])
+    return selected, PackStats(chunk_count, len(spans), overlap_chars, used, dropped)
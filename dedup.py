@@ -0,0 +1,119 @@
+"""分块去重
+
+PDF 每页重复的页眉、页脚、免责声明，以及表格导出中的样板行会产生大量内容相同或几乎相同的分块，
+既浪费嵌入调用，又会在检索时挤占 top-k。这里在分块送去嵌入之前去重：
+- 完全重复：按规范化文本（小写、合并空白）的哈希判断
+- 近似重复（阈值小于 1 时）：字符 n-gram 的 MinHash 签名，用 LSH 分桶找出候选，估算的 Jaccard 相似度达到阈值即视为重复
+
+近似重复只用于不超过 NEAR_DUPLICATE_MAX_CHARS 的短分块（页眉页脚、免责声明一类的样板文字），且其中的数字必须完全一致：
+正文中只差一个数字的条款（如“30天”与“60天”）相似度很高，但含义不同，不能去除。
+
+去重范围为单个文件；被去除的分块只记录元数据（重复于哪个分块及相似度），不做嵌入。
+"""
+
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+_DIGITS = re.compile(r"\d+")
+# 参与近似去重的分块最大长度（规范化后的字符数），更长的分块只去除完全重复
+NEAR_DUPLICATE_MAX_CHARS = 300
+# MinHash 使用的模数（梅森素数 2^31 - 1），保证乘法不超出 uint64
+_MERSENNE_PRIME = (1 << 31) - 1
+_SHINGLE_BASE = 1000003
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def _choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """选择 LSH 的 (分段数, 每段行数)，使候选阈值略低于相似度阈值，减少漏判"""
+    target = max(0.3, threshold - 0.1)
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= target:
+            best = (bands, rows)
+    return best
+
+
+class ChunkDeduplicator:
+    """单个文件的分块去重器，按分块产生的顺序调用 check，保留每组重复中最先出现的分块"""
+
+    def __init__(self, threshold: float = 0.98, num_perm: int = 64, shingle_size: int = 5, seed: int = 1,
+                 near_max_chars: int = NEAR_DUPLICATE_MAX_CHARS):
+        self.threshold = threshold
+        self.near_max_chars = near_max_chars
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=(num_perm, 1)).astype(np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=(num_perm, 1)).astype(np.uint64)
+        self._exact: Dict[bytes, int] = {}
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._signatures: List[np.ndarray] = []
+        self._numbers: List[List[str]] = []
+        self._chunk_indexes: List[int] = []
+        self.suppressed = 0
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        width = min(self.shingle_size, len(codes))
+        count = len(codes) - width + 1
+        hashes = np.zeros(count, dtype=np.uint64)
+        for offset in range(width):
+            hashes = (hashes * np.uint64(_SHINGLE_BASE) + codes[offset:offset + count]) & np.uint64(0xFFFFFFFF)
+        return np.unique(hashes) & np.uint64(_MERSENNE_PRIME)
+
+    def _signature(self, text: str) -> np.ndarray:
+        hashes = self._shingle_hashes(text)
+        permuted = (self._a * hashes[np.newaxis, :] + self._b) % np.uint64(_MERSENNE_PRIME)
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def check(self, chunk_index: int, text: str) -> Optional[Tuple[int, float]]:
+        """判断分块是否与之前保留的分块重复
+
+        重复时返回 (保留分块的 chunk_index, 估算相似度)，否则登记该分块并返回 None。
+        """
+        normalized = _normalize(text)
+        digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+        if digest in self._exact:
+            self.suppressed += 1
+            return self._exact[digest], 1.0
+        self._exact[digest] = chunk_index
+        if not normalized or self.threshold >= 1 or len(normalized) > self.near_max_chars:
+            return None
+
+        signature = self._signature(normalized)
+        keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+        candidates = set()
+        for band, key in enumerate(keys):
+            candidates.update(self._buckets[band].get(key, ()))
+        numbers = _DIGITS.findall(normalized)
+        best: Optional[Tuple[int, float]] = None
+        for candidate in candidates:
+            if self._numbers[candidate] != numbers:
+                continue
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (self._chunk_indexes[candidate], similarity)
+        if best is not None:
+            # 与该分块完全相同的后续分块也归到保留的分块下
+            self._exact[digest] = best[0]
+            self.suppressed += 1
+            return best
+
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        self._chunk_indexes.append(chunk_index)
+        self._numbers.append(numbers)
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, []).append(position)
+        return None
@@ -0,0 +1,286 @@
+"""嵌入向量缓存
+
+以 (嵌入提供者ID, 分块文本SHA-256) 为键持久化保存嵌入向量，
+同一份文件在不同群聊、不同对话中重复上传时无需再次请求嵌入服务。
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+def text_hash(text: str) -> str:
+    """计算分块文本的SHA-256摘要"""
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+def provider_cache_id(provider) -> str:
+    """获取嵌入提供者的稳定标识（提供者ID + 模型名）"""
+    provider_config = getattr(provider, "provider_config", None) or {}
+    provider_id = provider_config.get("id") or provider.__class__.__name__
+    model = provider_config.get("embedding_model") or provider_config.get("model")
+    return f"{provider_id}:{model}" if model else str(provider_id)
+
+
+class EmbeddingCache:
+    """基于SQLite的嵌入向量缓存，按总字节数做LRU淘汰"""
+
+    def __init__(self, db_path: Path, max_bytes: int):
+        self.db_path = Path(db_path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                provider_id TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (provider_id, text_hash)
+            )
+        ''')
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_access ON embedding_cache (last_access)"
+        )
+        self._conn.commit()
+        row = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache").fetchone()
+        self._entries, self._total_bytes = row[0], row[1]
+
+    def _get_many_sync(self, provider_id: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            # SQLite 单条语句的参数数量有限，分批查询
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embedding_cache WHERE provider_id=? AND text_hash IN ({placeholders})",
+                    (provider_id, *part)
+                ).fetchall()
+                for h, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[h] = vector.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embedding_cache SET last_access=? WHERE provider_id=? AND text_hash=?",
+                    [(now, provider_id, h) for h in found]
+                )
+                self._conn.commit()
+        return found
+
+    def _put_many_sync(self, provider_id: str, items: Dict[str, List[float]]):
+        now = time.time()
+        rows = []
+        for h, vector in items.items():
+            blob = array("f", vector).tobytes()
+            rows.append((provider_id, h, len(vector), blob, now))
+        with self._lock:
+            for _, h, _, blob, _ in rows:
+                old = self._conn.execute(
+                    "SELECT LENGTH(vector) FROM embedding_cache WHERE provider_id=? AND text_hash=?",
+                    (provider_id, h)
+                ).fetchone()
+                if old:
+                    self._entries -= 1
+                    self._total_bytes -= old[0]
+                self._entries += 1
+                self._total_bytes += len(blob)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (provider_id, text_hash, dim, vector, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        """淘汰最久未访问的条目，直到总大小不超过上限"""
+        while self._total_bytes > self.max_bytes and self._entries > 0:
+            rows = self._conn.execute(
+                "SELECT rowid, LENGTH(vector) FROM embedding_cache ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            to_delete = []
+            for rowid, size in rows:
+                to_delete.append((rowid,))
+                self._entries -= 1
+                self._total_bytes -= size
+                self.evictions += 1
+                if self._total_bytes <= self.max_bytes:
+                    break
+            self._conn.executemany("DELETE FROM embedding_cache WHERE rowid=?", to_delete)
+
+    async def get_many(self, provider_id: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """批量查询缓存，返回命中的 {文本摘要: 向量}"""
+        if not hashes:
+            return {}
+        return await asyncio.to_thread(self._get_many_sync, provider_id, hashes)
+
+    async def put_many(self, provider_id: str, items: Dict[str, List[float]]):
+        """批量写入缓存"""
+        if items:
+            await asyncio.to_thread(self._put_many_sync, provider_id, items)
+
+    def stats(self) -> dict:
+        """返回缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": self._entries,
+            "size_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+
+
+class CachedEmbeddingProvider:
+    """嵌入提供者包装器：批量嵌入时先查缓存，仅对未命中的分块调用真实提供者
+
+    单条查询的 get_embedding 不经过此缓存，直接透传给原提供者。
+    """
+
+    def __init__(self, provider, cache: EmbeddingCache):
+        self._provider = provider
+        self._cache = cache
+        self.cache_id = provider_cache_id(provider)
+
+    def __getattr__(self, name):
+        return getattr(self._provider, name)
+
+    @property
+    def inner(self):
+        """被包装的原始嵌入提供者"""
+        return self._provider
+
+    def get_dim(self) -> int:
+        return self._provider.get_dim()
+
+    async def get_embedding(self, text: str) -> List[float]:
+        return await self._provider.get_embedding(text)
+
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._embed_with_cache(texts, self._provider.get_embeddings)
+
+    async def get_embeddings_batch(self, texts: List[str], **kwargs) -> List[List[float]]:
+        async def fetch(missing: List[str]) -> List[List[float]]:
+            return await self._provider.get_embeddings_batch(missing, **kwargs)
+        return await self._embed_with_cache(texts, fetch)
+
+    async def _embed_with_cache(
+        self,
+        texts: List[str],
+        fetch: Callable[[List[str]], Awaitable[List[List[float]]]],
+    ) -> List[List[float]]:
+        hashes = [text_hash(t) for t in texts]
+        cached = await self._cache.get_many(self.cache_id, list(set(hashes)))
+        dim: Optional[int] = None
+        try:
+            dim = self._provider.get_dim()
+        except Exception:
+            pass
+        if dim:
+            # 维度不一致的旧向量视为未命中（如同一ID下更换了模型）
+            cached = {h: v for h, v in cached.items() if len(v) == dim}
+
+        # 同一批次内的重复文本只请求一次
+        missing_texts: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing_texts:
+                missing_texts[h] = t
+
+        miss_count = sum(1 for h in hashes if h not in cached)
+        self._cache.hits += len(hashes) - miss_count
+        self._cache.misses += miss_count
+
+        if missing_texts:
+            missing_hashes = list(missing_texts.keys())
+            vectors = await fetch([missing_texts[h] for h in missing_hashes])
+            fresh = {h: list(v) for h, v in zip(missing_hashes, vectors)}
+            await self._cache.put_many(self.cache_id, fresh)
+            cached.update(fresh)
+
+        return [cached[h] for h in hashes]
+
+
+class QueryEmbeddingCache:
+    """按对话隔离的查询向量缓存（TTL + LRU）
+
+    重新生成回复或重复提问时，直接复用上次的查询向量，不再请求嵌入服务。
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_conversations: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_conversations = max_conversations
+        self.hits = 0
+        self.misses = 0
+        self._conversations: "OrderedDict[tuple, OrderedDict[str, tuple]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, session_id: str, conversation_id: str, query: str) -> Optional[List[float]]:
+        if not self.enabled:
+            return None
+        key = (session_id, conversation_id)
+        query = query.strip()
+        entries = self._conversations.get(key)
+        item = entries.get(query) if entries else None
+        if item is not None and time.time() - item[0] > self.ttl:
+            del entries[query]
+            item = None
+        if item is None:
+            self.misses += 1
+            return None
+        entries.move_to_end(query)
+        self._conversations.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, session_id: str, conversation_id: str, query: str, vector: List[float]):
+        if not self.enabled:
+            return
+        key = (session_id, conversation_id)
+        entries = self._conversations.get(key)
+        if entries is None:
+            entries = self._conversations[key] = OrderedDict()
+        self._conversations.move_to_end(key)
+        query = query.strip()
+        entries[query] = (time.time(), vector)
+        entries.move_to_end(query)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+
+    def drop(self, session_id: str, conversation_id: Optional[str] = None):
+        """丢弃指定对话（或整个会话）的查询缓存"""
+        if conversation_id is not None:
+            self._conversations.pop((session_id, conversation_id), None)
+            return
+        for key in [k for k in self._conversations if k[0] == session_id]:
+            del self._conversations[key]
@@ -0,0 +1,81 @@
+"""文件过期调度
+
+用最小堆保存每个文件的过期时间，使用轮数从文件使用次数存储的内存镜像读取：
+请求路径上的过期判断为 O(1)，定期清理只处理已到期的文件。
+"""
+
+import asyncio
+import heapq
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class ExpiryScheduler:
+    """基于过期时间最小堆的文件过期调度器"""
+
+    def __init__(self, retention_seconds: float, max_rounds: int, rounds_of: Callable[[Hashable], int]):
+        self.retention_seconds = retention_seconds
+        self.max_rounds = max_rounds
+        self._rounds_of = rounds_of
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._deadlines: Dict[Hashable, float] = {}
+        self._counter = 0  # 堆中过期时间相同时保持插入顺序，避免比较键
+        self._wakeup = asyncio.Event()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._deadlines
+
+    def add(self, key: Hashable, upload_time: float):
+        """登记文件，过期时间为上传时间加保留时长"""
+        deadline = upload_time + self.retention_seconds
+        earliest = self.next_deadline()
+        self._deadlines[key] = deadline
+        self._counter += 1
+        heapq.heappush(self._heap, (deadline, self._counter, key))
+        # 新文件比当前最早的过期时间还早时，唤醒等待中的清理任务重新计算等待时间
+        if earliest is None or deadline < earliest:
+            self._wakeup.set()
+
+    def remove(self, key: Hashable):
+        """移除文件（堆中的旧条目在弹出时惰性丢弃）"""
+        self._deadlines.pop(key, None)
+
+    def is_expired(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """检查文件是否过期（时间或轮数），未登记的文件视为已过期"""
+        deadline = self._deadlines.get(key)
+        if deadline is None:
+            return True
+        if (now or time.time()) > deadline:
+            return True
+        return self._rounds_of(key) >= self.max_rounds
+
+    def next_deadline(self) -> Optional[float]:
+        """返回最早的有效过期时间"""
+        while self._heap:
+            deadline, _, key = self._heap[0]
+            if self._deadlines.get(key) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_expired(self, now: Optional[float] = None) -> List[Hashable]:
+        """弹出所有已到过期时间的文件"""
+        now = now or time.time()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:
+                expired.append(key)
+        return expired
+
+    async def wait(self, max_wait: float):
+        """等待到下一个文件过期（最长 max_wait 秒），有更早过期的新文件登记时提前返回"""
+        self._wakeup.clear()
+        delay = max_wait
+        deadline = self.next_deadline()
+        if deadline is not None:
+            delay = min(delay, max(0.0, deadline - time.time()))
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,540 @@
+"""文件解析函数
+
+本模块不依赖 AstrBot，可被解析进程池的子进程直接导入。
+pandas、pdfminer、python-docx 等解析库在对应格式的读取函数首次调用时才导入，
+加载插件时不产生这些库的导入耗时和内存占用。
+"""
+
+import codecs
+import json
+import mmap
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from .file_types import detect_file_type
+except ImportError:  # 作为顶层模块导入（如 benchmarks 脚本）
+    from file_types import detect_file_type
+
+# 使用字典存储支持的文件类型和对应的处理函数
+SUPPORTED_EXTENSIONS: Dict[str, str] = {
+    # 文档格式
+    "pdf": "read_pdf_to_text",
+    "docx": "read_docx_to_text",
+    "doc": "read_docx_to_text",
+    "rtf": "read_txt_to_text",
+    "odt": "read_txt_to_text",
+
+    # 电子表格
+    "xlsx": "read_excel_to_text",
+    "xls": "read_excel_to_text",
+    "ods": "read_excel_to_text",
+    "csv": "read_csv_to_text",
+
+    # 演示文稿
+    "pptx": "read_pptx_to_text",
+    "ppt": "read_pptx_to_text",
+    "odp": "read_pptx_to_text",
+
+    # 编程语言源代码
+    "py": "read_txt_to_text",
+    "java": "read_txt_to_text",
+    "cpp": "read_txt_to_text",
+    "c": "read_txt_to_text",
+    "h": "read_txt_to_text",
+    "hpp": "read_txt_to_text",
+    "cs": "read_txt_to_text",
+    "js": "read_txt_to_text",
+    "ts": "read_txt_to_text",
+    "php": "read_txt_to_text",
+    "rb": "read_txt_to_text",
+    "go": "read_txt_to_text",
+    "rs": "read_txt_to_text",
+    "swift": "read_txt_to_text",
+    "kt": "read_txt_to_text",
+    "scala": "read_txt_to_text",
+    "sh": "read_txt_to_text",
+    "bash": "read_txt_to_text",
+    "ps1": "read_txt_to_text",
+    "bat": "read_txt_to_text",
+    "cmd": "read_txt_to_text",
+    "vbs": "read_txt_to_text",
+
+    # 标记语言
+    "html": "read_txt_to_text",
+    "htm": "read_txt_to_text",
+    "xml": "read_txt_to_text",
+    "json": "read_txt_to_text",
+    "yaml": "read_txt_to_text",
+    "yml": "read_txt_to_text",
+    "md": "read_txt_to_text",
+    "markdown": "read_txt_to_text",
+
+    # 配置文件
+    "ini": "read_txt_to_text",
+    "cfg": "read_txt_to_text",
+    "conf": "read_txt_to_text",
+    "properties": "read_txt_to_text",
+    "env": "read_txt_to_text",
+
+    # 数据库/查询
+    "sql": "read_txt_to_text",
+
+    # 其他文本格式
+    "txt": "read_txt_to_text",
+    "log": "read_txt_to_text",
+    "": "read_txt_to_text",  # 无扩展名文件
+
+    # 构建/项目文件
+    "toml": "read_txt_to_text",
+    "lock": "read_txt_to_text",
+    "gitignore": "read_txt_to_text",
+
+    # 网络相关
+    "url": "read_txt_to_text",
+    "webloc": "read_txt_to_text",
+}
+
+def get_file_type(file_path: str) -> Optional[str]:
+    """获取文件类型（文件头签名优先，后备扩展名），无法识别时返回空字符串"""
+    
+    # 首先检查文件是否存在
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError
+    
+    return detect_file_type(file_path)
+
+
+def complete_filename(file_path: str, file_type: Optional[str] = None) -> str:
+    """补全文件名（如果缺少扩展名则自动添加）
+
+    file_type 为已检测出的文件类型，传入时不再重复检测。
+    """
+    if not os.path.isfile(file_path):
+        return file_path
+    
+    # 如果已经有扩展名，直接返回
+    if os.path.splitext(file_path)[1]:
+        return file_path
+    
+    # 获取文件类型并补全扩展名
+    if file_type is None:
+        file_type = get_file_type(file_path)
+    if file_type:
+        return f"{file_path}.{file_type}"
+    
+    return file_path  # 无法确定类型，返回原文件名
+
+
+# 流式读取表格时每次从CSV读取的行数
+CSV_READ_ROWS = 2000
+
+# 可按行流式读取的表格格式
+TABLE_EXTENSIONS = ("csv", "xlsx", "xls", "ods")
+
+
+def _format_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return ""
+        if value.is_integer():
+            return str(int(value))
+    return str(value).replace("\r", " ").replace("\n", " ").strip()
+
+
+def _format_row(values: Iterable) -> str:
+    """紧凑地渲染一行，单元格之间用 | 分隔（不做列宽对齐）"""
+    return " | ".join(_format_cell(value) for value in values)
+
+
+def iter_table_row_groups(header: Sequence, rows: Iterable[Sequence], max_chars: int,
+                          title: str = "") -> Iterator[Tuple[str, int, int]]:
+    """把表格行按字符数打包成行组，返回 (文本, 起始行号, 结束行号)，行号从1开始（不含表头）
+
+    每个行组都重复表头，单独检索到任意一组时也能知道各列含义；
+    单行超过 max_chars 时独占一组。
+    """
+    prefix = (f"=== {title} ===\n" if title else "") + _format_row(header)
+    lines: List[str] = []
+    size = len(prefix)
+    first_row = 1
+    row_no = 0
+    for row_no, row in enumerate(rows, 1):
+        line = _format_row(row)
+        if not line.replace("|", "").strip():
+            continue
+        if lines and size + len(line) + 1 > max_chars:
+            yield prefix + "\n" + "\n".join(lines), first_row, row_no - 1
+            lines = []
+            size = len(prefix)
+            first_row = row_no
+        lines.append(line)
+        size += len(line) + 1
+    if lines:
+        yield prefix + "\n" + "\n".join(lines), first_row, row_no
+
+
+def _iter_csv_tables(file_path: str) -> Iterator[Tuple[str, list, Iterator[tuple]]]:
+    """按块读取CSV，返回 [(表名, 表头, 行迭代器)]，内存占用与行数无关"""
+    import pandas as pd
+    reader = pd.read_csv(file_path, chunksize=CSV_READ_ROWS, dtype=str, keep_default_na=False)
+    first = next(reader, None)
+    if first is None:
+        return
+
+    def rows():
+        yield from first.itertuples(index=False, name=None)
+        for frame in reader:
+            yield from frame.itertuples(index=False, name=None)
+
+    yield "", list(first.columns), rows()
+
+
+def _iter_excel_tables(file_path: str, file_ext: str) -> Iterator[Tuple[str, list, Iterator[tuple]]]:
+    """逐个工作表读取Excel，xlsx 使用 openpyxl 只读模式按行读取"""
+    if file_ext == "xlsx":
+        import openpyxl
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                rows = sheet.iter_rows(values_only=True)
+                # 第一个非空行作为表头
+                header = next((row for row in rows if any(cell is not None for cell in row)), None)
+                if header is not None:
+                    yield sheet.title, list(header), rows
+        finally:
+            workbook.close()
+        return
+
+    # xls/ods 没有只读流式接口，逐个工作表读取，同一时间只保留一个工作表
+    import pandas as pd
+    excel_file = pd.ExcelFile(file_path)
+    for sheet_name in excel_file.sheet_names:
+        df = excel_file.parse(sheet_name, dtype=str, keep_default_na=False)
+        yield str(sheet_name), list(df.columns), df.itertuples(index=False, name=None)
+
+
+def iter_table_chunks(file_path: str, file_ext: str, max_chars: int) -> Iterator[dict]:
+    """流式读取CSV或Excel，逐个返回带表头的紧凑行组 {"text", "sheet", "row_start", "row_end"}"""
+    tables = _iter_csv_tables(file_path) if file_ext == "csv" else _iter_excel_tables(file_path, file_ext)
+    for sheet, header, rows in tables:
+        for text, row_start, row_end in iter_table_row_groups(header, rows, max_chars, sheet):
+            yield {"text": text, "sheet": sheet, "row_start": row_start, "row_end": row_end}
+
+
+def spool_table_chunks(file_path: str, file_ext: str, max_chars: int, spool_path: str) -> int:
+    """在解析进程中把表格行组逐行写入JSONL临时文件，返回行组数
+
+    主进程再按行读取临时文件并分批嵌入，两边的内存占用都与表格行数无关。
+    """
+    try:
+        count = 0
+        with open(spool_path, "w", encoding="utf-8") as spool:
+            for chunk in iter_table_chunks(file_path, file_ext, max_chars):
+                spool.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+                count += 1
+        return count
+    except Exception as e:
+        raise RuntimeError(f"读取表格文件失败: {str(e)}")
+
+
+def read_csv_to_text(file_path: str) -> str:
+    """读取CSV文件并返回紧凑的文本（每行单元格用 | 分隔）"""
+    try:
+        lines = []
+        for _, header, rows in _iter_csv_tables(file_path):
+            lines.append(_format_row(header))
+            lines.extend(line for line in map(_format_row, rows) if line.replace("|", "").strip())
+        return "\n".join(lines)
+    except Exception as e:
+        raise RuntimeError(f"读取CSV文件失败: {str(e)}")
+
+
+def read_pdf_to_text(file_path: str) -> str:
+    """使用pdfminer.six提取PDF文本（效果更好）"""
+    try:
+        from pdfminer.high_level import extract_text
+        return extract_text(file_path)
+    except Exception as e:
+        raise RuntimeError(f"读取PDF文件失败: {str(e)}")
+
+
+def spool_pdf_pages(file_path: str, flush_pages: int, spool_path: str) -> int:
+    """在解析进程中逐页提取PDF文本并写入JSONL临时文件，每行 {"page": 页码, "text": 文本}，返回页数
+
+    整个文件只打开、解析一次（页面树和交叉引用表只读一遍），同一时间只保留一页的版面分析结果；
+    每写入 flush_pages 页刷新一次，主进程可以边读边嵌入。
+    """
+    try:
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+        flush_pages = max(1, flush_pages)
+        page_count = 0
+        with open(spool_path, "w", encoding="utf-8") as spool:
+            for page_count, layout in enumerate(extract_pages(file_path), 1):
+                text = "".join(element.get_text() for element in layout if isinstance(element, LTTextContainer))
+                spool.write(json.dumps({"page": page_count, "text": text}, ensure_ascii=False) + "\n")
+                if page_count % flush_pages == 0:
+                    spool.flush()
+        return page_count
+    except Exception as e:
+        raise RuntimeError(f"读取PDF文件失败: {str(e)}")
+
+
+def convert_doc_to_docx(doc_file: str, docx_file: str) -> None:
+    """将doc文档转为docx文档"""
+    try:
+        from docx import Document
+        doc = Document(doc_file)
+        doc.save(docx_file)
+    except Exception as e:
+        raise RuntimeError(f"转换DOC到DOCX失败: {str(e)}")
+
+
+def read_docx_to_text(file_path: str) -> str:
+    """读取DOCX或DOC文件内容并返回文本"""
+    try:
+        import docx2txt
+
+        # 统一处理路径
+        file_path = os.path.abspath(file_path)
+
+        if file_path.lower().endswith(".doc"):
+            # 处理DOC文件
+            file_dir, file_name = os.path.split(file_path)
+            file_base = os.path.splitext(file_name)[0]
+            docx_file = os.path.join(file_dir, f"{file_base}.docx")
+
+            # 转换DOC到DOCX
+            convert_doc_to_docx(file_path, docx_file)
+
+            # 处理转换后的文件
+            text = docx2txt.process(docx_file)
+
+            # 删除临时转换的文件
+            try:
+                os.remove(docx_file)
+            except:
+                pass
+        else:
+            # 直接处理DOCX文件
+            text = docx2txt.process(file_path)
+
+        return text
+    except Exception as e:
+        raise RuntimeError(f"读取Word文件失败: {str(e)}")
+
+
+def read_excel_to_text(file_path: str, file_ext: Optional[str] = None) -> str:
+    """读取Excel文件内容并返回紧凑的文本（每行单元格用 | 分隔）"""
+    try:
+        file_ext = file_ext or os.path.splitext(file_path)[1][1:].lower() or "xlsx"
+        text_list = []
+
+        for sheet_name, header, rows in _iter_excel_tables(file_path, file_ext):
+            lines = [f"=== {sheet_name} ===", _format_row(header)]
+            lines.extend(line for line in map(_format_row, rows) if line.replace("|", "").strip())
+            text_list.append("\n".join(lines))
+
+        return "\n\n".join(text_list)
+    except Exception as e:
+        raise RuntimeError(f"读取Excel文件失败: {str(e)}")
+
+
+def read_pptx_to_text(file_path: str) -> str:
+    """读取PPTX文件内容并返回文本"""
+    try:
+        from pptx import Presentation
+        prs = Presentation(file_path)
+        text_list = []
+
+        for slide_no, slide in enumerate(prs.slides, 1):
+            slide_text = []
+            for shape in slide.shapes:
+                if hasattr(shape, "text_frame") and shape.has_text_frame:
+                    text_frame = shape.text_frame
+                    if text_frame.text.strip():
+                        slide_text.append(text_frame.text.strip())
+
+            if slide_text:  # 只添加有内容的幻灯片，每张幻灯片以标记行开头，分块时按幻灯片切分
+                text_list.append("\n".join([f"=== 幻灯片 {slide_no} ==="] + slide_text))
+
+        return "\n\n".join(text_list)
+    except Exception as e:
+        raise RuntimeError(f"读取PPTX文件失败: {str(e)}")
+
+
+# 编码检测时每个采样位置读取的字节数
+ENCODING_SAMPLE_BYTES = 64 * 1024
+# 增量解码时每次从内存映射中读取的字节数
+DECODE_BLOCK_BYTES = 1024 * 1024
+# 流式处理文本时每个分段的最大字符数
+TEXT_SEGMENT_CHARS = 256 * 1024
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def _is_utf8_sample(sample: bytes, at_start: bool, at_end: bool) -> bool:
+    """判断采样是否为合法UTF-8（采样边界可能截断多字节字符，允许两端各有一个不完整字符）"""
+    if not at_start:
+        # 跳过开头的续字节（10xxxxxx）
+        start = 0
+        while start < min(3, len(sample)) and 0x80 <= sample[start] < 0xC0:
+            start += 1
+        sample = sample[start:]
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=at_end)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detect_encoding(file_path: str, sample_bytes: int = ENCODING_SAMPLE_BYTES) -> str:
+    """根据有限的采样检测文本编码
+
+    先检查BOM；否则取文件开头、中间、结尾三段采样，都是合法UTF-8时直接判定为UTF-8，
+    不是时只对采样调用 chardet，检测耗时与文件大小无关。
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return "utf-8"
+    with open(file_path, "rb") as f:
+        head = f.read(max(sample_bytes, 4))
+        for bom, encoding in _BOMS:
+            if head.startswith(bom):
+                return encoding
+        if size <= sample_bytes * 3:
+            f.seek(0)
+            samples = [(f.read(), True, True)]
+        else:
+            samples = [(head[:sample_bytes], True, False)]
+            for offset, at_end in (((size - sample_bytes) // 2, False), (size - sample_bytes, True)):
+                f.seek(offset)
+                samples.append((f.read(sample_bytes), False, at_end))
+
+    if all(_is_utf8_sample(sample, at_start, at_end) for sample, at_start, at_end in samples):
+        return "utf-8"
+    import chardet
+    detected = chardet.detect(b"".join(sample for sample, _, _ in samples))
+    encoding = detected.get("encoding") or "utf-8"
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        encoding = "utf-8"
+    return encoding
+
+
+def iter_decoded_blocks(file_path: str, encoding: str, block_bytes: int = DECODE_BLOCK_BYTES) -> Iterator[str]:
+    """通过内存映射增量解码文本文件，逐块返回字符串，不需要把整个文件读入内存"""
+    if os.path.getsize(file_path) == 0:
+        return
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for offset in range(0, len(mapped), block_bytes):
+            text = decoder.decode(mapped[offset:offset + block_bytes])
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+
+def iter_text_segments(file_path: str, max_chars: int = TEXT_SEGMENT_CHARS) -> Iterator[str]:
+    """流式读取文本文件，按不超过 max_chars 的分段返回，尽量在换行处切分"""
+    encoding = detect_encoding(file_path)
+    buffer = ""
+    for block in iter_decoded_blocks(file_path, encoding):
+        buffer += block
+        while len(buffer) >= max_chars:
+            cut = buffer.rfind("\n", max_chars // 2, max_chars)
+            cut = cut + 1 if cut != -1 else max_chars
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+    if buffer:
+        yield buffer
+
+
+def spool_text_segments(file_path: str, max_chars: int, spool_path: str) -> int:
+    """在解析进程中把文本分段逐行写入JSONL临时文件，返回分段数"""
+    try:
+        count = 0
+        with open(spool_path, "w", encoding="utf-8") as spool:
+            for segment in iter_text_segments(file_path, max_chars):
+                spool.write(json.dumps({"text": segment}, ensure_ascii=False) + "\n")
+                count += 1
+        return count
+    except Exception as e:
+        raise RuntimeError(f"读取文本文件失败: {str(e)}")
+
+
+def read_txt_to_text(file_path: str) -> str:
+    """读取文本文件，根据采样自动检测编码"""
+    try:
+        encoding = detect_encoding(file_path)
+        return "".join(iter_decoded_blocks(file_path, encoding))
+    except Exception as e:
+        raise RuntimeError(f"读取文本文件失败: {str(e)}")
+
+
+def read_any_file_to_text(file_path: str, file_ext: Optional[str] = None) -> str:
+    """
+    根据文件类型自动选择适当的读取函数
+    file_ext 为上传时已检测出的文件类型，传入时不再重复检测
+    返回文件内容文本或错误信息
+    """
+    try:
+        # 修复路径编码问题
+        if isinstance(file_path, bytes):
+            try:
+                file_path = file_path.decode('utf-8')
+            except UnicodeDecodeError:
+                file_path = file_path.decode('latin1')
+        
+        # 标准化路径（处理反斜杠和特殊字符）
+        file_path = os.path.abspath(os.path.normpath(file_path))
+        
+        # 检查文件是否存在
+        if not os.path.exists(file_path):
+            return f"文件不存在: {file_path}"
+            
+        # 获取文件扩展名（小写，不带点）
+        if file_ext is None:
+            file_ext = get_file_type(file_path)
+        if not file_ext:
+            file_ext = os.path.splitext(file_path)[1][1:].lower()
+        if not file_ext:
+            file_ext = "txt"  # 默认文本类型
+
+        # 后续处理逻辑保持不变...
+        func_name = SUPPORTED_EXTENSIONS.get(file_ext)
+        if not func_name:
+            return f"不支持 {file_ext} 格式"
+            
+        # 使用函数映射
+        func_map = {
+            "read_pdf_to_text": read_pdf_to_text,
+            "read_docx_to_text": read_docx_to_text,
+            "read_excel_to_text": read_excel_to_text,
+            "read_pptx_to_text": read_pptx_to_text,
+            "read_txt_to_text": read_txt_to_text,
+            "read_csv_to_text": read_csv_to_text,
+        }
+        
+        func = func_map.get(func_name)
+        if func is None:
+            return f"找不到处理 {file_ext} 文件的函数"
+            
+        if func is read_excel_to_text:
+            return func(file_path, file_ext)
+        return func(file_path)
+        
+    except Exception as e:
+        return f"读取文件时出错: {str(e)}"
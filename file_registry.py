@@ -0,0 +1,127 @@
+"""文件登记表
+
+按 会话 -> 对话 -> 文件 三级索引登记已存储的文件及其向量数据库目录，
+取某个对话的文件只需两次字典查找，与机器人存储的文件总数无关。
+同时维护每个向量数据库目录被多少个文件引用，共享存储布局下据此判断目录能否关闭。
+直接注入的小文件没有向量数据库，登记表中额外保存它们的全文。
+"""
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+FileKey = Tuple[str, str, str]
+
+
+class FileRegistry:
+    """(session_id, conversation_id, file_name) -> 向量数据库目录 的嵌套索引"""
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict[str, Dict[str, Path]]] = {}
+        self._dir_refs: Dict[Path, int] = {}
+        self._inline: Dict[FileKey, Optional[str]] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key: FileKey) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key: FileKey) -> Path:
+        store_dir = self.get(key)
+        if store_dir is None:
+            raise KeyError(key)
+        return store_dir
+
+    def __setitem__(self, key: FileKey, store_dir: Path):
+        session_id, conversation_id, file_name = key
+        files = self._sessions.setdefault(session_id, {}).setdefault(conversation_id, {})
+        old_dir = files.get(file_name)
+        if old_dir is not None:
+            self._unref(old_dir)
+        else:
+            self._size += 1
+        files[file_name] = store_dir
+        self._dir_refs[store_dir] = self._dir_refs.get(store_dir, 0) + 1
+
+    def get(self, key: FileKey, default: Optional[Path] = None) -> Optional[Path]:
+        session_id, conversation_id, file_name = key
+        files = self._sessions.get(session_id, {}).get(conversation_id)
+        if not files:
+            return default
+        return files.get(file_name, default)
+
+    def pop(self, key: FileKey, default: Optional[Path] = None) -> Optional[Path]:
+        session_id, conversation_id, file_name = key
+        conversations = self._sessions.get(session_id)
+        files = conversations.get(conversation_id) if conversations else None
+        if not files or file_name not in files:
+            return default
+        store_dir = files.pop(file_name)
+        self._size -= 1
+        self._inline.pop(key, None)
+        self._unref(store_dir)
+        # 清除空的对话和会话，避免索引随历史会话无限增长
+        if not files:
+            del conversations[conversation_id]
+            if not conversations:
+                del self._sessions[session_id]
+        return store_dir
+
+    def __delitem__(self, key: FileKey):
+        if self.pop(key) is None:
+            raise KeyError(key)
+
+    def _unref(self, store_dir: Path):
+        refs = self._dir_refs.get(store_dir, 0) - 1
+        if refs > 0:
+            self._dir_refs[store_dir] = refs
+        else:
+            self._dir_refs.pop(store_dir, None)
+
+    def set_inline(self, key: FileKey, text: Optional[str] = None):
+        """标记文件为直接注入的小文件，text 为 None 表示全文尚未从磁盘读取"""
+        if key in self:
+            self._inline[key] = text
+
+    def is_inline(self, key: FileKey) -> bool:
+        return key in self._inline
+
+    def inline_text(self, key: FileKey) -> Optional[str]:
+        return self._inline.get(key)
+
+    def dir_refs(self, store_dir: Path) -> int:
+        """返回引用该向量数据库目录的文件数"""
+        return self._dir_refs.get(store_dir, 0)
+
+    def conversation_files(self, session_id: str, conversation_id: str) -> Dict[str, Path]:
+        """返回某个对话的 文件名 -> 目录 映射（副本，可在遍历时修改登记表）"""
+        return dict(self._sessions.get(session_id, {}).get(conversation_id, {}))
+
+    def conversation_keys(self, session_id: str, conversation_id: str) -> List[FileKey]:
+        return [(session_id, conversation_id, file_name)
+                for file_name in self._sessions.get(session_id, {}).get(conversation_id, {})]
+
+    def session_keys(self, session_id: str) -> List[FileKey]:
+        return [(session_id, conversation_id, file_name)
+                for conversation_id, files in self._sessions.get(session_id, {}).items()
+                for file_name in files]
+
+    def sessions(self) -> List[str]:
+        return list(self._sessions)
+
+    def items(self) -> Iterator[Tuple[FileKey, Path]]:
+        for session_id, conversations in self._sessions.items():
+            for conversation_id, files in conversations.items():
+                for file_name, store_dir in files.items():
+                    yield (session_id, conversation_id, file_name), store_dir
+
+    def __iter__(self) -> Iterator[FileKey]:
+        for key, _ in self.items():
+            yield key
+
+    def clear(self):
+        self._sessions.clear()
+        self._dir_refs.clear()
+        self._inline.clear()
+        self._size = 0
@@ -0,0 +1,167 @@
+"""文件使用轮数存储
+
+读取全部由内存镜像回答；写入先在内存中合并，再由专用的写线程每隔几百毫秒
+在一个事务中批量落盘（WAL 模式 + UPSERT），不会在事件循环中执行任何 commit。
+内存镜像按 会话 → 对话 → 文件名 分层保存，删除单个文件、整个对话或整个会话都不需要遍历其他记录。
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+FileKey = Tuple[str, str, str]
+# 会话ID → 对话ID → 文件名 → 轮数
+Rounds = Dict[str, Dict[str, Dict[str, int]]]
+
+_CREATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS file_rounds (
+        session_id TEXT NOT NULL,
+        conversation_id TEXT NOT NULL,
+        file_name TEXT NOT NULL,
+        rounds INTEGER DEFAULT 0,
+        PRIMARY KEY (session_id, conversation_id, file_name)
+    )
+'''
+
+_CREATE_INDEX_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_file_rounds_session_conversation ON file_rounds (session_id, conversation_id)
+'''
+
+_UPSERT_SQL = '''
+    INSERT INTO file_rounds (session_id, conversation_id, file_name, rounds) VALUES (?, ?, ?, ?)
+    ON CONFLICT (session_id, conversation_id, file_name) DO UPDATE SET rounds = rounds + excluded.rounds
+'''
+
+
+def _add(store: Rounds, key: FileKey, delta: int) -> int:
+    session_id, conversation_id, file_name = key
+    files = store.setdefault(session_id, {}).setdefault(conversation_id, {})
+    files[file_name] = files.get(file_name, 0) + delta
+    return files[file_name]
+
+
+def _remove(store: Rounds, session_id: str, conversation_id: Optional[str], file_name: Optional[str]):
+    if conversation_id is None:
+        store.pop(session_id, None)
+        return
+    conversations = store.get(session_id)
+    if conversations is None:
+        return
+    if file_name is None:
+        conversations.pop(conversation_id, None)
+    else:
+        files = conversations.get(conversation_id)
+        if files is None:
+            return
+        files.pop(file_name, None)
+        if not files:
+            del conversations[conversation_id]
+    if not conversations:
+        del store[session_id]
+
+
+def _items(store: Rounds) -> Iterator[Tuple[FileKey, int]]:
+    for session_id, conversations in store.items():
+        for conversation_id, files in conversations.items():
+            for file_name, rounds in files.items():
+                yield (session_id, conversation_id, file_name), rounds
+
+
+class FileRoundsStore:
+    """文件使用轮数的异步批量存储"""
+
+    def __init__(self, db_path: Path, flush_interval: float = 0.3):
+        self.db_path = Path(db_path)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending: Rounds = {}
+        self._pending_deletes: List[Tuple[str, Optional[str], Optional[str]]] = []
+        self._stop = threading.Event()
+
+        # 建表并把已有记录加载到内存镜像（仅在启动时执行一次）
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_CREATE_TABLE_SQL)
+            conn.execute(_CREATE_INDEX_SQL)
+            conn.commit()
+            rows = conn.execute("SELECT session_id, conversation_id, file_name, rounds FROM file_rounds").fetchall()
+        finally:
+            conn.close()
+        self._mirror: Rounds = {}
+        for session_id, conversation_id, file_name, rounds in rows:
+            _add(self._mirror, (session_id, conversation_id, file_name), rounds)
+
+        self._thread = threading.Thread(target=self._run, name="file-rounds-writer", daemon=True)
+        self._thread.start()
+
+    def get(self, key: FileKey) -> int:
+        session_id, conversation_id, file_name = key
+        return self._mirror.get(session_id, {}).get(conversation_id, {}).get(file_name, 0)
+
+    def all(self) -> Dict[FileKey, int]:
+        with self._lock:
+            return dict(_items(self._mirror))
+
+    def increment(self, key: FileKey) -> int:
+        """增加一轮使用次数并返回新的轮数（写入延迟合并落盘）"""
+        with self._lock:
+            rounds = _add(self._mirror, key, 1)
+            _add(self._pending, key, 1)
+        return rounds
+
+    def delete(self, session_id: str, conversation_id: Optional[str] = None, file_name: Optional[str] = None):
+        """删除单个文件、整个对话或整个会话的记录"""
+        with self._lock:
+            _remove(self._mirror, session_id, conversation_id, file_name)
+            _remove(self._pending, session_id, conversation_id, file_name)
+            self._pending_deletes.append((session_id, conversation_id, file_name))
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            while not self._stop.wait(self.flush_interval):
+                self._flush(conn)
+            self._flush(conn)
+        finally:
+            conn.close()
+
+    def _flush(self, conn: sqlite3.Connection):
+        with self._lock:
+            if not self._pending and not self._pending_deletes:
+                return
+            pending, self._pending = self._pending, {}
+            deletes, self._pending_deletes = self._pending_deletes, []
+
+        try:
+            with conn:
+                # 删除在前：删除发生时已从待写入的增量中剔除了对应记录，之后的增量应保留
+                for session_id, conversation_id, file_name in deletes:
+                    if file_name is not None:
+                        conn.execute(
+                            "DELETE FROM file_rounds WHERE session_id=? AND conversation_id=? AND file_name=?",
+                            (session_id, conversation_id, file_name)
+                        )
+                    elif conversation_id is not None:
+                        conn.execute(
+                            "DELETE FROM file_rounds WHERE session_id=? AND conversation_id=?",
+                            (session_id, conversation_id)
+                        )
+                    else:
+                        conn.execute("DELETE FROM file_rounds WHERE session_id=?", (session_id,))
+                conn.executemany(_UPSERT_SQL, [(*key, delta) for key, delta in _items(pending)])
+        except sqlite3.Error:
+            # 落盘失败时把增量放回，下次重试
+            with self._lock:
+                for key, delta in _items(pending):
+                    _add(self._pending, key, delta)
+                self._pending_deletes = deletes + self._pending_deletes
+
+    def close(self):
+        """停止写线程并落盘剩余的写入"""
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join(timeout=5)
@@ -0,0 +1,197 @@
+"""文件类型检测
+
+每个上传文件只读取一次开头的几KB，先用纯Python的文件头签名表识别 SUPPORTED_EXTENSIONS 中的格式，
+识别不了的二进制文件再交给 libmagic（进程内只创建一个实例）。检测结果随任务传递，后续解析不再重复检测。
+
+本模块不依赖 AstrBot，可被解析进程池的子进程直接导入。
+"""
+
+import os
+import threading
+import zipfile
+from typing import Optional
+
+# 检测时读取的文件头字节数
+SNIFF_BYTES = 8 * 1024
+
+_OLE2_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+_ZIP_MAGIC = b"PK\x03\x04"
+
+# OLE2 复合文档中的流名称（UTF-16LE）
+_OLE2_STREAMS = (
+    ("WordDocument".encode("utf-16-le"), "doc"),
+    ("Workbook".encode("utf-16-le"), "xls"),
+    ("Book".encode("utf-16-le"), "xls"),
+    ("PowerPoint Document".encode("utf-16-le"), "ppt"),
+)
+
+# OpenDocument 的 mimetype 文件内容
+_ODF_MIMETYPES = {
+    "application/vnd.oasis.opendocument.text": "odt",
+    "application/vnd.oasis.opendocument.spreadsheet": "ods",
+    "application/vnd.oasis.opendocument.presentation": "odp",
+}
+
+# 纯文本格式（内容无法区分时以文件名扩展名为准）
+_TEXT_EXTENSIONS = {
+    "txt", "log", "md", "markdown", "csv", "json", "yaml", "yml", "xml", "html", "htm",
+    "ini", "cfg", "conf", "properties", "env", "sql", "toml", "lock", "gitignore", "url", "webloc",
+    "py", "java", "cpp", "c", "h", "hpp", "cs", "js", "ts", "php", "rb", "go", "rs", "swift",
+    "kt", "scala", "sh", "bash", "ps1", "bat", "cmd", "vbs", "rtf",
+}
+
+_MIME_TO_EXT = {
+    "application/pdf": "pdf",
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "text/plain": "txt",
+    "text/csv": "csv",
+    "application/zip": "zip",
+    "application/x-rar-compressed": "rar",
+    "application/x-tar": "tar",
+    "application/gzip": "gz",
+}
+
+
+def _name_extension(file_name: str) -> str:
+    return os.path.splitext(file_name)[1][1:].lower()
+
+
+def _sniff_zip(file_path: str) -> Optional[str]:
+    """根据ZIP目录判断 Office Open XML 或 OpenDocument 类型"""
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            names = set(archive.namelist())
+            if "mimetype" in names:
+                mimetype = archive.read("mimetype").decode("ascii", errors="ignore").strip()
+                if mimetype in _ODF_MIMETYPES:
+                    return _ODF_MIMETYPES[mimetype]
+    except (zipfile.BadZipFile, OSError):
+        return None
+    prefixes = {name.split("/", 1)[0] for name in names}
+    if "word" in prefixes:
+        return "docx"
+    if "xl" in prefixes:
+        return "xlsx"
+    if "ppt" in prefixes:
+        return "pptx"
+    return "zip"
+
+
+def _looks_like_text(head: bytes) -> bool:
+    if not head:
+        return True
+    if b"\x00" in head and not head.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return False
+    # 控制字符（除常见空白外）占比很高时视为二进制
+    control = sum(1 for byte in head if byte < 0x20 and byte not in (0x09, 0x0A, 0x0C, 0x0D, 0x1B))
+    return control / len(head) < 0.05
+
+
+def _sniff_text(head: bytes) -> str:
+    """无扩展名的文本文件按内容粗略判断格式"""
+    start = head.lstrip(b"\xef\xbb\xbf \t\r\n")[:256].lower()
+    if start.startswith(b"<?xml"):
+        return "xml"
+    if start.startswith((b"<!doctype html", b"<html")):
+        return "html"
+    if start.startswith((b"{", b"[")):
+        return "json"
+    return "txt"
+
+
+def _mime_to_ext(mime: str) -> Optional[str]:
+    if "vnd.openxmlformats-officedocument" in mime:
+        if "wordprocessingml" in mime:
+            return "docx"
+        if "spreadsheetml" in mime:
+            return "xlsx"
+        if "presentationml" in mime:
+            return "pptx"
+    if mime in _MIME_TO_EXT:
+        return _MIME_TO_EXT[mime]
+    if "/" in mime:
+        mime_type = mime.split("/")[-1]
+        # 处理复合类型如vnd.ms-excel
+        if mime_type.startswith("vnd."):
+            mime_type = mime_type[4:]
+        if mime_type.startswith("x-"):
+            mime_type = mime_type[2:]
+        return mime_type
+    return mime or None
+
+
+class FileTypeDetector:
+    """文件类型检测器（libmagic 实例按需创建一次，之后复用）"""
+
+    def __init__(self):
+        self._magic = None
+        self._magic_loaded = False
+        self._lock = threading.Lock()
+
+    def _get_magic(self):
+        if not self._magic_loaded:
+            with self._lock:
+                if not self._magic_loaded:
+                    try:
+                        import magic
+                        self._magic = magic.Magic(mime=True)
+                    except Exception:
+                        self._magic = None
+                    self._magic_loaded = True
+        return self._magic
+
+    def detect(self, file_path: str, file_name: Optional[str] = None) -> str:
+        """返回文件类型（扩展名形式，小写、不带点），无法识别时返回空字符串
+
+        file_name 为上传时的原始文件名，文本格式以其扩展名为准。
+        """
+        name_ext = _name_extension(file_name or file_path)
+        with open(file_path, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+
+        if head.startswith(b"%PDF-"):
+            return "pdf"
+        if head.startswith(_ZIP_MAGIC):
+            return _sniff_zip(file_path) or name_ext
+        if head.startswith(_OLE2_MAGIC):
+            for stream_name, ext in _OLE2_STREAMS:
+                if stream_name in head:
+                    return ext
+            return name_ext if name_ext in ("doc", "xls", "ppt") else "doc"
+        if head.startswith(b"{\\rtf"):
+            return "rtf"
+
+        if _looks_like_text(head):
+            if name_ext in _TEXT_EXTENSIONS:
+                return name_ext
+            return _sniff_text(head)
+
+        # 签名表无法识别的二进制文件，交给 libmagic 给出类型名称
+        detector = self._get_magic()
+        if detector is not None:
+            try:
+                return _mime_to_ext(detector.from_buffer(head)) or name_ext
+            except Exception:
+                pass
+        return name_ext
+
+
+_detector: Optional[FileTypeDetector] = None
+_detector_lock = threading.Lock()
+
+
+def get_detector() -> FileTypeDetector:
+    """返回进程内共享的检测器"""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = FileTypeDetector()
+    return _detector
+
+
+def detect_file_type(file_path: str, file_name: Optional[str] = None) -> str:
+    """检测文件类型，返回扩展名形式的类型（如 pdf、docx、txt），无法识别时返回空字符串"""
+    return get_detector().detect(file_path, file_name)
@@ -0,0 +1,325 @@
+"""大文件分批嵌入
+
+把文件分块按批嵌入并写入向量数据库，代替一次性提交全部分块的 insert_batch：
+- 每批块数可配置，同时进行的批次数有上限
+- 所有会话共用一个令牌桶限速器，避免超出嵌入服务的速率限制
+- 每批失败时按指数退避重试
+- 分块的 chunk_index 记录在文档库的元数据中，重新上传同一文件时跳过已写入的分块（断点续传）
+- 各批向量直接加入内存中的FAISS索引，整个文件写完（或每写入 INDEX_CHECKPOINT_CHUNKS 块）才在线程中保存一次索引，
+  不会每批都在事件循环中重写整个索引文件
+- 可选同时写入本地 BM25 关键词索引
+- 可选在嵌入前去除重复分块，被去除的分块只写入文档库的元数据（不嵌入、不进入FAISS索引）
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+import weakref
+from typing import AsyncIterable, Awaitable, Callable, Iterable, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+# (chunk_index, 分块文本, 元数据)
+ChunkItem = Tuple[int, str, dict]
+ProgressCallback = Callable[[int, Optional[int]], Awaitable[None]]
+
+# 写入大文件时每写入多少块保存一次FAISS索引（断点续传只能从已保存的索引继续）
+INDEX_CHECKPOINT_CHUNKS = 4096
+
+# 每个FAISS索引的写锁：共享存储布局下多个文件可能同时写入、删除同一个索引
+_index_locks: "weakref.WeakKeyDictionary[object, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+
+def file_sha256(file_path: str) -> str:
+    """计算源文件的SHA-256，用于识别重新上传的同一文件"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TokenBucket:
+    """令牌桶限速器
+
+    rate 为每秒补充的令牌数（每批嵌入请求消耗一个令牌），0 表示不限速；
+    capacity 为允许的突发请求数。等待令牌的请求按先后顺序获得令牌。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class IngestError(Exception):
+    """嵌入重试用尽后中断写入，done 为该文件已写入向量数据库的块数"""
+
+    def __init__(self, done: int, total: Optional[int], cause: BaseException):
+        super().__init__(str(cause) or cause.__class__.__name__)
+        self.done = done
+        self.total = total
+        self.cause = cause
+
+
+class _BatchFailed(Exception):
+    def __init__(self, cause: BaseException):
+        super().__init__(str(cause))
+        self.cause = cause
+
+
+def index_lock(vec_db) -> asyncio.Lock:
+    """返回向量数据库FAISS索引的写锁，加入、删除向量和保存索引时持有"""
+    storage = vec_db.embedding_storage
+    lock = _index_locks.get(storage)
+    if lock is None:
+        lock = _index_locks[storage] = asyncio.Lock()
+    return lock
+
+
+def _write_index(storage):
+    import faiss
+    faiss.write_index(storage.index, storage.path)
+
+
+async def save_index(vec_db):
+    """在线程中把FAISS索引写入磁盘（调用方持有 index_lock）"""
+    await asyncio.to_thread(_write_index, vec_db.embedding_storage)
+
+
+def _saved_ids(vec_db) -> Optional[Set[int]]:
+    """返回FAISS索引中已有向量的ID，无法读取时返回 None"""
+    try:
+        import faiss
+        return set(faiss.vector_to_array(vec_db.embedding_storage.index.id_map).tolist())
+    except Exception:
+        return None
+
+
+async def indexed_chunk_indexes(vec_db, db_file: str, lexical=None) -> Set[int]:
+    """读取文件已写入向量数据库的分块序号
+
+    文档库中有记录、但向量不在索引中的分块（上次写入在两次保存索引之间中断）会从文档库和关键词索引中删除，
+    续传时重新嵌入；被去重的分块本来就没有向量，视为已写入。
+    """
+    docs = await vec_db.document_storage.get_documents(
+        metadata_filters={"db_file": db_file}, offset=None, limit=None
+    )
+    saved_ids = _saved_ids(vec_db)
+    indexes = set()
+    orphans = []
+    for doc in docs:
+        metadata = doc.get("metadata")
+        if isinstance(metadata, str):
+            try:
+                metadata = json.loads(metadata)
+            except ValueError:
+                continue
+        if not isinstance(metadata, dict) or not isinstance(metadata.get("chunk_index"), int):
+            continue
+        if saved_ids is not None and "duplicate_of" not in metadata and doc["id"] not in saved_ids:
+            orphans.append(doc)
+            continue
+        indexes.add(metadata["chunk_index"])
+    for doc in orphans:
+        await vec_db.document_storage.delete_document_by_doc_id(doc["doc_id"])
+    if orphans and lexical is not None:
+        await asyncio.to_thread(lexical.delete_docs, [doc["id"] for doc in orphans])
+    return indexes
+
+
+async def insert_embedded(vec_db, texts: List[str], metadatas: List[dict], vectors: list) -> List[int]:
+    """写入已计算好向量的分块，返回文档库中的整数ID
+
+    向量只加入内存中的FAISS索引，由调用方在合适的时候调用 save_index 保存（调用方持有 index_lock）。
+    """
+    vectors = np.array(vectors, dtype=np.float32)
+    index = vec_db.embedding_storage.index
+    if vectors.ndim != 2 or vectors.shape[1] != index.d:
+        raise ValueError(f"向量维度 {vectors.shape[-1]} 与索引维度 {index.d} 不一致")
+    doc_ids = [str(uuid.uuid4()) for _ in texts]
+    int_ids = await vec_db.document_storage.insert_documents_batch(doc_ids, texts, metadatas)
+    index.add_with_ids(vectors, np.array(int_ids, dtype=np.int64))
+    return int_ids
+
+
+async def insert_suppressed(vec_db, metadatas: List[dict]):
+    """只在文档库中记录被去重的分块（文本为空，元数据中记录 duplicate_of），检索时不会命中"""
+    doc_ids = [str(uuid.uuid4()) for _ in metadatas]
+    await vec_db.document_storage.insert_documents_batch(doc_ids, [""] * len(metadatas), metadatas)
+
+
+async def _iterate(items: Union[Iterable[ChunkItem], AsyncIterable[ChunkItem]]):
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+class IngestEmbedder:
+    """分批、限速、可续传的分块嵌入器"""
+
+    def __init__(self, batch_size: int, max_parallel: int, limiter: TokenBucket,
+                 max_retries: int = 3, retry_base_delay: float = 1.0,
+                 checkpoint_chunks: int = INDEX_CHECKPOINT_CHUNKS):
+        self.batch_size = max(1, batch_size)
+        self.checkpoint_chunks = max(1, checkpoint_chunks)
+        self.max_parallel = max(1, max_parallel)
+        self.limiter = limiter
+        self.max_retries = max(0, max_retries)
+        self.retry_base_delay = retry_base_delay
+
+    async def _embed_with_retry(self, provider, texts: List[str]) -> list:
+        attempt = 0
+        while True:
+            await self.limiter.acquire()
+            try:
+                vectors = await provider.get_embeddings(texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"嵌入服务返回 {len(vectors)} 个向量，预期 {len(texts)} 个")
+                return vectors
+            except Exception:
+                if attempt >= self.max_retries:
+                    raise
+                # 指数退避并加入随机抖动，避免多个批次同时重试
+                await asyncio.sleep(self.retry_base_delay * (2 ** attempt) * (1 + random.random()))
+                attempt += 1
+
+    async def ingest(
+        self,
+        provider,
+        vec_db,
+        items: Union[Iterable[ChunkItem], AsyncIterable[ChunkItem]],
+        skip: Optional[Set[int]] = None,
+        total: Optional[int] = None,
+        progress: Optional[ProgressCallback] = None,
+        dedup=None,
+        lexical=None,
+    ) -> int:
+        """嵌入并写入分块，返回该文件的总块数（含断点前已写入、本次跳过和被去重的分块）
+
+        items 可以是普通或异步可迭代对象，异步时边产生分块边嵌入；
+        skip 中的 chunk_index 视为已写入。FAISS索引在结束时（包括中断时）保存一次，大文件每 checkpoint_chunks 块额外保存一次。
+        lexical 为 LexicalIndex 时同时写入关键词索引；
+        dedup 为 ChunkDeduplicator 时去除重复分块，
+        断点续传时已写入的分块仍会经过去重器，保证两次上传的去重结果一致。
+        嵌入重试用尽时抛出 IngestError。
+        """
+        skip = skip or set()
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        insert_lock = index_lock(vec_db)
+        pending: Set[asyncio.Future] = set()
+        seen = 0
+        done = 0
+        unsaved = 0
+
+        async def run_batch(batch: List[ChunkItem]):
+            nonlocal done, unsaved
+            try:
+                texts = [text for _, text, _ in batch]
+                vectors = await self._embed_with_retry(provider, texts)
+                # FAISS索引的写入和保存串行进行
+                metadatas = [metadata for _, _, metadata in batch]
+                async with insert_lock:
+                    int_ids = await insert_embedded(vec_db, texts, metadatas, vectors)
+                    unsaved += len(batch)
+                    if lexical is not None:
+                        await asyncio.to_thread(lexical.add, int_ids, texts, metadatas)
+                    if unsaved >= self.checkpoint_chunks:
+                        await save_index(vec_db)
+                        unsaved = 0
+                done += len(batch)
+                if progress:
+                    await progress(done, total)
+            finally:
+                semaphore.release()
+
+        def raise_failed():
+            for task in [t for t in pending if t.done()]:
+                pending.discard(task)
+                if not task.cancelled() and task.exception():
+                    raise _BatchFailed(task.exception())
+
+        async def submit(batch: List[ChunkItem]):
+            # 同时进行的批次已满时在此等待，异步分块来源也随之暂停
+            await semaphore.acquire()
+            try:
+                raise_failed()
+            except BaseException:
+                semaphore.release()
+                raise
+            pending.add(asyncio.ensure_future(run_batch(batch)))
+
+        async def flush_suppressed(metadatas: List[dict]):
+            nonlocal done
+            try:
+                async with insert_lock:
+                    await insert_suppressed(vec_db, metadatas)
+            except Exception as e:
+                raise _BatchFailed(e)
+            done += len(metadatas)
+
+        batch: List[ChunkItem] = []
+        suppressed: List[dict] = []
+        try:
+            async for item in _iterate(items):
+                seen += 1
+                chunk_index, text, metadata = item
+                duplicate = dedup.check(chunk_index, text) if dedup else None
+                if chunk_index in skip:
+                    done += 1
+                    continue
+                if duplicate:
+                    suppressed.append({**metadata, "duplicate_of": duplicate[0], "similarity": round(duplicate[1], 3)})
+                    if len(suppressed) >= self.batch_size:
+                        await flush_suppressed(suppressed)
+                        suppressed = []
+                    continue
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    await submit(batch)
+                    batch = []
+            if batch:
+                await submit(batch)
+            if suppressed:
+                await flush_suppressed(suppressed)
+            while pending:
+                await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+                raise_failed()
+        except BaseException as e:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            # 只有嵌入和写入失败才视为可续传的中断，分块来源（文件解析）的错误原样向上传递
+            if isinstance(e, _BatchFailed):
+                raise IngestError(done, total, e.cause) from e.cause
+            raise
+        finally:
+            if unsaved:
+                # 已加入内存索引的向量（包括中断前写入的批次）保存一次，断点续传从这里继续
+                async with insert_lock:
+                    await save_index(vec_db)
+            if hasattr(items, "aclose"):
+                await items.aclose()
+        return seen
+
@@ -0,0 +1,208 @@
+"""文件处理队列
+
+上传的文件作为任务排队，由固定数量的后台工作协程处理：
+- 不同会话之间轮流取任务，一个会话上传大文件不会让其他会话一直等待
+- 排队中文件的总大小有上限，超出时拒绝新任务
+- 保留每个会话最近完成的任务及耗时，供 /file_status 查看（只保留最近活跃的 max_sessions 个会话，不保留消息事件等上下文）
+"""
+
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class QueueFullError(Exception):
+    """排队中的文件总大小超出上限"""
+
+
+class IngestJob:
+    """一个待处理的文件"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, session_id: str, file_name: str, size_bytes: int, data: dict):
+        self.job_id = next(self._ids)
+        self.session_id = session_id
+        self.file_name = file_name
+        self.size_bytes = size_bytes
+        self.data = data  # 处理函数需要的上下文（事件、文件路径等），任务结束后清空
+        self.state = QUEUED
+        self.error: Optional[str] = None
+        self.enqueued_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def wait_seconds(self) -> float:
+        return (self.started_at or self.finished_at or time.time()) - self.enqueued_at
+
+    @property
+    def run_seconds(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class IngestQueue:
+    """按会话轮询的文件处理队列
+
+    runner 处理单个任务，返回 None 表示成功，返回字符串表示失败原因。
+    """
+
+    def __init__(self, runner: Callable[[IngestJob], Awaitable[Optional[str]]], workers: int,
+                 max_queued_bytes: int, history_size: int = 10, max_sessions: int = 1024):
+        self._runner = runner
+        self.workers = max(1, workers)
+        self.max_queued_bytes = max(0, max_queued_bytes)
+        self.history_size = history_size
+        self.max_sessions = max_sessions
+        self._queues: "OrderedDict[str, deque[IngestJob]]" = OrderedDict()
+        self._running: Dict[int, IngestJob] = {}
+        self._running_tasks: Dict[int, asyncio.Task] = {}
+        self._history: "OrderedDict[str, deque[IngestJob]]" = OrderedDict()
+        self._queued_bytes = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+    @property
+    def queued_bytes(self) -> int:
+        return self._queued_bytes
+
+    def queued_count(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def running_count(self) -> int:
+        return len(self._running)
+
+    def _start_workers(self):
+        # 工作协程在第一次提交任务时启动，此时事件循环已经在运行
+        if self._worker_tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, job: IngestJob) -> bool:
+        """提交任务，返回是否需要等待空闲的工作协程；排队文件总大小超出上限时抛出 QueueFullError"""
+        if (self.max_queued_bytes and self._queued_bytes
+                and self._queued_bytes + job.size_bytes > self.max_queued_bytes):
+            raise QueueFullError(
+                f"排队中的文件已有 {self._queued_bytes / 1024 / 1024:.1f}MB，"
+                f"超出上限 {self.max_queued_bytes / 1024 / 1024:.0f}MB"
+            )
+        self._start_workers()
+        self._queues.setdefault(job.session_id, deque()).append(job)
+        self._queued_bytes += job.size_bytes
+        self._wakeup.set()
+        return self.position(job) >= self.workers - len(self._running)
+
+    def _next_job(self) -> Optional[IngestJob]:
+        """从排在最前的会话取一个任务，并把该会话移到队尾"""
+        while self._queues:
+            session_id, queue = next(iter(self._queues.items()))
+            if not queue:
+                del self._queues[session_id]
+                continue
+            job = queue.popleft()
+            if queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            self._queued_bytes -= job.size_bytes
+            return job
+        return None
+
+    async def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._run(job)
+
+    async def _run(self, job: IngestJob):
+        job.state = RUNNING
+        job.started_at = time.time()
+        self._running[job.job_id] = job
+        task = asyncio.ensure_future(self._runner(job))
+        self._running_tasks[job.job_id] = task
+        try:
+            job.error = await task
+            job.state = FAILED if job.error else DONE
+        except asyncio.CancelledError:
+            job.state = CANCELLED
+            # 工作协程本身被取消（插件卸载）时继续向上传递
+            if not task.cancelled():
+                raise
+        except Exception as e:
+            job.state = FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self._running.pop(job.job_id, None)
+            self._running_tasks.pop(job.job_id, None)
+            self._record(job)
+
+    def _record(self, job: IngestJob):
+        # 历史记录只需要文件名、状态和耗时，释放消息事件等上下文
+        job.data = {}
+        history = self._history.setdefault(job.session_id, deque(maxlen=self.history_size))
+        history.append(job)
+        # 按最近完成任务的时间淘汰最久不活跃会话的记录
+        self._history.move_to_end(job.session_id)
+        while len(self._history) > self.max_sessions:
+            self._history.popitem(last=False)
+
+    def cancel_session(self, session_id: str) -> int:
+        """取消会话排队中和处理中的任务，返回取消的数量"""
+        cancelled = 0
+        queue = self._queues.pop(session_id, None) or deque()
+        for job in queue:
+            self._queued_bytes -= job.size_bytes
+            job.state = CANCELLED
+            job.finished_at = time.time()
+            self._record(job)
+            cancelled += 1
+        for job_id, job in list(self._running.items()):
+            if job.session_id == session_id:
+                self._running_tasks[job_id].cancel()
+                cancelled += 1
+        return cancelled
+
+    def session_jobs(self, session_id: str) -> Dict[str, List[IngestJob]]:
+        """返回会话的排队中、处理中和最近完成的任务"""
+        return {
+            QUEUED: list(self._queues.get(session_id, ())),
+            RUNNING: [job for job in self._running.values() if job.session_id == session_id],
+            DONE: list(self._history.get(session_id, ())),
+        }
+
+    def position(self, job: IngestJob) -> int:
+        """估算任务前面还有多少个排队任务（按会话轮询顺序）"""
+        queue = self._queues.get(job.session_id)
+        if not queue or job not in queue:
+            return 0
+        rank = queue.index(job)
+        # 每一轮每个会话取一个任务：排在第 rank 位的任务之前，其他会话最多各取 rank + 1 个
+        ahead = rank
+        for session_id, other in self._queues.items():
+            if session_id == job.session_id:
+                continue
+            ahead += min(len(other), rank + 1)
+        return ahead
+
+    async def shutdown(self):
+        for job_id, task in list(self._running_tasks.items()):
+            task.cancel()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
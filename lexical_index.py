@@ -0,0 +1,161 @@
+"""本地 BM25 关键词索引
+
+每个向量数据库目录中的 doc.db 旁边保存一个 lexical.db 倒排索引，写入分块时同步建立。
+检索只读本地 SQLite，不调用嵌入服务，可用于：
+- 纯关键词检索（不需要任何服务商调用）
+- 与向量检索结果融合（RRF）
+- 嵌入服务慢或不可用时自动退回关键词检索
+
+分词对中日韩文字使用相邻二字组（单字的文字段保留单字），其他文字按单词切分并转为小写。
+倒排索引中的文档键即文档库中的整数ID，命中后从 doc.db 读取分块文本和元数据。
+"""
+
+import math
+import re
+import sqlite3
+import threading
+import weakref
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+LEXICAL_DB_NAME = "lexical.db"
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 查询最多使用的检索词数（超长提问只取前面的部分）
+MAX_QUERY_TERMS = 256
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_WORD = re.compile(r"\w+")
+_CJK_OR_OTHER = re.compile(f"[{_CJK}]+|[^{_CJK}_]+")
+_CJK_CHAR = re.compile(f"[{_CJK}]")
+
+
+def tokenize(text: str) -> List[str]:
+    """切分为检索词：中日韩文字取相邻二字组，其他文字取小写单词"""
+    tokens = []
+    for word in _WORD.findall(text.lower()):
+        for run in _CJK_OR_OTHER.findall(word):
+            if _CJK_CHAR.match(run):
+                if len(run) == 1:
+                    tokens.append(run)
+                else:
+                    tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            else:
+                tokens.append(run)
+    return tokens
+
+
+class LexicalIndex:
+    """单个向量数据库目录的 BM25 倒排索引（每次操作单独连接，目录可随时删除）"""
+
+    # 只有正在写入的索引持有锁，写完后条目随锁对象释放，不会随处理过的目录数增长
+    _write_locks: "weakref.WeakValueDictionary[Path, threading.Lock]" = weakref.WeakValueDictionary()
+    _write_locks_guard = threading.Lock()
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+
+    def _write_lock(self) -> threading.Lock:
+        with self._write_locks_guard:
+            return self._write_locks.setdefault(self.db_path, threading.Lock())
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_key INTEGER PRIMARY KEY,
+                db_file TEXT DEFAULT '',
+                length INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_key INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_key)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_db_file ON docs (db_file)")
+        return conn
+
+    def exists(self) -> bool:
+        return self.db_path.exists()
+
+    def add(self, doc_keys: Iterable[int], texts: Iterable[str], metadatas: Iterable[dict]):
+        """登记一批分块，doc_keys 为文档库返回的整数ID"""
+        docs = []
+        postings = []
+        for doc_key, text, metadata in zip(doc_keys, texts, metadatas):
+            counts = Counter(tokenize(text))
+            docs.append((int(doc_key), metadata.get("db_file", ""), sum(counts.values())))
+            postings.extend((term, int(doc_key), tf) for term, tf in counts.items())
+        with self._write_lock():
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?, ?)", docs)
+                    conn.executemany("INSERT OR REPLACE INTO postings VALUES (?, ?, ?)", postings)
+            finally:
+                conn.close()
+
+    def delete_file(self, db_file: str):
+        """删除共享向量数据库中某个文件的全部分块"""
+        if not self.exists():
+            return
+        with self._write_lock():
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "DELETE FROM postings WHERE doc_key IN (SELECT doc_key FROM docs WHERE db_file = ?)",
+                        (db_file,)
+                    )
+                    conn.execute("DELETE FROM docs WHERE db_file = ?", (db_file,))
+            finally:
+                conn.close()
+
+    def delete_docs(self, doc_keys: Iterable[int]):
+        """按文档ID删除分块"""
+        if not self.exists():
+            return
+        keys = [(int(doc_key),) for doc_key in doc_keys]
+        with self._write_lock():
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("DELETE FROM postings WHERE doc_key = ?", keys)
+                    conn.executemany("DELETE FROM docs WHERE doc_key = ?", keys)
+            finally:
+                conn.close()
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """按 BM25 得分从高到低返回最多 k 个 (文档ID, 得分)"""
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        if not terms or not self.exists():
+            return []
+        conn = self._connect()
+        try:
+            doc_count, total_length = conn.execute("SELECT COUNT(*), SUM(length) FROM docs").fetchone()
+            if not doc_count:
+                return []
+            rows = conn.execute(
+                f"SELECT p.term, p.doc_key, p.tf, d.length FROM postings p JOIN docs d ON d.doc_key = p.doc_key "
+                f"WHERE p.term IN ({', '.join('?' * len(terms))})",
+                terms
+            ).fetchall()
+        finally:
+            conn.close()
+
+        avg_length = (total_length or 0) / doc_count or 1.0
+        doc_freq = Counter(term for term, _, _, _ in rows)
+        scores: Dict[int, float] = {}
+        for term, doc_key, tf, length in rows:
+            df = doc_freq[term]
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[doc_key] = scores.get(doc_key, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
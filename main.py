@@ -12,334 +12,50 @@ from pathlib import Path
 import time
 import os
 import asyncio
-import sqlite3
+import itertools
+import json
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Optional
 
 # 导入知识库相关模块
 from astrbot.core.knowledge_base.chunking.recursive import RecursiveCharacterChunker
 from astrbot.core.db.vec_db.faiss_impl.vec_db import FaissVecDB
 
-# 导入文件处理相关模块
-from pdfminer.high_level import extract_text
-import docx2txt
-import pandas as pd
-from docx import Document
-from pptx import Presentation
-from typing import Dict, Optional
-import chardet
+# 导入插件内部模块
+from .embedding_cache import EmbeddingCache, CachedEmbeddingProvider, QueryEmbeddingCache
+from .file_parsers import (
+    SUPPORTED_EXTENSIONS,
+    TABLE_EXTENSIONS,
+    read_any_file_to_text,
+    spool_pdf_pages,
+    spool_table_chunks,
+    spool_text_segments,
+    TEXT_SEGMENT_CHARS,
+)
+from .file_types import detect_file_type
+from .chunkers import ChunkerRegistry, create_chunker_registry
+from .dedup import ChunkDeduplicator
+from .parse_pool import ParsePool, ParseCancelledError
+from .ingest_queue import IngestJob, IngestQueue, QueueFullError, QUEUED, RUNNING, DONE, FAILED, CANCELLED
+from .ingest_embedder import IngestEmbedder, IngestError, TokenBucket, file_sha256, indexed_chunk_indexes
+from .expiry import ExpiryScheduler
+from .file_rounds_store import FileRoundsStore
+from .file_registry import FileRegistry
+from .manifest import FileManifest, ManifestEntry
+from .vector_db_pool import VectorDBPool
+from .tokens import estimate_tokens
+from .context_packing import pack_context, select_inline
+from .retrieval import RerankPolicy, delete_by_metadata, result_metadata, retrieve
+from .retrieval_cache import RetrievalCache
+from .lexical_index import LEXICAL_DB_NAME, LexicalIndex
 
-# 使用字典存储支持的文件类型和对应的处理函数
-SUPPORTED_EXTENSIONS: Dict[str, str] = {
-    # 文档格式
-    "pdf": "read_pdf_to_text",
-    "docx": "read_docx_to_text",
-    "doc": "read_docx_to_text",
-    "rtf": "read_txt_to_text",
-    "odt": "read_txt_to_text",
-
-    # 电子表格
-    "xlsx": "read_excel_to_text",
-    "xls": "read_excel_to_text",
-    "ods": "read_excel_to_text",
-    "csv": "read_csv_to_text",
-
-    # 演示文稿
-    "pptx": "read_pptx_to_text",
-    "ppt": "read_pptx_to_text",
-    "odp": "read_pptx_to_text",
-
-    # 编程语言源代码
-    "py": "read_txt_to_text",
-    "java": "read_txt_to_text",
-    "cpp": "read_txt_to_text",
-    "c": "read_txt_to_text",
-    "h": "read_txt_to_text",
-    "hpp": "read_txt_to_text",
-    "cs": "read_txt_to_text",
-    "js": "read_txt_to_text",
-    "ts": "read_txt_to_text",
-    "php": "read_txt_to_text",
-    "rb": "read_txt_to_text",
-    "go": "read_txt_to_text",
-    "rs": "read_txt_to_text",
-    "swift": "read_txt_to_text",
-    "kt": "read_txt_to_text",
-    "scala": "read_txt_to_text",
-    "sh": "read_txt_to_text",
-    "bash": "read_txt_to_text",
-    "ps1": "read_txt_to_text",
-    "bat": "read_txt_to_text",
-    "cmd": "read_txt_to_text",
-    "vbs": "read_txt_to_text",
-
-    # 标记语言
-    "html": "read_txt_to_text",
-    "htm": "read_txt_to_text",
-    "xml": "read_txt_to_text",
-    "json": "read_txt_to_text",
-    "yaml": "read_txt_to_text",
-    "yml": "read_txt_to_text",
-    "md": "read_txt_to_text",
-    "markdown": "read_txt_to_text",
-
-    # 配置文件
-    "ini": "read_txt_to_text",
-    "cfg": "read_txt_to_text",
-    "conf": "read_txt_to_text",
-    "properties": "read_txt_to_text",
-    "env": "read_txt_to_text",
-
-    # 数据库/查询
-    "sql": "read_txt_to_text",
-
-    # 其他文本格式
-    "txt": "read_txt_to_text",
-    "log": "read_txt_to_text",
-    "": "read_txt_to_text",  # 无扩展名文件
-
-    # 构建/项目文件
-    "toml": "read_txt_to_text",
-    "lock": "read_txt_to_text",
-    "gitignore": "read_txt_to_text",
-
-    # 网络相关
-    "url": "read_txt_to_text",
-    "webloc": "read_txt_to_text",
-}
-
-def get_file_type(file_path: str) -> Optional[str]:
-    """安全获取文件扩展名（优先MIME检测，后备扩展名）"""
-    
-    # 首先检查文件是否存在
-    if not os.path.isfile(file_path):
-        raise FileNotFoundError
-    
-    try:
-        # 方案1：使用python-magic（推荐）
-        import magic
-        mime = magic.from_file(file_path, mime=True)
-        
-        # 处理常见的MIME类型映射
-        mime_to_ext = {
-            'application/pdf': 'pdf',
-            'image/jpeg': 'jpg',
-            'image/png': 'png',
-            'image/gif': 'gif',
-            'text/plain': 'txt',
-            'application/zip': 'zip',
-            'application/x-rar-compressed': 'rar',
-            'application/x-tar': 'tar',
-            'application/gzip': 'gz'
-        }
-        
-        # 处理常见的MIME类型映射
-        if 'vnd.openxmlformats-officedocument' in mime:
-            # 提取具体的Office文档类型
-            if 'wordprocessingml' in mime:
-                return 'docx'
-            elif 'spreadsheetml' in mime:
-                return 'xlsx'
-            elif 'presentationml' in mime:
-                return 'pptx'
-        
-        # 检查映射表
-        if mime in mime_to_ext:
-            return mime_to_ext[mime]
-        
-        # 通用处理：从MIME类型中提取扩展名
-        if '/' in mime:
-            mime_type = mime.split("/")[-1]
-            # 处理复合类型如vnd.ms-excel
-            if mime_type.startswith('vnd.'):
-                mime_type = mime_type[4:]
-            if mime_type.startswith('x-'):
-                mime_type = mime_type[2:]
-            return mime_type
-        
-        return mime
-    
-    except ImportError:
-        # 方案2：后备使用扩展名
-        ext = os.path.splitext(file_path)[1]
-        if ext:
-            return ext[1:].lower()  # 去掉点号并转为小写
-        else:
-            raise ImportError
-
-
-def complete_filename(file_path: str) -> str:
-    """补全文件名（如果缺少扩展名则自动添加）"""
-    if not os.path.isfile(file_path):
-        return file_path
-    
-    # 如果已经有扩展名，直接返回
-    if os.path.splitext(file_path)[1]:
-        return file_path
-    
-    # 获取文件类型并补全扩展名
-    file_type = get_file_type(file_path)
-    if file_type:
-        return f"{file_path}.{file_type}"
-    
-    return file_path  # 无法确定类型，返回原文件名
-
-
-def read_csv_to_text(file_path: str) -> str:
-    """读取CSV文件并返回格式化的文本"""
-    try:
-        df = pd.read_csv(file_path)
-        return df.to_string(index=False)
-    except Exception as e:
-        raise RuntimeError(f"读取CSV文件失败: {str(e)}")
-
-
-def read_pdf_to_text(file_path: str) -> str:
-    """使用pdfminer.six提取PDF文本（效果更好）"""
-    try:
-        return extract_text(file_path)
-    except Exception as e:
-        raise RuntimeError(f"读取PDF文件失败: {str(e)}")
-
-
-def convert_doc_to_docx(doc_file: str, docx_file: str) -> None:
-    """将doc文档转为docx文档"""
-    try:
-        doc = Document(doc_file)
-        doc.save(docx_file)
-    except Exception as e:
-        raise RuntimeError(f"转换DOC到DOCX失败: {str(e)}")
-
-
-def read_docx_to_text(file_path: str) -> str:
-    """读取DOCX或DOC文件内容并返回文本"""
-    try:
-        # 统一处理路径
-        file_path = os.path.abspath(file_path)
-
-        if file_path.lower().endswith(".doc"):
-            # 处理DOC文件
-            file_dir, file_name = os.path.split(file_path)
-            file_base = os.path.splitext(file_name)[0]
-            docx_file = os.path.join(file_dir, f"{file_base}.docx")
-
-            # 转换DOC到DOCX
-            convert_doc_to_docx(file_path, docx_file)
-
-            # 处理转换后的文件
-            text = docx2txt.process(docx_file)
-
-            # 删除临时转换的文件
-            try:
-                os.remove(docx_file)
-            except:
-                pass
-        else:
-            # 直接处理DOCX文件
-            text = docx2txt.process(file_path)
-
-        return text
-    except Exception as e:
-        raise RuntimeError(f"读取Word文件失败: {str(e)}")
-
-
-def read_excel_to_text(file_path: str) -> str:
-    """读取Excel文件内容并返回文本"""
-    try:
-        excel_file = pd.ExcelFile(file_path)
-        text_list = []
-
-        for sheet_name in excel_file.sheet_names:
-            df = excel_file.parse(sheet_name)
-            text = df.to_string(index=False)
-            text_list.append(f"=== {sheet_name} ===\n{text}")
-
-        return "\n\n".join(text_list)
-    except Exception as e:
-        raise RuntimeError(f"读取Excel文件失败: {str(e)}")
-
-
-def read_pptx_to_text(file_path: str) -> str:
-    """读取PPTX文件内容并返回文本"""
-    try:
-        prs = Presentation(file_path)
-        text_list = []
-
-        for slide in prs.slides:
-            slide_text = []
-            for shape in slide.shapes:
-                if hasattr(shape, "text_frame") and shape.has_text_frame:
-                    text_frame = shape.text_frame
-                    if text_frame.text.strip():
-                        slide_text.append(text_frame.text.strip())
-
-            if slide_text:  # 只添加有内容的幻灯片
-                text_list.append("\n".join(slide_text))
-
-        return "\n\n".join(text_list)
-    except Exception as e:
-        raise RuntimeError(f"读取PPTX文件失败: {str(e)}")
-
-
-def read_txt_to_text(file_path: str) -> str:
-    """读取文本文件，自动检测编码"""
-    try:
-        with open(file_path, "rb") as f:
-            raw_data = f.read()
-            encoding = chardet.detect(raw_data)["encoding"] or "utf-8"
-        return raw_data.decode(encoding)
-    except Exception as e:
-        raise RuntimeError(f"读取文本文件失败: {str(e)}")
-
-
-def read_any_file_to_text(file_path: str) -> str:
-    """
-    根据文件扩展名自动选择适当的读取函数
-    返回文件内容文本或错误信息
-    """
-    try:
-        # 修复路径编码问题
-        if isinstance(file_path, bytes):
-            try:
-                file_path = file_path.decode('utf-8')
-            except UnicodeDecodeError:
-                file_path = file_path.decode('latin1')
-        
-        # 标准化路径（处理反斜杠和特殊字符）
-        file_path = os.path.abspath(os.path.normpath(file_path))
-        
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
-            return f"文件不存在: {file_path}"
-            
-        # 获取文件扩展名（小写，不带点）
-        file_ext = get_file_type(file_path)
-        if file_ext is None or file_ext == "":
-            file_ext = os.path.splitext(file_path)[1][1:].lower()
-        if not file_ext:
-            file_ext = "txt"  # 默认文本类型
-
-        # 后续处理逻辑保持不变...
-        func_name = SUPPORTED_EXTENSIONS.get(file_ext)
-        if not func_name:
-            return f"不支持 {file_ext} 格式"
-            
-        # 使用函数映射
-        func_map = {
-            "read_pdf_to_text": read_pdf_to_text,
-            "read_docx_to_text": read_docx_to_text,
-            "read_excel_to_text": read_excel_to_text,
-            "read_pptx_to_text": read_pptx_to_text,
-            "read_txt_to_text": read_txt_to_text,
-            "read_csv_to_text": read_csv_to_text,
-        }
-        
-        func = func_map.get(func_name)
-        if func is None:
-            return f"找不到处理 {file_ext} 文件的函数"
-            
-        return func(file_path)
-        
-    except Exception as e:
-        return f"读取文件时出错: {str(e)}"
+# 共享存储布局下，对话级向量数据库的目录名
+SHARED_STORE_NAME = "_conversation_store"
+# 直接注入的小文件保存全文的文件名
+INLINE_CONTENT_NAME = "content.txt"
+# 解析进程尚未写完临时文件时，再次读取新写入内容的间隔（秒）
+SPOOL_POLL_INTERVAL = 0.2
 
 
 @register("astrbot_plugin_file_reader_pro", "zz6zz666", "一个将文件内容高效传给llm的插件（增强版）", "3.1.0")
@@ -362,6 +78,8 @@ class AstrbotPluginFileReaderPro(Star):
         self.retrieve_top_k = self.config.get("retrieve_top_k", 5)
         self.fetch_k = self.config.get("fetch_k", 20)
         self.enable_rerank = self.config.get("enable_rerank", True)
+        self.rerank_skip_margin = self.config.get("rerank_skip_margin", 0)  # 初检向量相似度差距达到该值时跳过重排序，0表示不启用
+        self.rerank_timeout = self.config.get("rerank_timeout", 5)  # 重排序超时（秒）
         self.file_retention_time = self.config.get("file_retention_time", 60)  # 60分钟
         self.max_file_size = self.config.get("max_file_size", 100)  # 100MB
         self.file_max_rounds = self.config.get("file_max_rounds", 5)  # 文件最大使用轮数
@@ -373,20 +91,84 @@ class AstrbotPluginFileReaderPro(Star):
         self.enabled_groups = self.config.get("enabled_groups", [])  # 启用的群列表
         self.injection_type = self.config.get("injection_type", "system")  # 文件内容注入类型
         self.system_context_keep_rounds = self.config.get("system_context_keep_rounds", 2) # 系统上下文保留轮数
+        self.enable_embedding_cache = self.config.get("enable_embedding_cache", True)  # 是否启用分块嵌入缓存
+        self.embedding_cache_max_size = self.config.get("embedding_cache_max_size", 512)  # 嵌入缓存上限（MB）
+        self.parse_workers = self.config.get("parse_workers", 2)  # 文件解析进程数
+        self.parse_timeout = self.config.get("parse_timeout", 300)  # 单文件解析超时（秒）
+        self.max_concurrent_parses = self.config.get("max_concurrent_parses", 4)  # 同时解析的文件数上限
+        self.enable_streaming_ingest = self.config.get("enable_streaming_ingest", True)  # 是否流式处理PDF和表格
+        self.stream_page_batch = self.config.get("stream_page_batch", 8)  # 流式处理PDF时每解析多少页交给嵌入一次
+        self.ingest_batch_size = self.config.get("ingest_batch_size", 64)  # 每次写入向量数据库的块数
+        self.retrieve_concurrency = self.config.get("retrieve_concurrency", 4)  # 同时检索的文件数上限
+        self.retrieve_timeout = self.config.get("retrieve_timeout", 10)  # 单个文件检索超时（秒）
+        self.query_cache_ttl = self.config.get("query_cache_ttl", 600)  # 查询向量缓存有效期（秒）
+        self.query_cache_size = self.config.get("query_cache_size", 32)  # 每个对话缓存的查询向量数
+        self.retrieval_mode = self.config.get("retrieval_mode", "per_file")  # 检索模式（逐文件/合并）
+        self.storage_layout = self.config.get("storage_layout", "per_file")  # 向量数据库存储布局
+        self.max_open_vector_dbs = self.config.get("max_open_vector_dbs", 64)  # 同时打开的向量数据库数上限
+        self.vector_db_memory_budget = self.config.get("vector_db_memory_budget", 1024)  # 向量索引常驻内存上限（MB）
+        self.rounds_flush_interval = self.config.get("rounds_flush_interval", 300)  # 使用轮数批量落盘间隔（毫秒）
+        self.embedding_parallel_batches = self.config.get("embedding_parallel_batches", 2)  # 同时嵌入的批次数
+        self.embedding_rate_limit = self.config.get("embedding_rate_limit", 0)  # 嵌入请求速率上限（批/分钟）
+        self.embedding_max_retries = self.config.get("embedding_max_retries", 3)  # 单批嵌入失败重试次数
+        self.ingest_progress_interval = self.config.get("ingest_progress_interval", 30)  # 处理进度消息间隔（秒）
+        self.ingest_workers = self.config.get("ingest_workers", 4)  # 同时处理的文件数
+        self.max_queued_size = self.config.get("max_queued_size", 500)  # 排队文件总大小上限（MB）
+        self.inline_token_budget = self.config.get("inline_token_budget", 2000)  # 直接注入全文的小文件token上限
+        self.structured_chunking = self.config.get("structured_chunking", True)  # 是否按文件结构分块
+        self.enable_chunk_dedup = self.config.get("enable_chunk_dedup", True)  # 是否在嵌入前去除重复分块
+        self.dedup_threshold = self.config.get("dedup_threshold", 0.98)  # 近似重复分块的相似度阈值
+        self.retrieval_strategy = self.config.get("retrieval_strategy", "vector")  # 检索策略（向量/混合/关键词）
+        self.embedding_latency_budget = self.config.get("embedding_latency_budget", 5)  # 查询嵌入耗时上限（秒）
+        self.retrieval_cache_ttl = self.config.get("retrieval_cache_ttl", 300)  # 检索结果缓存有效期（秒），0表示禁用
+        self.retrieval_cache_size = self.config.get("retrieval_cache_size", 16)  # 每个对话缓存的检索结果数
+        self.context_token_budget = self.config.get("context_token_budget", 4000)  # 注入检索片段的token上限
         
         # 初始化数据目录
         self._base_dir = Path(__file__).resolve().parent
         self._data_dir = self._resolve_data_dir()
         
+        # 初始化分块嵌入缓存（跨会话、跨对话共享）
+        self.embedding_cache = None
+        if self.enable_embedding_cache:
+            self._init_embedding_cache()
+        
+        # 查询向量缓存（按对话隔离，仅保存在内存中）
+        self.query_cache = QueryEmbeddingCache(self.query_cache_ttl, self.query_cache_size)
+        self.retrieval_cache = RetrievalCache(self.retrieval_cache_ttl, self.retrieval_cache_size)
+        self.rerank_policy = RerankPolicy(self.rerank_skip_margin, self.rerank_timeout)
+        
+        # 文件解析进程池（解析在子进程中进行，不阻塞事件循环）
+        self.parse_pool = ParsePool(self.parse_workers, self.parse_timeout, self.max_concurrent_parses)
+        
+        # 文件处理队列（后台工作协程按会话轮流处理上传的文件）
+        self.ingest_queue = IngestQueue(self._run_file_job, self.ingest_workers, self.max_queued_size * 1024 * 1024)
+        
         # 使用配置初始化分块器
         self.chunker = RecursiveCharacterChunker(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
         
+        # 按文件类型选择分块器：源代码按顶层定义、Markdown 按标题、演示文稿按幻灯片切分，其余类型使用递归分块器
+        if self.structured_chunking:
+            self.chunkers = create_chunker_registry(self.chunker, self.chunk_size)
+        else:
+            self.chunkers = ChunkerRegistry(self.chunker)
+        
+        # 分批嵌入器（所有会话共用同一个限速器）
+        self.embedding_limiter = TokenBucket(self.embedding_rate_limit / 60, self.embedding_parallel_batches)
+        self.ingest_embedder = IngestEmbedder(
+            self.ingest_batch_size,
+            self.embedding_parallel_batches,
+            self.embedding_limiter,
+            self.embedding_max_retries
+        )
+        
         # 当前活跃的会话和对话信息
         self.current_session_id = None
         self.current_conversation_id = None
         
-        # 向量数据库实例字典，键为(session_id, conversation_id, file_name)
-        self.vec_dbs = {}
+        # 文件登记表，按 会话 -> 对话 -> 文件 索引，值为该文件所在向量数据库的目录
+        # 打开的向量数据库实例由句柄池按目录管理，共享布局下同一对话的文件指向同一目录
+        self.vec_dbs = FileRegistry()
         
         # 定期清理任务相关
         self._cleanup_task = None
@@ -394,6 +176,23 @@ class AstrbotPluginFileReaderPro(Star):
         
         # 初始化文件使用次数数据库连接
         self._init_file_rounds_db()
+        
+        # 文件过期调度器（过期时间最小堆，使用轮数从内存镜像读取）
+        self.expiry = ExpiryScheduler(
+            self.file_retention_time * 60,
+            self.file_max_rounds,
+            lambda key: self._get_file_rounds(*key)
+        )
+        
+        # 从文件清单恢复已存储的文件（只读取清单，向量数据库在首次检索时才打开）
+        self._init_manifest()
+        
+        # 已打开向量数据库的句柄池（限制打开数量和常驻内存）
+        self.vector_db_pool = VectorDBPool(
+            self._create_faiss_db,
+            self.max_open_vector_dbs,
+            self.vector_db_memory_budget * 1024 * 1024
+        )
     
     def _load_config(self, config=None):
         """加载插件配置"""
@@ -412,12 +211,46 @@ class AstrbotPluginFileReaderPro(Star):
             "retrieve_top_k": 5,
             "fetch_k": 20,
             "enable_rerank": True,
+            "rerank_skip_margin": 0,  # 初检向量相似度差距达到该值时跳过重排序，0表示不启用
+            "rerank_timeout": 5,  # 重排序超时（秒）
             "file_retention_time": 60,  # 60分钟
             "max_file_size": 100,  # 100MB
             "file_max_rounds": 5,  # 文件最大使用轮数
             "supported_file_types": list(SUPPORTED_EXTENSIONS.keys()),
             "rerank_provider_id": "",  # 重排序模型服务商
-            "embedding_provider_id": ""  # Embedding服务提供商
+            "embedding_provider_id": "",  # Embedding服务提供商
+            "enable_embedding_cache": True,  # 是否启用分块嵌入缓存
+            "embedding_cache_max_size": 512,  # 嵌入缓存上限（MB）
+            "parse_workers": 2,  # 文件解析进程数
+            "parse_timeout": 300,  # 单文件解析超时（秒）
+            "max_concurrent_parses": 4,  # 同时解析的文件数上限
+            "enable_streaming_ingest": True,  # 是否流式处理PDF和表格
+            "stream_page_batch": 8,  # 流式处理PDF时每解析多少页交给嵌入一次
+            "ingest_batch_size": 64,  # 每次写入向量数据库的块数
+            "retrieve_concurrency": 4,  # 同时检索的文件数上限
+            "retrieve_timeout": 10,  # 单个文件检索超时（秒）
+            "query_cache_ttl": 600,  # 查询向量缓存有效期（秒）
+            "query_cache_size": 32,  # 每个对话缓存的查询向量数
+            "retrieval_mode": "per_file",  # 检索模式（逐文件/合并）
+            "storage_layout": "per_file",  # 向量数据库存储布局
+            "max_open_vector_dbs": 64,  # 同时打开的向量数据库数上限
+            "vector_db_memory_budget": 1024,  # 向量索引常驻内存上限（MB）
+            "rounds_flush_interval": 300,  # 使用轮数批量落盘间隔（毫秒）
+            "embedding_parallel_batches": 2,  # 同时嵌入的批次数
+            "embedding_rate_limit": 0,  # 嵌入请求速率上限（批/分钟）
+            "embedding_max_retries": 3,  # 单批嵌入失败重试次数
+            "ingest_progress_interval": 30,  # 处理进度消息间隔（秒）
+            "ingest_workers": 4,  # 同时处理的文件数
+            "max_queued_size": 500,  # 排队文件总大小上限（MB）
+            "inline_token_budget": 2000,  # 直接注入全文的小文件token上限
+            "structured_chunking": True,  # 是否按文件结构分块
+            "enable_chunk_dedup": True,  # 是否在嵌入前去除重复分块
+            "dedup_threshold": 0.98,  # 近似重复分块的相似度阈值
+            "retrieval_strategy": "vector",  # 检索策略（向量/混合/关键词）
+            "embedding_latency_budget": 5,  # 查询嵌入耗时上限（秒）
+            "retrieval_cache_ttl": 300,  # 检索结果缓存有效期（秒），0表示禁用
+            "retrieval_cache_size": 16,  # 每个对话缓存的检索结果数
+            "context_token_budget": 4000  # 注入检索片段的token上限
         }
         
         # 用默认配置填充缺失的配置项
@@ -444,36 +277,67 @@ class AstrbotPluginFileReaderPro(Star):
         return fallback_dir
         
     def _init_file_rounds_db(self):
-        """初始化文件使用次数数据库"""
+        """初始化文件使用次数存储（读取走内存镜像，写入由后台线程合并后批量落盘）"""
         # 数据库文件路径
         self._db_path = self._data_dir / "file_rounds.db"
         
         try:
-            # 保持数据库连接打开以提高性能
-            self._db_conn = sqlite3.connect(self._db_path)
-            cursor = self._db_conn.cursor()
-            
-            # 创建文件使用次数表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS file_rounds (
-                    session_id TEXT NOT NULL,
-                    conversation_id TEXT NOT NULL,
-                    file_name TEXT NOT NULL,
-                    rounds INTEGER DEFAULT 0,
-                    PRIMARY KEY (session_id, conversation_id, file_name)
-                )
-            ''')
-            
-            # 创建索引以提高查询性能
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_file_rounds_session_conversation ON file_rounds (session_id, conversation_id)
-            ''')
-            
-            self._db_conn.commit()
+            self.file_rounds = FileRoundsStore(self._db_path, self.rounds_flush_interval / 1000)
             logger.info(f"文件使用次数数据库初始化成功，路径：{self._db_path}")
         except Exception as e:
             logger.error(f"初始化文件使用次数数据库失败: {str(e)}")
-            self._db_conn = None
+            self.file_rounds = None
+            
+    def _init_manifest(self):
+        """初始化文件清单，并据此登记重启前已存储的文件"""
+        self.manifest = FileManifest(self._data_dir / "file_manifest.db")
+        if self.manifest.created:
+            self._import_legacy_stores()
+        
+        entries = self.manifest.entries()
+        for entry in entries:
+            key = (entry.session_id, entry.conversation_id, entry.file_name)
+            self.vec_dbs[key] = self._data_dir / entry.store_dir
+            if entry.inline:
+                # 全文在首次提问时才从磁盘读取
+                self.vec_dbs.set_inline(key)
+            self.expiry.add(key, entry.upload_time)
+        if entries:
+            logger.info(f"从文件清单恢复了 {len(entries)} 个文件，向量数据库将在首次检索时打开")
+    
+    def _import_legacy_stores(self):
+        """首次创建清单时，登记旧版本遗留在数据目录中的逐文件向量数据库（仅执行一次）"""
+        legacy_entries = []
+        for session_dir in self._data_dir.iterdir():
+            if not session_dir.is_dir():
+                continue
+            for conversation_dir in session_dir.iterdir():
+                if not conversation_dir.is_dir():
+                    continue
+                for store_dir in conversation_dir.iterdir():
+                    if not (store_dir / "doc.db").exists():
+                        continue
+                    original_name, upload_time = self._parse_timestamped_filename(store_dir.name)
+                    if upload_time is None:
+                        continue
+                    size_bytes = sum(f.stat().st_size for f in store_dir.iterdir() if f.is_file())
+                    legacy_entries.append(ManifestEntry(
+                        session_dir.name, conversation_dir.name, store_dir.name, original_name,
+                        upload_time, size_bytes, 0, store_dir.relative_to(self._data_dir).as_posix()
+                    ))
+        if legacy_entries:
+            self.manifest.add_many(legacy_entries)
+            logger.info(f"已将 {len(legacy_entries)} 个旧版向量数据库登记到文件清单")
+
+    def _init_embedding_cache(self):
+        """初始化分块嵌入缓存数据库"""
+        cache_path = self._data_dir / "embedding_cache.db"
+        try:
+            self.embedding_cache = EmbeddingCache(cache_path, self.embedding_cache_max_size * 1024 * 1024)
+            logger.info(f"分块嵌入缓存初始化成功，路径：{cache_path}")
+        except Exception as e:
+            logger.error(f"初始化分块嵌入缓存失败: {str(e)}")
+            self.embedding_cache = None
             
     async def _start_periodic_cleanup(self):
         """启动定期清理任务"""
@@ -482,11 +346,12 @@ class AstrbotPluginFileReaderPro(Star):
         
         async def cleanup_loop():
             while True:
-                await asyncio.sleep(cleanup_interval_seconds)
+                # 在下一个文件到期时醒来，最长等待一个清理间隔
+                await self.expiry.wait(cleanup_interval_seconds)
                 await self._cleanup_expired_files()
         
         self._cleanup_task = asyncio.create_task(cleanup_loop())
-        logger.info(f"已启动定期清理任务，间隔：{self.cleanup_interval}分钟")
+        logger.info(f"已启动过期清理任务，最长唤醒间隔：{self.cleanup_interval}分钟")
         
     async def _stop_periodic_cleanup(self):
         """停止定期清理任务"""
@@ -499,14 +364,10 @@ class AstrbotPluginFileReaderPro(Star):
             logger.info("已停止定期清理任务")
             
     async def _cleanup_expired_files(self):
-        """清理所有过期文件"""
-        logger.info("开始执行定期清理任务")
+        """清理所有过期文件（只处理过期时间已到的文件，轮数用完的文件在请求时即已清理）"""
+        logger.debug("开始执行过期清理任务")
         
-        # 遍历所有向量数据库实例
-        keys_to_cleanup = []
-        for (session_id, conversation_id, file_name), vec_db in list(self.vec_dbs.items()):
-            if self._is_file_expired(session_id, conversation_id, file_name):
-                keys_to_cleanup.append((session_id, conversation_id, file_name))
+        keys_to_cleanup = self.expiry.pop_expired()
         
         # 清理过期文件
         if keys_to_cleanup:
@@ -514,75 +375,26 @@ class AstrbotPluginFileReaderPro(Star):
             for session_id, conversation_id, file_name in keys_to_cleanup:
                 await self.cleanup(session_id, conversation_id, file_name)
         else:
-            logger.info("未发现过期文件")
+            logger.debug("未发现过期文件")
+        logger.debug(self._format_pool_stats())
             
     def _get_file_rounds(self, session_id: str, conversation_id: str, file_name: str) -> int:
         """获取文件的使用次数"""
-        if not self._db_conn:
+        if not self.file_rounds:
             return 0
+        return self.file_rounds.get((session_id, conversation_id, file_name))
             
-        try:
-            cursor = self._db_conn.cursor()
-            
-            cursor.execute(
-                "SELECT rounds FROM file_rounds WHERE session_id=? AND conversation_id=? AND file_name=?",
-                (session_id, conversation_id, file_name)
-            )
-            
-            result = cursor.fetchone()
-            return result[0] if result else 0
-        except Exception as e:
-            logger.error(f"获取文件使用次数失败: {str(e)}")
+    def _increment_file_rounds(self, session_id: str, conversation_id: str, file_name: str) -> int:
+        """增加文件的使用次数，返回新的使用次数"""
+        if not self.file_rounds:
             return 0
+        return self.file_rounds.increment((session_id, conversation_id, file_name))
             
-    def _increment_file_rounds(self, session_id: str, conversation_id: str, file_name: str):
-        """增加文件的使用次数"""
-        if not self._db_conn:
-            return
-            
-        try:
-            cursor = self._db_conn.cursor()
-            
-            # 使用upsert操作，不存在则插入，存在则更新
-            cursor.execute(
-                "INSERT OR REPLACE INTO file_rounds (session_id, conversation_id, file_name, rounds) VALUES (?, ?, ?, COALESCE((SELECT rounds + 1 FROM file_rounds WHERE session_id=? AND conversation_id=? AND file_name=?), 1))",
-                (session_id, conversation_id, file_name, session_id, conversation_id, file_name)
-            )
-            
-            self._db_conn.commit()
-        except Exception as e:
-            logger.error(f"增加文件使用次数失败: {str(e)}")
-            
-    def _delete_file_rounds(self, session_id: str, conversation_id: str, file_name: str = None):
+    def _delete_file_rounds(self, session_id: str, conversation_id: str = None, file_name: str = None):
         """删除文件的使用次数记录"""
-        if not self._db_conn:
+        if not self.file_rounds:
             return
-            
-        try:
-            cursor = self._db_conn.cursor()
-            
-            if file_name:
-                # 删除特定文件的记录
-                cursor.execute(
-                    "DELETE FROM file_rounds WHERE session_id=? AND conversation_id=? AND file_name=?",
-                    (session_id, conversation_id, file_name)
-                )
-            elif conversation_id:
-                # 删除整个对话的所有文件记录
-                cursor.execute(
-                    "DELETE FROM file_rounds WHERE session_id=? AND conversation_id=?",
-                    (session_id, conversation_id)
-                )
-            elif session_id:
-                # 删除整个会话的所有文件记录
-                cursor.execute(
-                    "DELETE FROM file_rounds WHERE session_id=?",
-                    (session_id,)
-                )
-            
-            self._db_conn.commit()
-        except Exception as e:
-            logger.error(f"删除文件使用次数记录失败: {str(e)}")
+        self.file_rounds.delete(session_id, conversation_id, file_name)
     
     def _get_session_id(self, event: AstrMessageEvent) -> str:
         """获取会话ID（统一消息来源）"""
@@ -625,24 +437,8 @@ class AstrbotPluginFileReaderPro(Star):
         return timestamped_name, None
     
     def _is_file_expired(self, session_id: str, conversation_id: str, file_name: str) -> bool:
-        """检查单个文件是否过期（时间和轮数）"""
-        # 从文件名解析时间戳
-        _, upload_time = self._parse_timestamped_filename(file_name)
-        if upload_time is None:
-            # 如果无法解析时间戳，认为文件已过期
-            return True
-        
-        # 检查时间是否过期
-        retention_time = self.file_retention_time * 60  # 转换为秒
-        current_time = time.time()
-        time_expired = (current_time - upload_time) > retention_time
-        
-        # 检查轮数是否过期
-        max_rounds = self.file_max_rounds
-        current_rounds = self._get_file_rounds(session_id, conversation_id, file_name)
-        rounds_expired = current_rounds >= max_rounds
-        
-        return time_expired or rounds_expired
+        """检查单个文件是否过期（时间和轮数），由过期调度器在内存中O(1)判断"""
+        return self.expiry.is_expired((session_id, conversation_id, file_name))
 
     async def _cleanup_unauthorized_group_files(self):
         """清理非启用群聊的文件数据库"""
@@ -650,44 +446,40 @@ class AstrbotPluginFileReaderPro(Star):
             # 使用集合存储已经处理过的会话ID，避免重复清理
             processed_sessions = set()
             
-            # 直接遍历数据目录下的所有会话ID目录
-            if self._data_dir.exists():
-                for session_dir in self._data_dir.iterdir():
-                    if session_dir.is_dir():
-                        session_id = session_dir.name
-                        
-                        # 如果该会话已经处理过，跳过
-                        if session_id in processed_sessions:
-                            continue
-                        
-                        # 尝试从会话ID中提取群聊ID
-                        group_id = None
-                        
-                        # 检查是否为群聊会话（格式：适配器名称:GroupMessage:12345678）
-                        if "GroupMessage" in session_id:
-                            # 格式：适配器名称:GroupMessage:12345678
-                            try:
-                                parts = session_id.split(":")
-                                if len(parts) >= 3:
-                                    group_id = parts[2]
-                            except Exception:
-                                pass
-                        
-                        # 如果能够提取到群聊ID，认为是群聊会话
-                        if group_id:
-                            # 如果群聊文件处理被禁用，清理该群聊会话
-                            if not self.enable_group_file_processing:
-                                logger.info(f"群聊文件处理已禁用，清理群聊会话 {session_id} 的所有文件")
-                                await self.cleanup_all_session_files(session_id)
-                                processed_sessions.add(session_id)
-                                continue
-                            
-                            # 如果配置了群聊白名单，检查群聊ID是否在白名单中
-                            if self.enabled_groups:
-                                if str(group_id) not in [str(g) for g in self.enabled_groups]:
-                                    logger.info(f"群聊 {group_id} 不在白名单中，清理会话 {session_id} 的所有文件")
-                                    await self.cleanup_all_session_files(session_id)
-                                    processed_sessions.add(session_id)
+            # 从文件清单中获取所有存有文件的会话ID，无需遍历数据目录
+            for session_id in self.manifest.sessions():
+                # 如果该会话已经处理过，跳过
+                if session_id in processed_sessions:
+                    continue
+                
+                # 尝试从会话ID中提取群聊ID
+                group_id = None
+                
+                # 检查是否为群聊会话（格式：适配器名称:GroupMessage:12345678）
+                if "GroupMessage" in session_id:
+                    # 格式：适配器名称:GroupMessage:12345678
+                    try:
+                        parts = session_id.split(":")
+                        if len(parts) >= 3:
+                            group_id = parts[2]
+                    except Exception:
+                        pass
+                
+                # 如果能够提取到群聊ID，认为是群聊会话
+                if group_id:
+                    # 如果群聊文件处理被禁用，清理该群聊会话
+                    if not self.enable_group_file_processing:
+                        logger.info(f"群聊文件处理已禁用，清理群聊会话 {session_id} 的所有文件")
+                        await self.cleanup_all_session_files(session_id)
+                        processed_sessions.add(session_id)
+                        continue
+                    
+                    # 如果配置了群聊白名单，检查群聊ID是否在白名单中
+                    if self.enabled_groups:
+                        if str(group_id) not in [str(g) for g in self.enabled_groups]:
+                            logger.info(f"群聊 {group_id} 不在白名单中，清理会话 {session_id} 的所有文件")
+                            await self.cleanup_all_session_files(session_id)
+                            processed_sessions.add(session_id)
         except Exception as e:
             logger.error(f"清理非启用群聊文件失败: {str(e)}")
     
@@ -744,6 +536,10 @@ class AstrbotPluginFileReaderPro(Star):
                 return False
             
             logger.info(f"使用的嵌入提供者: {self.embedding_provider.__class__.__name__}")
+            
+            # 使用缓存包装嵌入提供者，重复的分块不再请求嵌入服务
+            if self.embedding_cache:
+                self.embedding_provider = CachedEmbeddingProvider(self.embedding_provider, self.embedding_cache)
             if self.rerank_provider:
                 logger.info(f"使用的重排序提供者: {self.rerank_provider.__class__.__name__}")
             else:
@@ -759,40 +555,83 @@ class AstrbotPluginFileReaderPro(Star):
             logger.error(f"初始化提供者失败: {str(e)}")
             return False
     
-    async def get_or_create_vector_db(self, session_id: str, conversation_id: str, file_name: str):
-        """获取或创建向量数据库（按会话、对话和文件名隔离）"""
+    def _vector_db_dir(self, session_id: str, conversation_id: str, file_name: str) -> Path:
+        """返回新文件的向量数据库目录（共享布局下同一对话的文件共用一个目录）"""
+        if self.storage_layout == "per_conversation":
+            return self._data_dir / session_id / conversation_id / SHARED_STORE_NAME
+        return self._data_dir / session_id / conversation_id / file_name
+
+    async def _create_faiss_db(self, vec_db_dir: Path):
+        """在指定目录打开FAISS向量数据库（目录由创建文件时建立，已被清理的目录不会重新创建）"""
+        if not vec_db_dir.is_dir():
+            raise FileNotFoundError(f"向量数据库目录不存在: {vec_db_dir}")
+        vec_db = FaissVecDB(
+            doc_store_path=str(vec_db_dir / "doc.db"),
+            index_store_path=str(vec_db_dir / "index.faiss"),
+            embedding_provider=self.embedding_provider,
+            rerank_provider=self.rerank_provider
+        )
+        await vec_db.initialize()
+        return vec_db
+
+    async def get_or_create_vector_db(self, session_id: str, conversation_id: str, file_name: str, file_size: int = 0, source_hash: str = ""):
+        """获取或创建向量数据库（按会话、对话和文件名隔离），返回其目录，失败时返回 None
+        
+        storage_layout 为 per_conversation 时，同一对话的所有文件共用一个向量数据库，
+        分块通过元数据中的 db_file 区分所属文件。
+        句柄由句柄池管理，随时可能被淘汰，使用时通过 _use_vector_db 取得。
+        """
         if not self.embedding_provider:
             logger.error("嵌入提供者未初始化，无法创建向量数据库")
             return None
         
         db_key = (session_id, conversation_id, file_name)
         
-        # 如果已存在该会话/对话/文件的向量数据库，直接返回
+        # 如果已存在该会话/对话/文件的向量数据库，直接返回（从清单恢复的文件在使用时才打开）
         if db_key in self.vec_dbs:
             return self.vec_dbs[db_key]
         
         try:
-            # 创建向量数据库目录（使用标准数据目录）
-            vec_db_dir = self._data_dir / session_id / conversation_id / file_name
+            vec_db_dir = self._vector_db_dir(session_id, conversation_id, file_name)
             vec_db_dir.mkdir(parents=True, exist_ok=True)
+            # 打开一次以新建数据库文件
+            async with self._use_vector_db(vec_db_dir):
+                pass
+            self.vec_dbs[db_key] = vec_db_dir
             
-            # 初始化向量数据库
-            vec_db = FaissVecDB(
-                doc_store_path=str(vec_db_dir / "doc.db"),
-                index_store_path=str(vec_db_dir / "index.faiss"),
-                embedding_provider=self.embedding_provider,
-                rerank_provider=self.rerank_provider
-            )
-            await vec_db.initialize()
-            
-            # 将向量数据库实例添加到字典中
-            self.vec_dbs[db_key] = vec_db
+            # 记录到文件清单，重启后可恢复
+            original_name, upload_time = self._parse_timestamped_filename(file_name)
+            self.expiry.add(db_key, upload_time or time.time())
+            self.manifest.add(ManifestEntry(
+                session_id, conversation_id, file_name, original_name, upload_time or int(time.time()),
+                file_size, 0, vec_db_dir.relative_to(self._data_dir).as_posix(), source_hash, False
+            ))
             logger.info(f"为会话 {session_id} 对话 {conversation_id} 文件 {file_name} 创建向量数据库成功")
-            return vec_db
+            return vec_db_dir
         except Exception as e:
+            self.vec_dbs.pop(db_key, None)
+            self.expiry.remove(db_key)
             logger.error(f"初始化向量数据库失败: {str(e)}")
             return None
 
+    @asynccontextmanager
+    async def _use_vector_db(self, vec_db_dir: Path):
+        """从句柄池取得向量数据库，使用期间不会被淘汰"""
+        vec_db = await self.vector_db_pool.acquire(vec_db_dir)
+        try:
+            yield vec_db
+        finally:
+            await self.vector_db_pool.release(vec_db_dir)
+
+    async def _close_vector_dbs(self, keys: list):
+        """从登记表移除文件，并关闭不再被任何文件引用的向量数据库"""
+        for key in keys:
+            self.expiry.remove(key)
+        dirs = {self.vec_dbs.pop(key) for key in keys if key in self.vec_dbs}
+        for vec_db_dir in dirs:
+            if not self.vec_dbs.dir_refs(vec_db_dir):
+                await self.vector_db_pool.close(vec_db_dir)
+
     async def cleanup(self, session_id: str = None, conversation_id: str = None, file_name: str = None):
         """清理资源
         
@@ -813,20 +652,33 @@ class AstrbotPluginFileReaderPro(Star):
             # 清理单个文件
             key = (session_id, conversation_id, file_name)
             if key in self.vec_dbs:
-                vec_db = self.vec_dbs[key]
-                await vec_db.close()
+                vec_db_dir = self.vec_dbs[key]
+                
+                if self.vec_dbs.dir_refs(vec_db_dir) > 1:
+                    # 共享向量数据库中还有其他文件：按元数据删除该文件的分块，保留数据库
+                    try:
+                        async with self._use_vector_db(vec_db_dir) as vec_db:
+                            await delete_by_metadata(vec_db, {"db_file": file_name})
+                        await asyncio.to_thread(LexicalIndex(vec_db_dir / LEXICAL_DB_NAME).delete_file, file_name)
+                    except Exception as e:
+                        logger.error(f"从共享向量数据库删除文件 {file_name} 失败: {str(e)}")
+                    del self.vec_dbs[key]
+                    self.expiry.remove(key)
+                    vec_db_dir = None
+                else:
+                    await self._close_vector_dbs([key])
                 
                 # 删除向量数据库文件
                 try:
-                    vec_db_dir = self._data_dir / session_id / conversation_id / file_name
-                    if vec_db_dir.exists():
+                    if vec_db_dir and vec_db_dir.exists():
                         import shutil
                         shutil.rmtree(vec_db_dir)
                 except Exception as e:
                     logger.error(f"清理向量数据库文件失败: {str(e)}")
                 
-                # 从字典中移除
-                del self.vec_dbs[key]
+                # 从文件清单中移除
+                self.manifest.remove(session_id, conversation_id, file_name)
+                self.retrieval_cache.forget(session_id, conversation_id, file_name)
                 
                 # 从数据库中删除该文件的使用次数记录
                 self._delete_file_rounds(session_id, conversation_id, file_name)
@@ -834,15 +686,10 @@ class AstrbotPluginFileReaderPro(Star):
                 logger.info(f"已清理会话 {session_id} 对话 {conversation_id} 的文件 {file_name} 向量数据库")
         elif conversation_id:
             # 清理整个对话
-            keys_to_remove = []
-            for (db_session_id, db_conversation_id, db_file_name), vec_db in self.vec_dbs.items():
-                if db_session_id == session_id and db_conversation_id == conversation_id:
-                    await vec_db.close()
-                    keys_to_remove.append((db_session_id, db_conversation_id, db_file_name))
+            keys_to_remove = self.vec_dbs.conversation_keys(session_id, conversation_id)
             
-            # 从字典中移除
-            for key in keys_to_remove:
-                del self.vec_dbs[key]
+            # 关闭并从字典中移除
+            await self._close_vector_dbs(keys_to_remove)
             
             # 删除对话目录
             try:
@@ -855,6 +702,9 @@ class AstrbotPluginFileReaderPro(Star):
             
             # 从数据库中删除该对话的所有文件使用次数记录
             self._delete_file_rounds(session_id, conversation_id)
+            self.manifest.remove(session_id, conversation_id)
+            self.query_cache.drop(session_id, conversation_id)
+            self.retrieval_cache.drop(session_id, conversation_id)
             
             logger.info(f"已清理会话 {session_id} 对话 {conversation_id} 的所有文件")
         else:
@@ -867,16 +717,22 @@ class AstrbotPluginFileReaderPro(Star):
     async def cleanup_all_session_files(self, session_id):
         """清理指定会话的所有文件"""
         try:
+            # 取消该会话下仍在排队或处理中的文件
+            cancelled_jobs = self.ingest_queue.cancel_session(session_id)
+            if cancelled_jobs:
+                logger.info(f"已取消会话 {session_id} 的 {cancelled_jobs} 个文件处理任务")
+            cancelled = self.parse_pool.cancel_session(session_id)
+            if cancelled:
+                logger.info(f"已取消会话 {session_id} 的 {cancelled} 个解析任务")
+            
             # 关闭并删除该会话下的所有向量数据库实例
-            keys_to_remove = []
-            for (db_session_id, db_conversation_id, db_file_name), vec_db in self.vec_dbs.items():
-                if db_session_id == session_id:
-                    await vec_db.close()
-                    keys_to_remove.append((db_session_id, db_conversation_id, db_file_name))
+            keys_to_remove = self.vec_dbs.session_keys(session_id)
             
-            # 从字典中移除已关闭的向量数据库实例
-            for key in keys_to_remove:
-                del self.vec_dbs[key]
+            # 关闭并从字典中移除向量数据库实例
+            await self._close_vector_dbs(keys_to_remove)
+            self.manifest.remove(session_id)
+            self.query_cache.drop(session_id)
+            self.retrieval_cache.drop(session_id)
             
             # 删除该会话下的所有对话文件
             session_dir = self._data_dir / session_id
@@ -907,6 +763,213 @@ class AstrbotPluginFileReaderPro(Star):
         self.file_upload_time = None
         yield event.plain_result(f"已清理当前用户的所有文件，可以上传新文件了😊")
 
+    async def _index_file(self, session_id: str, vec_db_dir: Path, file_path: str, content: str, base_metadata: dict,
+                          stream_kind: Optional[str], file_ext: str = "", resume: bool = False, progress=None) -> int:
+        """将文件内容分批嵌入并写入向量数据库，返回该文件的块数（写入期间句柄不会被句柄池淘汰）
+        
+        stream_kind 为 "pdf"、"table" 或 "text" 时边解析边嵌入（content 为空），为 None 时对 content 分块；
+        resume 为真时跳过上次已写入的分块，从断点继续。
+        """
+        async with self._use_vector_db(vec_db_dir) as vec_db:
+            # 同时在 doc.db 旁建立 BM25 关键词索引
+            lexical = LexicalIndex(vec_db_dir / LEXICAL_DB_NAME)
+            skip = set()
+            if resume:
+                skip = await indexed_chunk_indexes(vec_db, base_metadata["db_file"], lexical)
+                logger.info(f"文件 {base_metadata['file_name']} 已写入 {len(skip)} 个块，从断点继续")
+            
+            if stream_kind == "pdf":
+                items = self._stream_pdf_chunks(session_id, file_path, base_metadata)
+                total = None
+            elif stream_kind == "table":
+                items = self._stream_table_chunks(session_id, file_path, file_ext, base_metadata)
+                total = None
+            elif stream_kind == "text":
+                items = self._stream_text_chunks(session_id, file_path, file_ext, base_metadata)
+                total = None
+            else:
+                # 将文件内容分块
+                chunks = await self.chunkers.get(file_ext).chunk(content)
+                logger.info(f"文件分块完成，共{len(chunks)}个块")
+                items = [(i, chunk, {**base_metadata, "chunk_index": i}) for i, chunk in enumerate(chunks)]
+                total = len(chunks)
+            
+            # 去除同一文件中完全相同或近似重复的分块（如每页重复的页眉页脚），被去除的分块只记录元数据
+            dedup = ChunkDeduplicator(self.dedup_threshold) if self.enable_chunk_dedup else None
+            chunk_count = await self.ingest_embedder.ingest(
+                self.embedding_provider, vec_db, items, skip, total, progress, dedup, lexical
+            )
+            if dedup and dedup.suppressed:
+                logger.info(f"文件 {base_metadata['file_name']} 去除了 {dedup.suppressed}/{chunk_count} 个重复分块")
+            return chunk_count
+
+    async def _stream_pdf_chunks(self, session_id: str, file_path: str, base_metadata: dict):
+        """逐页流式解析PDF并依次产生分块 (chunk_index, 文本, 元数据)
+        
+        整个文件在一个解析任务中只打开、解析一遍，逐页写入临时文件；
+        每解析完 stream_page_batch 页即可开始嵌入，解析与嵌入并行，内存占用与文档总页数无关。
+        """
+        file_name = base_metadata["file_name"]
+        logger.info(f"开始流式处理PDF文件 {file_name}")
+        chunk_index = 0
+        records = self._spooled_records(
+            session_id, file_name, spool_pdf_pages, file_path, max(1, self.stream_page_batch)
+        )
+        try:
+            async for record in records:
+                if not record["text"].strip():
+                    continue
+                for chunk in await self.chunker.chunk(record["text"]):
+                    yield chunk_index, chunk, {**base_metadata, "chunk_index": chunk_index, "page": record["page"]}
+                    chunk_index += 1
+        finally:
+            await records.aclose()
+        
+        logger.info(f"PDF文件 {file_name} 流式解析完成，共{chunk_index}个块")
+
+    async def _spooled_records(self, session_id: str, file_name: str, parse_func, *args):
+        """在解析进程中运行 parse_func(*args, spool_path) 把解析结果写入JSONL临时文件，同时分批读回逐条返回
+        
+        解析结果不经过进程间传输，也不会整体驻留内存；解析进程写入的同时即可处理已写入的记录。
+        """
+        fd, spool_path = tempfile.mkstemp(prefix="file_reader_", suffix=".jsonl")
+        os.close(fd)
+        parse_task = asyncio.ensure_future(self.parse_pool.run(session_id, parse_func, *args, spool_path))
+        try:
+            with open(spool_path, encoding="utf-8") as spool:
+                partial = ""
+                
+                def read_lines():
+                    # 只返回完整的行，解析进程写了一半的行留到下次
+                    nonlocal partial
+                    lines = []
+                    while len(lines) < 256:
+                        line = spool.readline()
+                        if not line:
+                            break
+                        partial += line
+                        if partial.endswith("\n"):
+                            lines.append(partial)
+                            partial = ""
+                    return lines
+                
+                while True:
+                    finished = parse_task.done()
+                    lines = await asyncio.to_thread(read_lines)
+                    for line in lines:
+                        yield json.loads(line)
+                    if lines:
+                        continue
+                    if finished:
+                        break
+                    await asyncio.wait({parse_task}, timeout=SPOOL_POLL_INTERVAL)
+            record_count = await parse_task
+            logger.info(f"文件 {file_name} 解析完成，共{record_count}段")
+        finally:
+            if not parse_task.done():
+                parse_task.cancel()
+                await asyncio.gather(parse_task, return_exceptions=True)
+            try:
+                os.remove(spool_path)
+            except OSError:
+                pass
+
+    async def _stream_table_chunks(self, session_id: str, file_path: str, file_ext: str, base_metadata: dict):
+        """流式读取CSV/Excel并依次产生带表头的行组分块 (chunk_index, 文本, 元数据)
+        
+        解析进程按行读取表格并打包成行组，不生成整表字符串，也不做列宽对齐，内存占用与行数无关。
+        """
+        chunk_index = 0
+        records = self._spooled_records(
+            session_id, base_metadata["file_name"], spool_table_chunks, file_path, file_ext, self.chunk_size
+        )
+        try:
+            async for record in records:
+                metadata = {**base_metadata, "chunk_index": chunk_index,
+                            "row_start": record["row_start"], "row_end": record["row_end"]}
+                if record["sheet"]:
+                    metadata["sheet"] = record["sheet"]
+                yield chunk_index, record["text"], metadata
+                chunk_index += 1
+        finally:
+            await records.aclose()
+
+    async def _stream_text_chunks(self, session_id: str, file_path: str, file_ext: str, base_metadata: dict):
+        """流式读取大文本文件并依次产生分块 (chunk_index, 文本, 元数据)
+        
+        解析进程按采样检测编码，通过内存映射增量解码并按换行切成分段，这里按文件类型选择分块器逐段分块。
+        """
+        chunker = self.chunkers.get(file_ext)
+        chunk_index = 0
+        records = self._spooled_records(
+            session_id, base_metadata["file_name"], spool_text_segments, file_path, TEXT_SEGMENT_CHARS
+        )
+        try:
+            async for record in records:
+                for chunk in await chunker.chunk(record["text"]):
+                    yield chunk_index, chunk, {**base_metadata, "chunk_index": chunk_index}
+                    chunk_index += 1
+        finally:
+            await records.aclose()
+
+    def _ingest_progress_reporter(self, event: AstrMessageEvent, file_name: str):
+        """返回分批嵌入的进度回调：处理时间较长的文件每隔 ingest_progress_interval 秒发送一次进度"""
+        if self.ingest_progress_interval <= 0:
+            return None
+        last_report = time.monotonic()
+        
+        async def report(done: int, total):
+            nonlocal last_report
+            now = time.monotonic()
+            if now - last_report < self.ingest_progress_interval:
+                return
+            last_report = now
+            progress_text = f"{done}/{total} 块（{done / total:.0%}）" if total else f"{done} 块"
+            try:
+                await event.send(event.plain_result(f"文件 {file_name} 正在处理，已完成 {progress_text}..."))
+            except Exception as e:
+                logger.warning(f"发送处理进度失败: {str(e)}")
+        
+        return report
+
+    def _format_pool_stats(self) -> str:
+        """格式化向量数据库句柄池的统计信息"""
+        pool_stats = self.vector_db_pool.stats()
+        return (
+            f"向量库句柄池：已打开 {pool_stats['open']} 个，估算常驻 {pool_stats['resident_bytes'] / 1024 / 1024:.2f}MB，"
+            f"淘汰 {pool_stats['evictions']} 次，重新打开 {pool_stats['reopens']} 次"
+            f"（平均 {pool_stats['reopen_avg_ms']:.1f}ms，最长 {pool_stats['reopen_max_ms']:.1f}ms）"
+        )
+
+    def _format_rerank_stats(self) -> str:
+        """格式化自适应重排序各路径的触发次数"""
+        rerank_stats = self.rerank_policy.stats()
+        return (
+            f"重排序：调用 {rerank_stats['reranked']} 次，候选不足跳过 {rerank_stats['few_candidates']} 次，"
+            f"得分差距明显跳过 {rerank_stats['clear_margin']} 次，超时 {rerank_stats['timeout']} 次，"
+            f"失败 {rerank_stats['failed']} 次"
+        )
+
+    @filter.command("file_cache")
+    async def file_cache_command(self, event: AstrMessageEvent):
+        '''查看分块嵌入缓存、检索结果缓存、重排序和向量库句柄池的统计'''
+        lines = []
+        if self.embedding_cache:
+            cache_stats = self.embedding_cache.stats()
+            lines.append(
+                f"嵌入缓存：命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次，命中率 {cache_stats['hit_rate']:.1%}\n"
+                f"条目数 {cache_stats['entries']}，已用 {cache_stats['size_bytes'] / 1024 / 1024:.2f}MB / {cache_stats['max_bytes'] / 1024 / 1024:.0f}MB，"
+                f"已淘汰 {cache_stats['evictions']} 条"
+            )
+        else:
+            lines.append("分块嵌入缓存未启用")
+        if self.retrieval_cache.enabled:
+            lines.append(f"检索结果缓存：命中 {self.retrieval_cache.hits} 次，未命中 {self.retrieval_cache.misses} 次")
+        if self.enable_rerank:
+            lines.append(self._format_rerank_stats())
+        lines.append(self._format_pool_stats())
+        yield event.plain_result("\n".join(lines))
+
     @filter.event_message_type(filter.EventMessageType.ALL)               # type: ignore
     async def on_receive_msg(self, event: AstrMessageEvent):
         """当获取到有文件时"""
@@ -941,6 +1004,9 @@ class AstrbotPluginFileReaderPro(Star):
             # 获取会话ID和对话ID
             self.current_session_id = self._get_session_id(event)
             self.current_conversation_id = await self._get_conversation_id(event)
+            # 文件在后台处理期间可能有其他会话的消息改写 current_*，任务中统一使用提交时的ID
+            session_id = self.current_session_id
+            conversation_id = self.current_conversation_id
             self.current_file_rounds = 0  # 重置使用轮数
             
             for item in event.message_obj.message:
@@ -959,88 +1025,404 @@ class AstrbotPluginFileReaderPro(Star):
                             yield event.plain_result(f"文件 {file_name} 大小超过限制 ({file_size / 1024 / 1024:.2f}MB > {self.max_file_size}MB)")
                             return
                         
-                        # 获取完整文件名以确定正确的文件类型
-                        completed_name = complete_filename(file_path)
+                        # 读取文件头检测一次文件类型，结果随任务传递，后续解析不再重复检测
+                        file_ext = await asyncio.to_thread(detect_file_type, file_path, file_name)
                         # 检查文件类型是否支持
-                        file_ext = os.path.splitext(completed_name)[1][1:].lower() if os.path.splitext(completed_name)[1] else ""
                         if file_ext and file_ext not in self.supported_file_types:
                             logger.warning(f"不支持的文件类型: {file_ext}")
                             yield event.plain_result(f"不支持的文件类型: {file_ext}")
                             return
                         
                         logger.info(f"接收到文件: {file_name}, 文件路径：{file_path}, 大小：{file_size / 1024 / 1024:.2f}MB")
-                        # yield event.plain_result(f"已接收文件：{file_name}，正在处理...")
-                        
-                        # 读取文件内容
-                        content = read_any_file_to_text(file_path)
                         
-                        # 检查是否为错误信息
-                        error_prefixes = ["文件不存在:", "不支持 ", "找不到处理 ", "读取文件时出错:"]
-                        is_error = any(content.startswith(prefix) for prefix in error_prefixes)
-                        
-                        if content and not is_error:
-                            logger.info(f"读取文件{file_name}内容成功")
-                            
-                            # 检查模型是否可用，如果不可用尝试重新获取
-                            model_available = False
-                            max_retries = 2
-                            retry_count = 0
-                            
-                            while retry_count < max_retries:
-                                # 检查嵌入提供者是否可用
-                                if self.embedding_provider:
-                                    logger.info("嵌入提供者已初始化，跳过重新获取")
-                                    model_available = True
-                                    break
-                                else:
-                                    logger.warning(f"嵌入提供者不可用，尝试重新获取 (第{retry_count + 1}次)")
-                                    # 尝试重新初始化提供者
-                                    init_success = await self.initialize()
-                                    if init_success:
-                                        logger.info("重新获取模型成功")
-                                        model_available = True
-                                        break
-                                    else:
-                                        retry_count += 1
-                                        logger.error(f"重新获取模型失败，剩余重试次数: {max_retries - retry_count}")
-                            
-                            if model_available:
-                                # 生成带时间戳的数据库名称
-                                timestamped_db_name = self._generate_timestamped_filename(file_name)
-                                
-                                # 获取或创建向量数据库（需要会话、对话ID和带时间戳的文件名）
-                                vec_db = await self.get_or_create_vector_db(self.current_session_id, self.current_conversation_id, timestamped_db_name)
-                                
-                                if vec_db:
-                                    # 将文件内容分块
-                                    chunks = await self.chunker.chunk(content)
-                                    logger.info(f"文件分块完成，共{len(chunks)}个块")
-                                    
-                                    # 将块存入向量数据库
-                                    metadatas = [{"file_name": file_name, "chunk_index": i} for i, _ in enumerate(chunks)]
-                                    await vec_db.insert_batch(chunks, metadatas)
-                                    logger.info(f"文件内容已存入向量数据库")
-                                    logger.info(f"使用带时间戳的数据库名称：{timestamped_db_name}")
-
-                                    # 成功向量化后，删除原始文件
-                                    try:
-                                        os.remove(file_path)
-                                        logger.info(f"文件 {file_name} 已成功向量化并删除原始文件")
-                                    except Exception as e:
-                                        logger.warning(f"删除原始文件 {file_name} 失败: {str(e)}")
-
-                                    yield event.plain_result(f"文件：{file_name} 已预处理完毕！请随时提问~ 😊")
-                            else:
-                                logger.error(f"无法获取可用的嵌入提供者，无法处理文件 {file_name}")
-                                yield event.plain_result(f"文件处理失败：无法获取模型服务，请稍后重试或检查配置")
-                        elif is_error:
-                            logger.warning(f"读取文件{file_name}失败: {content}")
-                            yield event.plain_result(content)  # 返回错误信息给用户
-                        else:
-                            logger.warning(f"读取文件{file_name}内容为空")
+                        # 加入后台处理队列，同一消息中的多个文件由不同的工作协程并行处理
+                        job = IngestJob(session_id, file_name, file_size, {
+                            "event": event,
+                            "conversation_id": conversation_id,
+                            "file_path": file_path,
+                            "file_ext": file_ext,
+                        })
+                        try:
+                            must_wait = self.ingest_queue.submit(job)
+                        except QueueFullError as e:
+                            logger.warning(f"文件 {file_name} 无法加入处理队列: {str(e)}")
+                            yield event.plain_result(f"当前待处理的文件过多，请稍后重新上传 {file_name}")
+                            continue
+                        if must_wait:
+                            yield event.plain_result(
+                                f"已接收文件：{file_name}，前面还有约 {self.ingest_queue.position(job)} 个文件在排队，"
+                                f"可发送 /file_status 查看进度"
+                            )
                     except Exception as e:
                         logger.error(f"读取文件失败: {str(e)}")
 
+    async def _run_file_job(self, job: IngestJob):
+        """处理队列的任务入口，记录处理中的异常"""
+        try:
+            return await self._process_file_job(job)
+        except Exception as e:
+            logger.error(f"处理文件 {job.file_name} 失败: {str(e)}")
+            return f"处理失败：{str(e)}"
+
+    async def _process_file_job(self, job: IngestJob):
+        """在后台处理一个上传的文件：解析、嵌入并写入向量数据库
+        
+        返回 None 表示处理成功，否则返回失败原因（供 /file_status 显示）。
+        """
+        event = job.data["event"]
+        session_id = job.session_id
+        conversation_id = job.data["conversation_id"]
+        file_path = job.data["file_path"]
+        file_ext = job.data["file_ext"]
+        file_name = job.file_name
+        file_size = job.size_bytes
+        
+        # PDF 逐页、表格按行组、大文本按分段流式处理，无需先把整份文档读成一个字符串
+        # 可能直接注入全文的小表格和小文本仍整体读取
+        stream_kind = None
+        if self.enable_streaming_ingest:
+            if file_ext == "pdf":
+                stream_kind = "pdf"
+            elif file_size > self.inline_token_budget * 4:
+                if file_ext in TABLE_EXTENSIONS:
+                    stream_kind = "table"
+                elif SUPPORTED_EXTENSIONS.get(file_ext) == "read_txt_to_text":
+                    stream_kind = "text"
+        content = ""
+        
+        if not stream_kind:
+            # 在解析进程池中读取文件内容
+            try:
+                content = await self.parse_pool.run(session_id, read_any_file_to_text, file_path, file_ext)
+            except asyncio.TimeoutError:
+                logger.warning(f"解析文件 {file_name} 超时（超过 {self.parse_timeout} 秒）")
+                await event.send(event.plain_result(f"文件 {file_name} 解析超时（超过 {self.parse_timeout} 秒），请尝试拆分后重新上传"))
+                return "解析超时"
+            except ParseCancelledError:
+                logger.info(f"文件 {file_name} 的解析已被取消")
+                await event.send(event.plain_result(f"文件 {file_name} 的解析已取消"))
+                return "解析已取消"
+            except Exception as e:
+                # 解析函数抛出的异常或解析进程异常退出
+                logger.warning(f"读取文件{file_name}失败: {str(e)}")
+                await event.send(event.plain_result(f"读取文件时出错: {str(e)}"))
+                return f"读取文件时出错: {str(e)}"
+            
+            # 检查是否为错误信息
+            error_prefixes = ["文件不存在:", "不支持 ", "找不到处理 ", "读取文件时出错:"]
+            is_error = any(content.startswith(prefix) for prefix in error_prefixes)
+            
+            if is_error:
+                logger.warning(f"读取文件{file_name}失败: {content}")
+                await event.send(event.plain_result(content))  # 返回错误信息给用户
+                return content
+            if not content:
+                logger.warning(f"读取文件{file_name}内容为空")
+                return "文件内容为空"
+            logger.info(f"读取文件{file_name}内容成功")
+            
+            # 小文件直接保存全文，提问时整体注入，不需要分块、嵌入和重排序
+            # 本对话直接注入的全文合计会超出 context_token_budget 时改为分块检索，避免提问时装不下被舍弃
+            content_tokens = estimate_tokens(content)
+            inline = self.inline_token_budget > 0 and content_tokens <= self.inline_token_budget
+            if inline and self.context_token_budget > 0:
+                inline_tokens = await self._conversation_inline_tokens(session_id, conversation_id)
+                if inline_tokens + content_tokens > self.context_token_budget:
+                    logger.info(
+                        f"对话中直接注入的小文件已有约{inline_tokens}个token，"
+                        f"文件 {file_name} 超出 context_token_budget，改为分块检索"
+                    )
+                    inline = False
+            if inline:
+                await self._store_inline_file(session_id, conversation_id, file_name, content, file_size)
+                try:
+                    os.remove(file_path)
+                except Exception as e:
+                    logger.warning(f"删除原始文件 {file_name} 失败: {str(e)}")
+                await event.send(event.plain_result(f"文件：{file_name} 已预处理完毕！请随时提问~ 😊"))
+                return None
+        
+        # 检查模型是否可用，如果不可用尝试重新获取
+        model_available = False
+        max_retries = 2
+        retry_count = 0
+        
+        while retry_count < max_retries:
+            # 检查嵌入提供者是否可用
+            if self.embedding_provider:
+                logger.info("嵌入提供者已初始化，跳过重新获取")
+                model_available = True
+                break
+            else:
+                logger.warning(f"嵌入提供者不可用，尝试重新获取 (第{retry_count + 1}次)")
+                # 尝试重新初始化提供者
+                init_success = await self.initialize()
+                if init_success:
+                    logger.info("重新获取模型成功")
+                    model_available = True
+                    break
+                else:
+                    retry_count += 1
+                    logger.error(f"重新获取模型失败，剩余重试次数: {max_retries - retry_count}")
+        
+        if not model_available:
+            logger.error(f"无法获取可用的嵌入提供者，无法处理文件 {file_name}")
+            await event.send(event.plain_result(f"文件处理失败：无法获取模型服务，请稍后重试或检查配置"))
+            return "无法获取模型服务"
+        
+        # 同一对话中重新上传未写完的同一文件时，沿用原来的记录从断点继续
+        source_hash = await asyncio.to_thread(file_sha256, file_path)
+        resumable = self.manifest.find_resumable(session_id, conversation_id, source_hash)
+        if resumable and (session_id, conversation_id, resumable.file_name) in self.vec_dbs:
+            timestamped_db_name = resumable.file_name
+            logger.info(f"文件 {file_name} 上次未处理完（已写入 {resumable.chunk_count} 块），将从断点继续")
+        else:
+            resumable = None
+            # 生成带时间戳的数据库名称
+            timestamped_db_name = self._generate_timestamped_filename(file_name)
+        
+        # 获取或创建向量数据库（需要会话、对话ID和带时间戳的文件名）
+        vec_db_dir = await self.get_or_create_vector_db(session_id, conversation_id, timestamped_db_name, file_size, source_hash)
+        if vec_db_dir is None:
+            return "创建向量数据库失败"
+        
+        # 分块元数据记录所属文件，共享存储布局下据此检索来源和按文件删除
+        _, upload_time = self._parse_timestamped_filename(timestamped_db_name)
+        base_metadata = {"file_name": file_name, "db_file": timestamped_db_name, "upload_time": upload_time}
+        
+        try:
+            chunk_count = await self._index_file(
+                session_id, vec_db_dir, file_path, content, base_metadata, stream_kind, file_ext,
+                resume=resumable is not None,
+                progress=self._ingest_progress_reporter(event, file_name)
+            )
+        except IngestError as e:
+            # 嵌入重试用尽：保留已写入的分块，重新上传同一文件时从断点继续
+            logger.warning(f"文件 {file_name} 嵌入失败（已写入 {e.done} 块）: {str(e)}")
+            if e.done == 0:
+                await self.cleanup(session_id, conversation_id, timestamped_db_name)
+                await event.send(event.plain_result(f"文件 {file_name} 向量化失败：{str(e)}，请稍后重新上传"))
+            else:
+                self.manifest.update_chunk_count(session_id, conversation_id, timestamped_db_name, e.done, complete=False)
+                progress_text = f"{e.done}/{e.total}" if e.total else f"{e.done}"
+                await event.send(event.plain_result(f"文件 {file_name} 向量化中断（已完成 {progress_text} 块）：{str(e)}\n重新上传同一文件即可从断点继续"))
+            return f"向量化失败：{str(e)}"
+        except Exception as e:
+            # 解析超时、被取消、解析函数抛出的异常或解析进程异常退出
+            await self.cleanup(session_id, conversation_id, timestamped_db_name)
+            if isinstance(e, ParseCancelledError):
+                logger.info(f"文件 {file_name} 的解析已被取消")
+                await event.send(event.plain_result(f"文件 {file_name} 的解析已取消"))
+                return "解析已取消"
+            elif isinstance(e, asyncio.TimeoutError):
+                logger.warning(f"解析文件 {file_name} 超时（超过 {self.parse_timeout} 秒）")
+                await event.send(event.plain_result(f"文件 {file_name} 解析超时（超过 {self.parse_timeout} 秒），请尝试拆分后重新上传"))
+                return "解析超时"
+            else:
+                logger.warning(f"读取文件{file_name}失败: {str(e)}")
+                await event.send(event.plain_result(f"读取文件时出错: {str(e)}"))
+                return f"读取文件时出错: {str(e)}"
+        finally:
+            # 写入期间检索到的是部分内容，写入结束后使该文件的检索结果缓存失效（已清理的文件在清理时处理）
+            if (session_id, conversation_id, timestamped_db_name) in self.vec_dbs:
+                self.retrieval_cache.bump(session_id, conversation_id, timestamped_db_name)
+        if chunk_count == 0:
+            await self.cleanup(session_id, conversation_id, timestamped_db_name)
+            logger.warning(f"读取文件{file_name}内容为空")
+            return "文件内容为空"
+        self.manifest.update_chunk_count(session_id, conversation_id, timestamped_db_name, chunk_count)
+        logger.info(f"文件内容已存入向量数据库")
+        if self.embedding_cache:
+            cache_stats = self.embedding_cache.stats()
+            logger.info(f"嵌入缓存统计：命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次，命中率 {cache_stats['hit_rate']:.1%}")
+        logger.info(f"使用带时间戳的数据库名称：{timestamped_db_name}")
+
+        # 成功向量化后，删除原始文件
+        try:
+            os.remove(file_path)
+            logger.info(f"文件 {file_name} 已成功向量化并删除原始文件")
+        except Exception as e:
+            logger.warning(f"删除原始文件 {file_name} 失败: {str(e)}")
+
+        await event.send(event.plain_result(f"文件：{file_name} 已预处理完毕！请随时提问~ 😊"))
+        return None
+
+    async def _store_inline_file(self, session_id: str, conversation_id: str, file_name: str, content: str, file_size: int):
+        """登记直接注入的小文件：全文保存在文件目录下，仍受保留时间和使用轮数限制"""
+        timestamped_db_name = self._generate_timestamped_filename(file_name)
+        db_key = (session_id, conversation_id, timestamped_db_name)
+        file_dir = self._data_dir / session_id / conversation_id / timestamped_db_name
+        
+        def write_content():
+            file_dir.mkdir(parents=True, exist_ok=True)
+            (file_dir / INLINE_CONTENT_NAME).write_text(content, encoding="utf-8")
+        
+        await asyncio.to_thread(write_content)
+        self.vec_dbs[db_key] = file_dir
+        self.vec_dbs.set_inline(db_key, content)
+        
+        original_name, upload_time = self._parse_timestamped_filename(timestamped_db_name)
+        self.expiry.add(db_key, upload_time or time.time())
+        self.manifest.add(ManifestEntry(
+            session_id, conversation_id, timestamped_db_name, original_name, upload_time or int(time.time()),
+            file_size, 0, file_dir.relative_to(self._data_dir).as_posix(), inline=True
+        ))
+        logger.info(f"文件 {file_name} 约 {estimate_tokens(content)} tokens，将直接注入全文（不建立向量数据库）")
+
+    async def _conversation_inline_tokens(self, session_id: str, conversation_id: str) -> int:
+        """估算对话中直接注入的小文件全文合计的token数"""
+        total = 0
+        for file_name, file_dir in self.vec_dbs.conversation_files(session_id, conversation_id).items():
+            key = (session_id, conversation_id, file_name)
+            if self.vec_dbs.is_inline(key):
+                total += estimate_tokens(await self._load_inline_text(key, file_dir))
+        return total
+
+    async def _load_inline_text(self, key: tuple, file_dir: Path) -> str:
+        """读取直接注入小文件的全文（重启后首次使用时从磁盘读取）"""
+        text = self.vec_dbs.inline_text(key)
+        if text is None:
+            try:
+                text = await asyncio.to_thread((file_dir / INLINE_CONTENT_NAME).read_text, encoding="utf-8")
+            except Exception as e:
+                logger.error(f"读取文件 {key[2]} 的全文失败: {str(e)}")
+                return ""
+            self.vec_dbs.set_inline(key, text)
+        return text
+
+    @filter.command("file_status")
+    async def file_status_command(self, event: AstrMessageEvent):
+        '''查看当前用户文件的处理进度'''
+        session_id = self._get_session_id(event)
+        jobs = self.ingest_queue.session_jobs(session_id)
+        state_names = {DONE: "完成", FAILED: "失败", CANCELLED: "已取消"}
+        
+        lines = [
+            f"处理队列：排队 {self.ingest_queue.queued_count()} 个"
+            f"（{self.ingest_queue.queued_bytes / 1024 / 1024:.1f}MB），"
+            f"处理中 {self.ingest_queue.running_count()}/{self.ingest_queue.workers} 个"
+        ]
+        for job in jobs[RUNNING]:
+            lines.append(f"▶ {job.file_name}：处理中，已用时 {job.run_seconds:.0f}s（排队 {job.wait_seconds:.0f}s）")
+        for job in jobs[QUEUED]:
+            lines.append(f"… {job.file_name}：排队中，前面约 {self.ingest_queue.position(job)} 个，已等待 {job.wait_seconds:.0f}s")
+        for job in reversed(jobs[DONE]):
+            line = f"✓ {job.file_name}：{state_names.get(job.state, job.state)}，处理 {job.run_seconds:.1f}s（排队 {job.wait_seconds:.1f}s）"
+            if job.error:
+                line += f"，{job.error}"
+            lines.append(line)
+        if len(lines) == 1:
+            lines.append("当前没有处理中的文件")
+        yield event.plain_result("\n".join(lines))
+
+    async def _embed_query(self, session_id: str, conversation_id: str, query: str):
+        """嵌入用户查询，优先使用本对话的查询向量缓存"""
+        vector = self.query_cache.get(session_id, conversation_id, query)
+        if vector is not None:
+            logger.debug("命中查询向量缓存")
+            return vector
+        if not self.embedding_provider:
+            logger.error("嵌入提供者未初始化，无法检索文件内容")
+            return None
+        try:
+            vector = await self.embedding_provider.get_embedding(query)
+        except Exception as e:
+            logger.error(f"嵌入查询失败: {str(e)}")
+            return None
+        self.query_cache.put(session_id, conversation_id, query, vector)
+        return vector
+
+    async def _embed_query_within_budget(self, session_id: str, conversation_id: str, query: str):
+        """在 embedding_latency_budget 内嵌入查询，超时返回 None
+        
+        超时后嵌入请求继续在后台完成并写入查询向量缓存，重新生成或再次提问时可直接使用。
+        """
+        task = asyncio.ensure_future(self._embed_query(session_id, conversation_id, query))
+        if self.embedding_latency_budget <= 0:
+            return await task
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=self.embedding_latency_budget)
+        except asyncio.TimeoutError:
+            logger.warning(f"查询嵌入超过 {self.embedding_latency_budget} 秒")
+            return None
+
+    async def _select_global_top_k(self, query: str, candidates: list, rerank: bool = True) -> list:
+        """对所有文件汇总的候选只调用一次重排序，保留全局 retrieve_top_k 个结果"""
+        candidates = sorted(candidates, key=lambda item: item[0].similarity, reverse=True)
+        if rerank and self.enable_rerank and self.rerank_provider:
+            logger.info(f"对{len(candidates)}个候选片段统一重排序")
+            return await self.rerank_policy.rerank(
+                self.rerank_provider, query, candidates, self.retrieve_top_k,
+                text_of=lambda item: item[0].data["text"], score_of=lambda item: item[0].similarity,
+                # 混合检索的候选带的是 RRF 得分，不按得分差距跳过
+                use_margin=self.retrieval_strategy != "hybrid"
+            )
+        return candidates[:self.retrieve_top_k]
+
+    async def _retrieve_files(self, session_id: str, conversation_id: str, user_query: str, live_dbs: list):
+        """检索当前对话的文件，返回 ([(检索结果, 来源文件名)], 结果是否完整)"""
+        # 查询只嵌入一次，同一个向量用于检索对话中的所有文件
+        # 关键词检索模式不调用嵌入服务；混合检索模式下嵌入失败或超过耗时上限时本轮退回关键词检索
+        # 向量检索模式保持原有行为：等待嵌入完成，嵌入失败时本轮不注入检索内容
+        query_vector = None
+        keyword_only = self.retrieval_strategy == "keyword"
+        if self.retrieval_strategy == "vector":
+            query_vector = await self._embed_query(session_id, conversation_id, user_query)
+            if query_vector is None:
+                return [], False
+        elif not keyword_only:
+            query_vector = await self._embed_query_within_budget(session_id, conversation_id, user_query)
+            if query_vector is None:
+                logger.warning("无法获得查询向量，本轮改用关键词检索")
+                keyword_only = True
+        
+        # 合并检索模式：各文件只做向量召回，汇总后统一重排序并选出全局 top-k
+        merged = self.retrieval_mode == "merged"
+        
+        # 并发检索当前对话的所有文件，单个文件超时则放弃该文件的结果
+        # 有文件超时、失败或本轮退回关键词检索时，结果不完整，不写入检索结果缓存
+        complete = not keyword_only or self.retrieval_strategy == "keyword"
+        semaphore = asyncio.Semaphore(max(1, self.retrieve_concurrency))
+        
+        async def search(vec_db_dir: Path):
+            lexical = LexicalIndex(vec_db_dir / LEXICAL_DB_NAME)
+            # 从句柄池取得向量数据库（已被淘汰或从清单恢复的会在此时打开）
+            async with self._use_vector_db(vec_db_dir) as vec_db:
+                if merged:
+                    return await retrieve(vec_db, lexical, user_query, query_vector, k=self.fetch_k, fetch_k=self.fetch_k,
+                                          rerank=False, strategy=self.retrieval_strategy)
+                return await retrieve(vec_db, lexical, user_query, query_vector, k=self.retrieve_top_k, fetch_k=self.fetch_k,
+                                      rerank=self.enable_rerank, strategy=self.retrieval_strategy, policy=self.rerank_policy)
+        
+        async def retrieve_from(original_file_name: str, vec_db_dir: Path):
+            async with semaphore:
+                logger.info(f"从文件 {original_file_name} 的向量数据库检索与查询相关的内容")
+                try:
+                    return await asyncio.wait_for(
+                        search(vec_db_dir),
+                        timeout=self.retrieve_timeout if self.retrieve_timeout > 0 else None
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning(f"检索文件 {original_file_name} 超时（超过 {self.retrieve_timeout} 秒），已跳过该文件")
+                except Exception as e:
+                    logger.error(f"检索文件 {original_file_name} 失败: {str(e)}")
+                nonlocal complete
+                complete = False
+                return []
+        
+        results_per_file = await asyncio.gather(*(retrieve_from(name, vec_db_dir) for name, vec_db_dir in live_dbs))
+        
+        # 记录每个结果来自哪个文件（优先使用分块元数据中的文件名）
+        all_results_with_source = []
+        for (original_file_name, _), results in zip(live_dbs, results_per_file):
+            for result in results:
+                source_name = result_metadata(result).get("file_name") or original_file_name
+                all_results_with_source.append((result, source_name))
+        
+        if merged and all_results_with_source:
+            all_results_with_source = await self._select_global_top_k(user_query, all_results_with_source, rerank=not keyword_only)
+        return all_results_with_source, complete
+
     @filter.on_llm_request(proirity=-9999)
     async def on_request(self, event: AstrMessageEvent, req: ProviderRequest):
         # 获取当前会话和对话ID
@@ -1056,38 +1438,66 @@ class AstrbotPluginFileReaderPro(Star):
         # 获取当前会话/对话下的所有文件向量数据库
         all_results_with_source = []
         all_files = set()
+        live_dbs = []
+        live_files = []
+        inline_contents = []
         
-        # 遍历所有向量数据库，检查是否属于当前会话/对话
-        for (db_session_id, db_conversation_id, file_name), vec_db in list(self.vec_dbs.items()):
-            if db_session_id == current_session_id and db_conversation_id == current_conversation_id:
-                # 检查文件是否过期
-                if self._is_file_expired(db_session_id, db_conversation_id, file_name):
-                    logger.info(f"文件 {file_name} 已过期，将清理并停止使用")
-                    await self.cleanup(db_session_id, db_conversation_id, file_name)
-                    continue
-                
-                # 解析出原始文件名用于显示（从实际访问的数据库路径获取）
-                original_file_name, _ = self._parse_timestamped_filename(file_name)
-                all_files.add(original_file_name)
-                logger.info(f"从文件 {original_file_name} 的向量数据库检索与查询相关的内容")
-                
-                # 从请求中获取用户查询
-                user_query = req.prompt
-                
-                # 使用类属性进行检索
-                retrieve_top_k = self.retrieve_top_k
-                fetch_k = self.fetch_k
-                enable_rerank = self.enable_rerank
-                
-                # 检索相关内容
-                results = await vec_db.retrieve(user_query, k=retrieve_top_k, fetch_k=fetch_k, rerank=enable_rerank)
-                
-                # 记录每个结果来自哪个数据库文件
-                for result in results:
-                    all_results_with_source.append((result, original_file_name))
+        # 从请求中获取用户查询
+        user_query = req.prompt
+        
+        # 只取当前会话/对话的文件，与其他对话存储的文件数量无关
+        for file_name, vec_db_dir in self.vec_dbs.conversation_files(current_session_id, current_conversation_id).items():
+            # 检查文件是否过期
+            if self._is_file_expired(current_session_id, current_conversation_id, file_name):
+                logger.info(f"文件 {file_name} 已过期，将清理并停止使用")
+                await self.cleanup(current_session_id, current_conversation_id, file_name)
+                continue
+            
+            # 解析出原始文件名用于显示（从实际访问的数据库路径获取）
+            original_file_name, _ = self._parse_timestamped_filename(file_name)
+            all_files.add(original_file_name)
+            
+            # 直接注入的小文件不需要检索
+            key = (current_session_id, current_conversation_id, file_name)
+            if self.vec_dbs.is_inline(key):
+                text = await self._load_inline_text(key, vec_db_dir)
+                if text:
+                    inline_contents.append((original_file_name, text))
+                continue
+            
+            live_files.append(file_name)
+            # 共享存储布局下多个文件对应同一个向量数据库，只检索一次
+            if not any(d == vec_db_dir for _, d in live_dbs):
+                live_dbs.append((original_file_name, vec_db_dir))
+        
+        # 重复提问或重新生成时直接使用缓存的检索结果（文件集合或内容变化后缓存自动失效）
+        cache_key = None
+        cached_results = None
+        if live_dbs:
+            cache_key = self.retrieval_cache.make_key(
+                current_session_id, current_conversation_id, user_query, live_files,
+                self.retrieve_top_k, self.fetch_k, self.enable_rerank, self.retrieval_mode, self.retrieval_strategy
+            )
+            cached_results = self.retrieval_cache.get(current_session_id, current_conversation_id, cache_key)
+        if cached_results is not None:
+            logger.info("命中检索结果缓存")
+            all_results_with_source = cached_results
+        elif live_dbs:
+            all_results_with_source, complete = await self._retrieve_files(
+                current_session_id, current_conversation_id, user_query, live_dbs
+            )
+            if complete:
+                self.retrieval_cache.put(current_session_id, current_conversation_id, cache_key, all_results_with_source)
         
-        if all_results_with_source:
-            logger.info(f"共检索到{len(all_results_with_source)}条相关内容")
+        if all_results_with_source or inline_contents:
+            if all_results_with_source:
+                logger.info(f"共检索到{len(all_results_with_source)}条相关内容")
+            # 小文件全文优先装入 context_token_budget，剩余预算留给检索片段
+            inline_contents, inline_tokens, inline_dropped = select_inline(inline_contents, self.context_token_budget)
+            if inline_contents:
+                logger.info(f"直接注入{len(inline_contents)}个小文件的全文，约{inline_tokens}个token")
+            if inline_dropped:
+                logger.warning(f"小文件 {', '.join(inline_dropped)} 的全文超出 context_token_budget，本轮未注入")
             
             # 构建上下文
             context_text = "以下是与查询相关的文件内容:\n"
@@ -1096,12 +1506,25 @@ class AstrbotPluginFileReaderPro(Star):
             if all_files:
                 context_text += f"相关文件: {', '.join(all_files)}\n\n"
             
-            # 添加相关内容
-            for i, (result, file_name) in enumerate(all_results_with_source, 1):
+            # 添加小文件全文
+            for file_name, text in inline_contents:
+                context_text += f"\n【文件: {file_name} 全文】\n{text}\n"
+            
+            # 添加相关内容：同一文件中编号连续的片段合并并去掉重叠，按检索名次装入token预算
+            items = [
+                (result.data.get("text", ""), file_name, result_metadata(result))
+                for result, file_name in all_results_with_source
                 # 确保result.data是字典
-                if hasattr(result, 'data') and isinstance(result.data, dict):
-                    chunk = result.data.get("text", "")
-                    context_text += f"\n【文件: {file_name} 片段{i}】\n{chunk}\n"
+                if hasattr(result, 'data') and isinstance(result.data, dict)
+            ]
+            spans, pack_stats = pack_context(items, self.chunk_overlap, self.context_token_budget, inline_tokens)
+            if items:
+                logger.info(
+                    f"上下文打包：{pack_stats.chunks}个片段合并为{pack_stats.spans}段，去除重叠{pack_stats.overlap_chars}字符，"
+                    f"注入约{pack_stats.tokens}个token，超出预算舍弃{pack_stats.dropped}段"
+                )
+            for i, span in enumerate(spans, 1):
+                context_text += f"\n【文件: {span.file_name} 片段{i}】\n{span.text}\n"
             
             # 根据配置选择注入方式
             if self.injection_type == "system":
@@ -1174,9 +1597,25 @@ class AstrbotPluginFileReaderPro(Star):
             logger.info("未检索到相关内容")
         
         # 遍历当前会话/对话下的所有文件，为每个文件增加使用轮数
-        for (db_session_id, db_conversation_id, db_file_name), _ in list(self.vec_dbs.items()):
-            if db_session_id == current_session_id and db_conversation_id == current_conversation_id:
-                self._increment_file_rounds(db_session_id, db_conversation_id, db_file_name)
+        rounds_exhausted = []
+        for db_file_name in self.vec_dbs.conversation_files(current_session_id, current_conversation_id):
+            rounds = self._increment_file_rounds(current_session_id, current_conversation_id, db_file_name)
+            if rounds >= self.file_max_rounds:
+                rounds_exhausted.append(db_file_name)
+        
+        # 轮数用完的文件立即清理，不必等到下一次检索或定期清理
+        for db_file_name in rounds_exhausted:
+            logger.info(f"文件 {db_file_name} 已达到最大使用轮数，将清理并停止使用")
+            await self.cleanup(current_session_id, current_conversation_id, db_file_name)
+
+    async def terminate(self):
+        """插件卸载时停止后台任务，关闭解析进程池和已打开的向量数据库，并落盘剩余的使用轮数"""
+        await self._stop_periodic_cleanup()
+        await self.ingest_queue.shutdown()
+        self.parse_pool.shutdown()
+        await self.vector_db_pool.close_all()
+        if self.file_rounds:
+            await asyncio.to_thread(self.file_rounds.close)
 
     def __del__(self):
         """对象销毁时清理资源"""
@@ -1185,13 +1624,30 @@ class AstrbotPluginFileReaderPro(Star):
             self._cleanup_task.cancel()
             logger.info("已取消定期清理任务")
         
+        # 关闭解析进程池
+        if hasattr(self, 'parse_pool'):
+            self.parse_pool.shutdown()
+        
         # 清理资源 - 在__del__中避免使用异步操作，直接处理简单的资源释放
         # 更复杂的清理应该在对象正常使用时通过调用cleanup()方法完成
-        for key, vec_db in list(self.vec_dbs.items()):
+        handles = self.vector_db_pool.handles() if hasattr(self, 'vector_db_pool') else []
+        for vec_db in handles:
             try:
                 # 尝试关闭向量数据库连接
                 if hasattr(vec_db, 'close'):
                     vec_db.close()
             except Exception as e:
                 logger.error(f"关闭向量数据库时出错: {str(e)}")
-        self.vec_dbs.clear()
\ No newline at end of file
+        self.vec_dbs.clear()
+        
+        # 落盘剩余的使用轮数并停止写线程
+        if getattr(self, 'file_rounds', None):
+            self.file_rounds.close()
+        
+        # 关闭文件清单数据库
+        if hasattr(self, 'manifest'):
+            self.manifest.close()
+        
+        # 关闭嵌入缓存数据库
+        if getattr(self, 'embedding_cache', None):
+            self.embedding_cache.close()
\ No newline at end of file
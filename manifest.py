@@ -0,0 +1,142 @@
+"""向量数据库清单
+
+记录每个已存储文件的向量数据库位置、上传时间和大小。插件启动时只读取清单，
+向量数据库在对应对话第一次提问时才真正打开。
+未写完的文件记录源文件哈希，同一对话中重新上传同一文件时从断点继续写入。
+直接注入的小文件（inline）没有向量数据库，store_dir 下只保存全文。
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+
+class ManifestEntry(NamedTuple):
+    session_id: str
+    conversation_id: str
+    file_name: str
+    original_name: str
+    upload_time: int
+    size_bytes: int
+    chunk_count: int
+    store_dir: str  # 相对于数据目录的路径
+    source_hash: str = ""  # 源文件SHA-256
+    complete: bool = True  # 是否已全部写入向量数据库
+    inline: bool = False  # 是否为直接注入的小文件
+
+
+class FileManifest:
+    """基于SQLite的文件清单"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.created = not self.db_path.exists()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS file_manifest (
+                session_id TEXT NOT NULL,
+                conversation_id TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                original_name TEXT NOT NULL,
+                upload_time INTEGER NOT NULL,
+                size_bytes INTEGER DEFAULT 0,
+                chunk_count INTEGER DEFAULT 0,
+                store_dir TEXT NOT NULL,
+                source_hash TEXT DEFAULT '',
+                complete INTEGER DEFAULT 1,
+                inline INTEGER DEFAULT 0,
+                PRIMARY KEY (session_id, conversation_id, file_name)
+            )
+        ''')
+        # 旧版本清单缺少的列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(file_manifest)")}
+        if "source_hash" not in columns:
+            self._conn.execute("ALTER TABLE file_manifest ADD COLUMN source_hash TEXT DEFAULT ''")
+        if "complete" not in columns:
+            self._conn.execute("ALTER TABLE file_manifest ADD COLUMN complete INTEGER DEFAULT 1")
+        if "inline" not in columns:
+            self._conn.execute("ALTER TABLE file_manifest ADD COLUMN inline INTEGER DEFAULT 0")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_file_manifest_upload_time ON file_manifest (upload_time)"
+        )
+        self._conn.commit()
+
+    def add(self, entry: ManifestEntry):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_manifest VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._to_row(entry)
+            )
+            self._conn.commit()
+
+    def add_many(self, entries: List[ManifestEntry]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO file_manifest VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._to_row(entry) for entry in entries]
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _to_row(entry: ManifestEntry) -> tuple:
+        return tuple(entry._replace(complete=int(entry.complete), inline=int(entry.inline)))
+
+    def update_chunk_count(self, session_id: str, conversation_id: str, file_name: str, chunk_count: int,
+                           complete: bool = True):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE file_manifest SET chunk_count=?, complete=? WHERE session_id=? AND conversation_id=? AND file_name=?",
+                (chunk_count, int(complete), session_id, conversation_id, file_name)
+            )
+            self._conn.commit()
+
+    def find_resumable(self, session_id: str, conversation_id: str, source_hash: str) -> Optional[ManifestEntry]:
+        """查找同一对话中同一源文件未写完的记录"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM file_manifest WHERE session_id=? AND conversation_id=? AND source_hash=? AND complete=0 "
+                "ORDER BY upload_time DESC LIMIT 1",
+                (session_id, conversation_id, source_hash)
+            ).fetchone()
+        return self._to_entry(row) if row else None
+
+    def remove(self, session_id: str, conversation_id: Optional[str] = None, file_name: Optional[str] = None):
+        """删除单个文件、整个对话或整个会话的清单记录"""
+        with self._lock:
+            if file_name:
+                self._conn.execute(
+                    "DELETE FROM file_manifest WHERE session_id=? AND conversation_id=? AND file_name=?",
+                    (session_id, conversation_id, file_name)
+                )
+            elif conversation_id:
+                self._conn.execute(
+                    "DELETE FROM file_manifest WHERE session_id=? AND conversation_id=?",
+                    (session_id, conversation_id)
+                )
+            else:
+                self._conn.execute("DELETE FROM file_manifest WHERE session_id=?", (session_id,))
+            self._conn.commit()
+
+    def entries(self) -> List[ManifestEntry]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM file_manifest").fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    @staticmethod
+    def _to_entry(row) -> ManifestEntry:
+        entry = ManifestEntry(*row)
+        return entry._replace(complete=bool(entry.complete), inline=bool(entry.inline))
+
+    def sessions(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT session_id FROM file_manifest").fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
@@ -0,0 +1,153 @@
+"""文件解析进程池
+
+将 read_*_to_text 等CPU密集的解析函数派发到子进程执行，避免阻塞事件循环。
+支持单文件超时、全局并发上限，以及按会话取消尚未完成的解析任务。
+
+每个解析任务在单独的子进程中运行：超时或被取消时只终止该任务的子进程，
+不影响其他会话正在运行或排队的任务；超时从子进程启动时开始计时，排队时间不计入。
+"""
+
+import asyncio
+import multiprocessing
+from typing import Any, Callable, Dict, Optional, Set
+
+
+class ParseCancelledError(Exception):
+    """解析任务被用户取消（如执行了 /clear_file）"""
+
+
+def _run_in_child(conn, func: Callable[..., Any], args: tuple):
+    """子进程入口：执行解析函数并通过管道返回 (是否成功, 结果或异常)"""
+    try:
+        try:
+            result = (True, func(*args))
+        except Exception as e:
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception as e:
+            # 结果或异常无法序列化
+            conn.send((False, RuntimeError(f"解析结果无法传回: {str(e)}")))
+    finally:
+        conn.close()
+
+
+class _ParseJob:
+    def __init__(self):
+        self.future: Optional[asyncio.Future] = None
+        self.process = None
+        self.cancelled = False
+
+    def kill(self):
+        """终止该任务的子进程（如果正在运行）"""
+        process = self.process
+        if process is not None and process.is_alive():
+            try:
+                process.kill()
+            except Exception:
+                pass
+
+
+class ParsePool:
+    """解析任务调度器
+
+    - workers > 0 时每个任务在单独的子进程中执行，同时运行的子进程不超过 workers 个；
+      workers == 0 时退回到线程执行（仍不阻塞事件循环，但超时的任务无法被终止）
+    - timeout 为单个解析任务的超时时间（秒），从任务开始执行时计时，超时后只终止该任务的子进程
+    - max_concurrent 为同时进行的解析任务上限（跨所有会话，包括等待子进程名额的任务）
+    """
+
+    def __init__(self, workers: int, timeout: float, max_concurrent: int):
+        self.workers = max(0, workers)
+        self.timeout = timeout if timeout and timeout > 0 else None
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrent))
+        self._worker_slots = asyncio.Semaphore(max(1, self.workers))
+        self._context = multiprocessing.get_context()
+        self._jobs: Dict[str, Set[_ParseJob]] = {}
+
+    async def _run_in_process(self, job: _ParseJob, func: Callable[..., Any], args: tuple) -> Any:
+        receiver, sender = self._context.Pipe(duplex=False)
+        job.process = self._context.Process(target=_run_in_child, args=(sender, func, args), daemon=True)
+        try:
+            job.process.start()
+            sender.close()
+            # 读取结果会阻塞（结果可能很大），放到线程中；子进程被终止时读取以 EOFError 结束
+            job.future = asyncio.ensure_future(asyncio.to_thread(receiver.recv))
+            try:
+                ok, value = await asyncio.wait_for(asyncio.shield(job.future), timeout=self.timeout)
+            except EOFError:
+                if job.cancelled:
+                    raise ParseCancelledError()
+                await asyncio.to_thread(job.process.join, 1)
+                raise RuntimeError(f"解析进程异常退出（退出码 {job.process.exitcode}）")
+            if not ok:
+                raise value
+            return value
+        finally:
+            job.kill()
+            if job.future is not None and not job.future.done():
+                # 子进程已终止，等待读取线程以 EOFError 结束后再关闭管道
+                await asyncio.gather(job.future, return_exceptions=True)
+            receiver.close()
+            await asyncio.to_thread(job.process.join)
+            job.process.close()
+
+    async def run(self, session_id: str, func: Callable[..., Any], *args) -> Any:
+        """在子进程中执行解析函数
+
+        超时抛出 asyncio.TimeoutError，被取消时抛出 ParseCancelledError，子进程异常退出时抛出 RuntimeError。
+        """
+        job = _ParseJob()
+        self._jobs.setdefault(session_id, set()).add(job)
+        try:
+            async with self._semaphore:
+                if self.workers:
+                    async with self._worker_slots:
+                        # 排队等待期间可能已被取消
+                        if job.cancelled:
+                            raise ParseCancelledError()
+                        return await self._run_in_process(job, func, args)
+
+                if job.cancelled:
+                    raise ParseCancelledError()
+                job.future = asyncio.get_running_loop().run_in_executor(None, func, *args)
+                try:
+                    return await asyncio.wait_for(job.future, timeout=self.timeout)
+                except asyncio.CancelledError:
+                    if job.cancelled:
+                        raise ParseCancelledError()
+                    raise
+        finally:
+            jobs = self._jobs.get(session_id)
+            if jobs is not None:
+                jobs.discard(job)
+                if not jobs:
+                    del self._jobs[session_id]
+
+    def cancel_session(self, session_id: str) -> int:
+        """取消指定会话下所有未完成的解析任务，返回取消的任务数
+
+        尚未开始的任务会直接出队；正在运行的任务终止其子进程（线程执行时结果将被丢弃）。
+        """
+        count = 0
+        for job in list(self._jobs.get(session_id, ())):
+            if job.cancelled or (job.future is not None and job.future.done()):
+                continue
+            job.cancelled = True
+            if job.process is not None:
+                job.kill()
+            elif job.future is not None:
+                job.future.cancel()
+            count += 1
+        return count
+
+    def pending_count(self, session_id: Optional[str] = None) -> int:
+        """返回未完成的解析任务数"""
+        if session_id is not None:
+            return len(self._jobs.get(session_id, ()))
+        return sum(len(jobs) for jobs in self._jobs.values())
+
+    def shutdown(self):
+        """取消所有任务并终止正在运行的子进程"""
+        for session_id in list(self._jobs):
+            self.cancel_session(session_id)
@@ -0,0 +1,236 @@
+"""基于预先计算的查询向量进行检索
+
+FaissVecDB.retrieve 每次调用都会重新嵌入查询文本；对话中有多个文件时，
+这里先嵌入一次查询，再用同一个向量检索各文件的 FAISS 索引。
+同时提供基于本地 BM25 索引的关键词检索，以及向量与关键词结果的 RRF 融合。
+重排序由 RerankPolicy 按需调用：候选不多于 k 个、或初检得分在第 k 名处已明显拉开时跳过，
+超时或失败时退回初检顺序。
+"""
+
+import asyncio
+import json
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from astrbot.api import logger  # pyright: ignore[reportMissingImports]
+from astrbot.core.db.vec_db.base import Result  # pyright: ignore[reportMissingImports]
+
+try:
+    from .ingest_embedder import index_lock
+except ImportError:  # 作为顶层模块导入（如测试）
+    from ingest_embedder import index_lock
+
+
+async def search_by_vector(
+    vec_db,
+    query_vector: List[float],
+    k: int,
+    metadata_filters: Optional[dict] = None,
+) -> List[Result]:
+    """仅做向量检索（不重排序），按相似度从高到低返回最多 k 个结果"""
+    scores, indices = await vec_db.embedding_storage.search(
+        vector=np.array([query_vector], dtype=np.float32),
+        k=k,
+    )
+    if len(indices[0]) == 0 or indices[0][0] == -1:
+        return []
+
+    # 与 FaissVecDB.retrieve 保持一致：将L2距离归一化为相似度
+    similarities = 1.0 - (scores[0] / 2.0)
+    ids = [int(i) for i in indices[0] if i != -1]
+    fetched_docs = await vec_db.document_storage.get_documents(
+        metadata_filters=metadata_filters or {},
+        ids=ids,
+    )
+    if not fetched_docs:
+        return []
+
+    doc_by_id = {doc["id"]: doc for doc in fetched_docs}
+    results: List[Result] = []
+    for i, doc_id in enumerate(indices[0]):
+        doc = doc_by_id.get(int(doc_id))
+        if doc is not None:
+            results.append(Result(similarity=float(similarities[i]), data=doc))
+    return results
+
+
+async def rerank_results(rerank_provider, query: str, candidates: list, k: int, text_of=None) -> list:
+    """调用一次重排序模型，返回重排后的前 k 个候选
+
+    text_of 用于从候选中取出文本，默认候选本身是 Result。
+    """
+    if not candidates:
+        return []
+    text_of = text_of or (lambda candidate: candidate.data["text"])
+    reranked = await rerank_provider.rerank(query, [text_of(candidate) for candidate in candidates])
+    reranked = sorted(reranked, key=lambda x: x.relevance_score, reverse=True)
+    return [candidates[item.index] for item in reranked][:k]
+
+
+class RerankPolicy:
+    """自适应重排序策略
+
+    - 候选数不超过 k：重排序不会改变入选的候选，跳过
+    - 初检的向量相似度（0~1）中第 k 名与第 k+1 名的差距达到 skip_margin：入选的候选已明显拉开，跳过
+      （skip_margin 为 0 时不启用；RRF 融合得分不在同一尺度上，调用方传入 use_margin=False）
+    - 重排序超过 timeout 秒或调用失败：按初检顺序取前 k 个
+    每种情况的次数记录在 counts 中。
+    """
+
+    REASONS = ("reranked", "few_candidates", "clear_margin", "timeout", "failed")
+
+    def __init__(self, skip_margin: float = 0.0, timeout: float = 0):
+        self.skip_margin = skip_margin
+        self.timeout = timeout
+        self.counts: Dict[str, int] = dict.fromkeys(self.REASONS, 0)
+
+    def _skip_reason(self, candidates: list, k: int, score_of: Callable, use_margin: bool) -> Optional[str]:
+        if len(candidates) <= k:
+            return "few_candidates"
+        if use_margin and self.skip_margin > 0 and k > 0:
+            scores = sorted((score_of(candidate) for candidate in candidates), reverse=True)
+            if scores[k - 1] - scores[k] >= self.skip_margin:
+                return "clear_margin"
+        return None
+
+    async def rerank(self, rerank_provider, query: str, candidates: list, k: int,
+                     text_of: Optional[Callable] = None, score_of: Optional[Callable] = None,
+                     use_margin: bool = True) -> list:
+        """按策略重排序候选（候选按初检得分从高到低排列），返回前 k 个
+
+        use_margin 表示 score_of 取到的是向量相似度，可以按 skip_margin 判断是否跳过。
+        """
+        score_of = score_of or (lambda candidate: candidate.similarity)
+        reason = self._skip_reason(candidates, k, score_of, use_margin)
+        if reason is None:
+            try:
+                reranked = await asyncio.wait_for(
+                    rerank_results(rerank_provider, query, candidates, k, text_of),
+                    timeout=self.timeout if self.timeout > 0 else None
+                )
+                self.counts["reranked"] += 1
+                return reranked
+            except asyncio.TimeoutError:
+                logger.warning(f"重排序超时（超过 {self.timeout} 秒），改用初检顺序")
+                reason = "timeout"
+            except Exception as e:
+                logger.error(f"重排序失败，改用初检顺序: {str(e)}")
+                reason = "failed"
+        self.counts[reason] += 1
+        return candidates[:k]
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counts)
+
+
+async def _rerank(rerank_provider, query: str, candidates: list, k: int, policy: Optional[RerankPolicy],
+                  use_margin: bool = True) -> list:
+    if policy is not None:
+        return await policy.rerank(rerank_provider, query, candidates, k, use_margin=use_margin)
+    return await rerank_results(rerank_provider, query, candidates, k)
+
+
+async def retrieve_by_vector(
+    vec_db,
+    query: str,
+    query_vector: List[float],
+    k: int,
+    fetch_k: int,
+    rerank: bool,
+    metadata_filters: Optional[dict] = None,
+    policy: Optional[RerankPolicy] = None,
+) -> List[Result]:
+    """使用查询向量检索单个向量数据库
+
+    启用重排序时先召回 fetch_k 个候选，重排序（提供 policy 时按策略）后保留前 k 个；否则直接返回前 k 个。
+    """
+    use_rerank = rerank and vec_db.rerank_provider is not None
+    search_k = max(k, fetch_k) if (use_rerank or metadata_filters) else k
+
+    candidates = await search_by_vector(vec_db, query_vector, search_k, metadata_filters)
+    if use_rerank:
+        return await _rerank(vec_db.rerank_provider, query, candidates, k, policy)
+    return candidates[:k]
+
+
+async def search_by_keywords(vec_db, lexical, query: str, k: int) -> List[Result]:
+    """仅做 BM25 关键词检索（不调用任何服务商），按得分从高到低返回最多 k 个结果"""
+    hits = await asyncio.to_thread(lexical.search, query, k)
+    if not hits:
+        return []
+    fetched_docs = await vec_db.document_storage.get_documents(
+        metadata_filters={},
+        ids=[doc_key for doc_key, _ in hits],
+    )
+    doc_by_id = {doc["id"]: doc for doc in fetched_docs or []}
+    return [Result(similarity=score, data=doc_by_id[doc_key]) for doc_key, score in hits if doc_key in doc_by_id]
+
+
+def fuse_rrf(result_lists: List[List[Result]], k: int, rrf_k: int = 60) -> List[Result]:
+    """倒数排名融合（RRF）：按各列表中的名次累加 1/(rrf_k + 名次)，similarity 为融合得分"""
+    scores: Dict[int, float] = {}
+    docs: Dict[int, dict] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, 1):
+            doc_id = result.data["id"]
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(doc_id, result.data)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [Result(similarity=score, data=docs[doc_id]) for doc_id, score in ranked]
+
+
+async def retrieve(
+    vec_db,
+    lexical,
+    query: str,
+    query_vector: Optional[List[float]],
+    k: int,
+    fetch_k: int,
+    rerank: bool,
+    strategy: str = "vector",
+    policy: Optional[RerankPolicy] = None,
+) -> List[Result]:
+    """按检索策略检索单个向量数据库
+
+    query_vector 为 None 时只做关键词检索（不调用重排序）；
+    strategy 为 hybrid 时向量和关键词各召回 fetch_k 个候选，RRF 融合后再按需重排序；
+    其他情况只做向量检索。
+    """
+    if query_vector is None:
+        return await search_by_keywords(vec_db, lexical, query, k)
+    if strategy != "hybrid":
+        return await retrieve_by_vector(vec_db, query, query_vector, k, fetch_k, rerank, policy=policy)
+
+    search_k = max(k, fetch_k)
+    vector_results, keyword_results = await asyncio.gather(
+        search_by_vector(vec_db, query_vector, search_k),
+        search_by_keywords(vec_db, lexical, query, search_k),
+    )
+    candidates = fuse_rrf([vector_results, keyword_results], search_k)
+    if rerank and vec_db.rerank_provider is not None:
+        # 融合后的候选带的是 RRF 得分，不按得分差距跳过重排序
+        return await _rerank(vec_db.rerank_provider, query, candidates, k, policy, use_margin=False)
+    return candidates[:k]
+
+
+def result_metadata(result) -> dict:
+    """取出检索结果的元数据（文档库中以JSON字符串保存）"""
+    metadata = result.data.get("metadata") if isinstance(result.data, dict) else None
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            return {}
+    return metadata if isinstance(metadata, dict) else {}
+
+
+async def delete_by_metadata(vec_db, metadata_filters: dict):
+    """按元数据删除向量数据库中的分块（同时删除文档和向量，与正在写入同一索引的文件互斥）"""
+    async with index_lock(vec_db):
+        if hasattr(vec_db, "delete_documents"):
+            await vec_db.delete_documents(metadata_filters=metadata_filters)
+            return
+        docs = await vec_db.document_storage.get_documents(metadata_filters=metadata_filters, offset=None, limit=None)
+        for doc in docs:
+            await vec_db.delete(doc["doc_id"])
@@ -0,0 +1,101 @@
+"""检索结果缓存
+
+用户重复提问或点击重新生成时，on_request 会再做一次嵌入、检索和重排序。
+这里按对话缓存最终的检索结果，键包含：
+- 规范化后的查询（去除首尾空白、合并连续空白、忽略大小写）
+- 当前对话中参与检索的文件集合及其版本
+- 影响结果的检索参数（top_k、fetch_k、是否重排序、检索模式和策略）
+
+文件写入完成时递增其版本，文件过期或被清理时移除其版本，对应对话的缓存随之失效；
+新上传的文件改变文件集合，旧的键自然不再命中。命中时只需一次字典查找。
+"""
+
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    return _WHITESPACE.sub(" ", query).strip().casefold()
+
+
+class RetrievalCache:
+    """按对话隔离的检索结果缓存（TTL + LRU）"""
+
+    def __init__(self, ttl: float, max_entries: int, max_conversations: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_conversations = max_conversations
+        self.hits = 0
+        self.misses = 0
+        self._conversations: "OrderedDict[tuple, OrderedDict[Hashable, tuple]]" = OrderedDict()
+        self._versions: Dict[Tuple[str, str, str], int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def make_key(self, session_id: str, conversation_id: str, query: str, file_names: Iterable[str],
+                 *params: Hashable) -> Hashable:
+        """生成缓存键：规范化查询 + (文件名, 版本) 集合 + 检索参数"""
+        files = tuple(sorted(
+            (file_name, self._versions.get((session_id, conversation_id, file_name), 0))
+            for file_name in file_names
+        ))
+        return (normalize_query(query), files) + tuple(params)
+
+    def get(self, session_id: str, conversation_id: str, key: Hashable) -> Optional[list]:
+        if not self.enabled:
+            return None
+        conversation = (session_id, conversation_id)
+        entries = self._conversations.get(conversation)
+        item = entries.get(key) if entries else None
+        if item is not None and time.time() - item[0] > self.ttl:
+            del entries[key]
+            item = None
+        if item is None:
+            self.misses += 1
+            return None
+        entries.move_to_end(key)
+        self._conversations.move_to_end(conversation)
+        self.hits += 1
+        return list(item[1])
+
+    def put(self, session_id: str, conversation_id: str, key: Hashable, results: list):
+        if not self.enabled:
+            return
+        conversation = (session_id, conversation_id)
+        entries = self._conversations.get(conversation)
+        if entries is None:
+            entries = self._conversations[conversation] = OrderedDict()
+        self._conversations.move_to_end(conversation)
+        entries[key] = (time.time(), list(results))
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+
+    def bump(self, session_id: str, conversation_id: str, file_name: str):
+        """文件内容发生变化（写入完成或中断），递增其版本并使该对话的缓存失效"""
+        key = (session_id, conversation_id, file_name)
+        self._versions[key] = self._versions.get(key, 0) + 1
+        self._conversations.pop((session_id, conversation_id), None)
+
+    def forget(self, session_id: str, conversation_id: str, file_name: str):
+        """文件过期或被清理，移除其版本并使该对话的缓存失效"""
+        self._versions.pop((session_id, conversation_id, file_name), None)
+        self._conversations.pop((session_id, conversation_id), None)
+
+    def drop(self, session_id: str, conversation_id: Optional[str] = None):
+        """丢弃指定对话（或整个会话）的缓存和文件版本"""
+        conversations = [key for key in self._conversations
+                         if key[0] == session_id and (conversation_id is None or key[1] == conversation_id)]
+        for key in conversations:
+            del self._conversations[key]
+        for key in [key for key in self._versions
+                    if key[0] == session_id and (conversation_id is None or key[1] == conversation_id)]:
+            del self._versions[key]
@@ -0,0 +1,6 @@
+"""插件中不依赖 AstrBot 的模块可作为顶层模块直接导入测试"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
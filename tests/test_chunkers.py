@@ -0,0 +1,122 @@
+import asyncio
+
+from chunkers import (
+    StructuredChunker, create_chunker_registry, split_code_members, split_code_units,
+    split_markdown_sections, split_slides,
+)
+
+
+class FixedChunker:
+    """按固定长度切分的默认分块器"""
+
+    def __init__(self, size):
+        self.size = size
+        self.sizes = []
+
+    async def chunk(self, text, chunk_size=None):
+        size = chunk_size or self.size
+        self.sizes.append(size)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+CODE = '''import os
+
+
+def first():
+    return 1
+
+
+@decorator
+def second():
+    if True:
+        pass
+
+    return 2
+}
+
+class Third:
+    def a(self):
+        pass
+
+    def b(self):
+        pass
+'''
+
+
+def test_code_units_split_at_top_level_definitions():
+    units = split_code_units(CODE)
+    assert [unit.title for unit in units] == ["import os", "def first():", "@decorator", "class Third:"]
+    # 空行后的缩进语句和闭合括号不会开始新的单元
+    assert "return 2\n}" in units[2].text
+
+
+def test_oversized_definition_splits_into_members_with_parent_title():
+    unit = split_code_units(CODE)[-1]
+    members = split_code_members(unit)
+    assert [member.title for member in members] == ["class Third:", "    def b(self):"]
+    assert members[1].parents == "class Third:"
+
+
+def test_markdown_sections_track_parent_headings_and_ignore_fences():
+    text = "# Top\nintro\n## Sub\nbody\n```\n# not a heading\n```\n# Next\nend"
+    units = split_markdown_sections(text)
+    assert [unit.title for unit in units] == ["# Top", "## Sub", "# Next"]
+    assert units[1].parents == "# Top"
+    assert "# not a heading" in units[1].text
+    assert units[2].parents == ""
+
+
+def test_slides_split_on_markers():
+    text = "=== 幻灯片 1 ===\nA\n=== 幻灯片 2 ===\nB"
+    units = split_slides(text)
+    assert [unit.text for unit in units] == ["=== 幻灯片 1 ===\nA", "=== 幻灯片 2 ===\nB"]
+
+
+def test_structured_chunker_packs_units_without_overlap():
+    units_text = "\n\n".join(f"def f{i}():\n    return {i}" for i in range(6))
+    chunker = StructuredChunker(split_code_units, 60, FixedChunker(60))
+    chunks = asyncio.run(chunker.chunk(units_text))
+    assert all(len(chunk) <= 60 for chunk in chunks)
+    assert "\n\n".join(chunks) == units_text
+
+
+def test_oversized_unit_falls_back_and_prefixes_context():
+    text = "# Title\n## Section\n" + "word " * 60
+    chunker = StructuredChunker(split_markdown_sections, 80, FixedChunker(80))
+    chunks = asyncio.run(chunker.chunk(text))
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 80 for chunk in chunks)
+    assert chunks[0].startswith("# Title\n\n## Section\nword")
+    # 超长小节切出的后续块补上所属的标题
+    assert all(chunk.startswith("# Title\n## Section\n") for chunk in chunks[1:])
+
+
+def test_fallback_splits_to_heading_room_without_extra_fragments():
+    title = "## Section"
+    body = "x" * 700
+    fallback = FixedChunker(200)
+    chunker = StructuredChunker(split_markdown_sections, 200, fallback)
+    chunks = asyncio.run(chunker.chunk(f"{title}\n{body}"))
+    room = 200 - len(title) - 1
+    assert fallback.sizes == [room]
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    # 默认分块器已按 room 切分，不会再截出零碎的尾片
+    assert len(chunks) == -(-len(f"{title}\n{body}") // room)
+
+
+def test_member_continuation_keeps_indentation():
+    method = "    def b(self):\n" + "".join(f"        x{i} = {i}\n" for i in range(20))
+    text = "class Foo:\n    def a(self):\n        pass\n\n" + method
+    chunker = StructuredChunker(split_code_units, 120, FixedChunker(120), split_code_members)
+    chunks = asyncio.run(chunker.chunk(text))
+    continuations = [chunk for chunk in chunks if chunk.startswith("class Foo:\n    def b(self):\n")]
+    assert len(continuations) >= 2
+    assert all(len(chunk) <= 120 for chunk in chunks)
+
+
+def test_registry_falls_back_to_default_chunker():
+    default = FixedChunker(100)
+    registry = create_chunker_registry(default, 100)
+    assert registry.get("txt") is default
+    assert isinstance(registry.get("py"), StructuredChunker)
+    assert registry.get("md") is not registry.get("py")
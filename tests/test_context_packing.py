@@ -0,0 +1,92 @@
+from context_packing import MIN_OVERLAP, pack_context, select_inline, strip_overlap
+from tokens import estimate_tokens
+
+TEXT = "".join(f"sentence {i:03d}. " for i in range(60))
+
+
+def chunk(start, end):
+    return TEXT[start:end]
+
+
+def item(text, file_name="a.txt", db_file="a_1", chunk_index=None):
+    metadata = {"db_file": db_file}
+    if chunk_index is not None:
+        metadata["chunk_index"] = chunk_index
+    return text, file_name, metadata
+
+
+def test_strip_overlap_removes_shared_prefix():
+    rest, removed = strip_overlap(chunk(0, 100), chunk(80, 180), 30)
+    assert removed == 20
+    assert rest == chunk(100, 180)
+
+
+def test_strip_overlap_ignores_short_coincidences():
+    rest, removed = strip_overlap("ends with abc", "abc starts here", 30)
+    assert removed == 0
+    assert rest == "abc starts here"
+    assert MIN_OVERLAP > 3
+
+
+def test_consecutive_chunks_merge_without_duplicated_overlap():
+    items = [
+        item(chunk(80, 180), chunk_index=1),
+        item(chunk(0, 100), chunk_index=0),
+        item(chunk(160, 260), chunk_index=2),
+    ]
+    spans, stats = pack_context(items, chunk_overlap=20, token_budget=0)
+    assert len(spans) == 1
+    assert spans[0].text == chunk(0, 260)
+    assert (spans[0].start, spans[0].end, spans[0].chunks, spans[0].rank) == (0, 2, 3, 0)
+    assert stats.overlap_chars == 40
+
+
+def test_gaps_and_different_files_stay_separate():
+    items = [
+        item(chunk(0, 100), chunk_index=0),
+        item(chunk(200, 300), chunk_index=3),
+        item(chunk(0, 100), file_name="b.txt", db_file="b_1", chunk_index=1),
+        item("no index"),
+    ]
+    spans, stats = pack_context(items, chunk_overlap=20, token_budget=0)
+    assert [(span.file_name, span.start) for span in spans] == [
+        ("a.txt", 0), ("a.txt", 3), ("a.txt", None), ("b.txt", 1)
+    ]
+    assert stats.spans == 4
+
+
+def test_same_chunk_retrieved_twice_is_kept_once_with_best_rank():
+    items = [item(chunk(0, 100), chunk_index=4), item("other", chunk_index=9), item(chunk(0, 100), chunk_index=4)]
+    spans, stats = pack_context(items, chunk_overlap=20, token_budget=0)
+    assert stats.chunks == 2
+    assert [span.rank for span in spans] == [0, 1]
+
+
+def test_budget_is_filled_by_rank_and_output_in_document_order():
+    items = [
+        item(chunk(300, 400), chunk_index=8),
+        item(chunk(0, 100), chunk_index=0),
+        item(chunk(600, 700), chunk_index=20),
+    ]
+    tokens = estimate_tokens(chunk(0, 100))
+    spans, stats = pack_context(items, chunk_overlap=20, token_budget=tokens * 2)
+    assert [span.start for span in spans] == [0, 8]
+    assert stats.dropped == 1
+    assert stats.tokens <= tokens * 2
+
+
+def test_reserved_tokens_reduce_the_budget():
+    items = [item(chunk(0, 100), chunk_index=0)]
+    tokens = estimate_tokens(chunk(0, 100))
+    spans, stats = pack_context(items, chunk_overlap=20, token_budget=tokens, reserved_tokens=1)
+    assert spans == []
+    assert stats.dropped == 1
+
+
+def test_select_inline_keeps_files_in_order_within_budget():
+    contents = [("a.txt", "x" * 40), ("b.txt", "y" * 400), ("c.txt", "z" * 40)]
+    selected, used, dropped = select_inline(contents, estimate_tokens("x" * 40) * 2)
+    assert [name for name, _ in selected] == ["a.txt", "c.txt"]
+    assert used == estimate_tokens("x" * 40) * 2
+    assert dropped == ["b.txt"]
+    assert select_inline(contents, 0)[2] == []
@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from dedup import ChunkDeduplicator  # noqa: E402
+
+WORDS = ["alpha", "beta", "gamma", "delta", "omega", "sigma", "kappa", "theta"]
+
+
+def paragraph(seed, words=80, numbers=True):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) + (str(rng.randint(0, 99)) if numbers else "") for _ in range(words))
+
+
+def test_exact_duplicates_ignore_case_and_whitespace():
+    dedup = ChunkDeduplicator()
+    text = paragraph(1)
+    assert dedup.check(0, text) is None
+    assert dedup.check(1, "  " + text.upper().replace(" ", "\n ")) == (0, 1.0)
+    assert dedup.suppressed == 1
+
+
+def test_near_duplicate_above_threshold_is_suppressed():
+    dedup = ChunkDeduplicator(threshold=0.8, near_max_chars=10_000)
+    text = paragraph(2)
+    assert dedup.check(0, text) is None
+    rep_index, similarity = dedup.check(1, text + " footer")
+    assert rep_index == 0
+    assert similarity >= 0.8
+
+
+def test_distinct_chunks_are_kept():
+    dedup = ChunkDeduplicator(threshold=0.9, near_max_chars=10_000)
+    for index in range(20):
+        assert dedup.check(index, paragraph(100 + index)) is None
+    assert dedup.suppressed == 0
+
+
+def test_threshold_decides_partially_overlapping_chunks():
+    base = paragraph(3, words=60, numbers=False)
+    changed = " ".join(base.split()[:40]) + " " + paragraph(4, words=20, numbers=False)
+    similarity = None
+    for threshold in (0.95, 0.3):
+        dedup = ChunkDeduplicator(threshold=threshold, near_max_chars=10_000)
+        dedup.check(0, base)
+        result = dedup.check(1, changed)
+        if threshold == 0.95:
+            assert result is None
+        else:
+            assert result is not None
+            similarity = result[1]
+    assert 0.3 <= similarity < 0.95
+
+
+def test_later_exact_copy_maps_to_kept_representative():
+    dedup = ChunkDeduplicator(threshold=0.8, near_max_chars=10_000)
+    text = paragraph(5)
+    dedup.check(0, text)
+    near = text + " footer"
+    assert dedup.check(1, near)[0] == 0
+    assert dedup.check(2, near) == (0, 1.0)
+
+
+def test_clauses_differing_only_in_numbers_are_kept():
+    clause = "乙方应在收到发票后{}天内付款，逾期每日按未付金额的万分之五支付违约金，并承担甲方为追讨欠款支付的合理费用。"
+    dedup = ChunkDeduplicator(threshold=0.5)
+    assert dedup.check(0, clause.format(30)) is None
+    assert dedup.check(1, clause.format(60)) is None
+    assert dedup.suppressed == 0
+
+
+def test_long_chunks_are_only_removed_when_identical():
+    text = paragraph(6, numbers=False)
+    assert len(text) > 300
+    dedup = ChunkDeduplicator(threshold=0.5)
+    assert dedup.check(0, text) is None
+    assert dedup.check(1, text + " footer") is None
+    assert dedup.check(2, text) == (0, 1.0)
+
+
+def test_short_boilerplate_with_small_edits_is_suppressed():
+    dedup = ChunkDeduplicator(threshold=0.85)
+    footer = "本文件仅供内部使用，未经许可不得复制或向第三方披露。保密等级：机密。版权所有，保留一切权利。" * 2
+    assert dedup.check(0, footer) is None
+    rep_index, similarity = dedup.check(1, footer + "！")
+    assert rep_index == 0
+    assert similarity >= dedup.threshold
@@ -0,0 +1,110 @@
+import asyncio
+import itertools
+
+import embedding_cache
+from embedding_cache import CachedEmbeddingProvider, EmbeddingCache, text_hash
+
+DIM = 4
+VECTOR_BYTES = DIM * 4
+
+
+class FakeClock:
+    """每次取时间都递增，保证 last_access 的先后顺序确定"""
+
+    def __init__(self):
+        self._ticks = itertools.count(1)
+
+    def time(self):
+        return float(next(self._ticks))
+
+
+class FakeProvider:
+    provider_config = {"id": "fake", "embedding_model": "test-model"}
+
+    def __init__(self):
+        self.requests = []
+
+    def get_dim(self):
+        return DIM
+
+    async def get_embeddings(self, texts):
+        self.requests.append(list(texts))
+        return [[float(len(text))] * DIM for text in texts]
+
+
+def vector(value):
+    return [float(value)] * DIM
+
+
+def test_evicts_least_recently_accessed(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "time", FakeClock())
+    cache = EmbeddingCache(tmp_path / "cache.db", max_bytes=2 * VECTOR_BYTES)
+
+    async def scenario():
+        await cache.put_many("p", {"a": vector(1), "b": vector(2)})
+        # 访问 a 后，b 成为最久未访问的条目
+        assert set(await cache.get_many("p", ["a"])) == {"a"}
+        await cache.put_many("p", {"c": vector(3)})
+        return await cache.get_many("p", ["a", "b", "c"])
+
+    try:
+        found = asyncio.run(scenario())
+        assert set(found) == {"a", "c"}
+        assert found["c"] == vector(3)
+        stats = cache.stats()
+        assert stats["evictions"] == 1
+        assert stats["entries"] == 2
+        assert stats["size_bytes"] == 2 * VECTOR_BYTES
+    finally:
+        cache.close()
+
+
+def test_size_accounting_survives_reopen(tmp_path):
+    db_path = tmp_path / "cache.db"
+    cache = EmbeddingCache(db_path, max_bytes=10 * VECTOR_BYTES)
+    asyncio.run(cache.put_many("p", {"a": vector(1), "b": vector(2)}))
+    asyncio.run(cache.put_many("p", {"a": vector(5)}))
+    cache.close()
+
+    reopened = EmbeddingCache(db_path, max_bytes=10 * VECTOR_BYTES)
+    try:
+        assert reopened.stats()["entries"] == 2
+        assert reopened.stats()["size_bytes"] == 2 * VECTOR_BYTES
+        assert asyncio.run(reopened.get_many("p", ["a"])) == {"a": vector(5)}
+    finally:
+        reopened.close()
+
+
+def test_provider_only_embeds_missing_texts(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.db", max_bytes=1024 * 1024)
+    provider = FakeProvider()
+    cached = CachedEmbeddingProvider(provider, cache)
+
+    async def scenario():
+        first = await cached.get_embeddings(["aa", "bbb", "aa"])
+        second = await cached.get_embeddings(["bbb", "cccc"])
+        return first, second
+
+    try:
+        first, second = asyncio.run(scenario())
+        assert first == [vector(2), vector(3), vector(2)]
+        assert second == [vector(3), vector(4)]
+        # 同一批次内的重复文本只请求一次，已缓存的文本不再请求
+        assert provider.requests == [["aa", "bbb"], ["cccc"]]
+        assert cache.hits == 1
+        assert cache.misses == 4
+        assert cached.cache_id == "fake:test-model"
+    finally:
+        cache.close()
+
+
+def test_vectors_with_wrong_dimension_are_misses(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.db", max_bytes=1024 * 1024)
+    provider = FakeProvider()
+    cached = CachedEmbeddingProvider(provider, cache)
+    asyncio.run(cache.put_many(cached.cache_id, {text_hash("aa"): [1.0, 2.0]}))
+    try:
+        assert asyncio.run(cached.get_embeddings(["aa"])) == [vector(2)]
+        assert provider.requests == [["aa"]]
+    finally:
+        cache.close()
@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from expiry import ExpiryScheduler
+
+
+def make_scheduler(retention=100, max_rounds=3):
+    rounds = {}
+    return ExpiryScheduler(retention, max_rounds, lambda key: rounds.get(key, 0)), rounds
+
+
+def test_expires_by_deadline_or_rounds():
+    scheduler, rounds = make_scheduler()
+    scheduler.add("a", upload_time=1000)
+    assert "a" in scheduler
+    assert not scheduler.is_expired("a", now=1050)
+    assert scheduler.is_expired("a", now=1101)
+    rounds["a"] = 3
+    assert scheduler.is_expired("a", now=1050)
+    assert scheduler.is_expired("unknown", now=1050)
+
+
+def test_pop_expired_returns_due_keys_in_deadline_order():
+    scheduler, _ = make_scheduler()
+    scheduler.add("late", upload_time=1050)
+    scheduler.add("early", upload_time=1000)
+    scheduler.add("removed", upload_time=900)
+    scheduler.remove("removed")
+    assert scheduler.next_deadline() == 1100
+    assert scheduler.pop_expired(now=1120) == ["early"]
+    assert scheduler.next_deadline() == 1150
+    assert scheduler.pop_expired(now=1200) == ["late"]
+    assert scheduler.next_deadline() is None
+
+
+def test_readding_a_key_replaces_its_deadline():
+    scheduler, _ = make_scheduler()
+    scheduler.add("a", upload_time=1000)
+    scheduler.add("a", upload_time=2000)
+    assert scheduler.pop_expired(now=1500) == []
+    assert scheduler.pop_expired(now=2100) == ["a"]
+
+
+def test_wait_wakes_up_for_an_earlier_file():
+    async def scenario():
+        scheduler, _ = make_scheduler(retention=60)
+        scheduler.add("later", upload_time=time.time())
+        waiter = asyncio.ensure_future(scheduler.wait(max_wait=30))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        scheduler.add("sooner", upload_time=time.time() - 60)
+        await asyncio.wait_for(waiter, timeout=1)
+        assert scheduler.pop_expired() == ["sooner"]
+
+    asyncio.run(scenario())
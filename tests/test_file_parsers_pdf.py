@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+pytest.importorskip("pdfminer")
+
+from file_parsers import read_pdf_to_text, spool_pdf_pages  # noqa: E402
+
+
+def write_pdf(path, page_texts):
+    """生成每页一行文字的最小PDF"""
+    page_count = len(page_texts)
+    font_id = 3 + 2 * page_count
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{3 + 2 * i} 0 R" for i in range(page_count)), page_count)).encode(),
+    ]
+    for i, text in enumerate(page_texts):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append((f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                        f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>").encode())
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(data)
+
+
+def test_spool_writes_one_record_per_page(tmp_path):
+    pdf = tmp_path / "doc.pdf"
+    write_pdf(pdf, ["First page", "Second page", "Third page"])
+    spool = tmp_path / "pages.jsonl"
+
+    assert spool_pdf_pages(str(pdf), 2, str(spool)) == 3
+    records = [json.loads(line) for line in spool.read_text(encoding="utf-8").splitlines()]
+    assert [record["page"] for record in records] == [1, 2, 3]
+    assert [record["text"].strip() for record in records] == ["First page", "Second page", "Third page"]
+    assert "Second page" in read_pdf_to_text(str(pdf))
+
+
+def test_spool_reports_broken_pdf(tmp_path):
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"%PDF-1.4\nnot really a pdf")
+    with pytest.raises(RuntimeError, match="读取PDF文件失败"):
+        spool_pdf_pages(str(broken), 8, str(tmp_path / "pages.jsonl"))
@@ -0,0 +1,64 @@
+from pathlib import Path
+
+import pytest
+
+from file_registry import FileRegistry
+
+SHARED = Path("/data/s/c/_conversation_store")
+
+
+def test_lookups_are_scoped_to_conversation_and_session():
+    registry = FileRegistry()
+    registry[("s", "c", "a")] = Path("/data/s/c/a")
+    registry[("s", "c", "b")] = Path("/data/s/c/b")
+    registry[("s", "d", "a")] = Path("/data/s/d/a")
+    registry[("t", "c", "a")] = Path("/data/t/c/a")
+
+    assert len(registry) == 4
+    assert registry.conversation_files("s", "c") == {"a": Path("/data/s/c/a"), "b": Path("/data/s/c/b")}
+    assert sorted(registry.conversation_keys("s", "c")) == [("s", "c", "a"), ("s", "c", "b")]
+    assert sorted(registry.session_keys("s")) == [("s", "c", "a"), ("s", "c", "b"), ("s", "d", "a")]
+    assert registry.conversation_files("s", "missing") == {}
+    assert ("t", "c", "a") in registry and ("t", "c", "b") not in registry
+    with pytest.raises(KeyError):
+        registry[("t", "d", "a")]
+
+
+def test_shared_directory_reference_counts():
+    registry = FileRegistry()
+    registry[("s", "c", "a")] = SHARED
+    registry[("s", "c", "b")] = SHARED
+    assert registry.dir_refs(SHARED) == 2
+    # 重复登记同一文件不增加引用
+    registry[("s", "c", "b")] = SHARED
+    assert registry.dir_refs(SHARED) == 2
+    assert registry.pop(("s", "c", "a")) == SHARED
+    assert registry.dir_refs(SHARED) == 1
+    del registry[("s", "c", "b")]
+    assert registry.dir_refs(SHARED) == 0
+    assert len(registry) == 0
+
+
+def test_removing_last_file_prunes_empty_levels():
+    registry = FileRegistry()
+    registry[("s", "c", "a")] = Path("/data/s/c/a")
+    registry.pop(("s", "c", "a"))
+    assert registry.sessions() == []
+    assert registry.pop(("s", "c", "a"), "missing") == "missing"
+    with pytest.raises(KeyError):
+        del registry[("s", "c", "a")]
+
+
+def test_inline_text_follows_registration():
+    registry = FileRegistry()
+    key = ("s", "c", "small.txt")
+    registry.set_inline(key, "ignored")
+    assert not registry.is_inline(key)
+
+    registry[key] = Path("/data/s/c/small.txt")
+    registry.set_inline(key)
+    assert registry.is_inline(key) and registry.inline_text(key) is None
+    registry.set_inline(key, "全文")
+    assert registry.inline_text(key) == "全文"
+    registry.pop(key)
+    assert not registry.is_inline(key)
@@ -0,0 +1,58 @@
+from file_rounds_store import FileRoundsStore
+
+KEY = ("session", "conversation", "file_1.txt")
+
+
+def test_rounds_persist_across_restart(tmp_path):
+    db_path = tmp_path / "rounds.db"
+    store = FileRoundsStore(db_path, flush_interval=0.01)
+    assert store.increment(KEY) == 1
+    assert store.increment(KEY) == 2
+    store.increment(("session", "conversation", "file_2.txt"))
+    store.close()
+
+    reopened = FileRoundsStore(db_path, flush_interval=0.01)
+    try:
+        assert reopened.get(KEY) == 2
+        assert reopened.increment(KEY) == 3
+    finally:
+        reopened.close()
+    assert FileRoundsStore(db_path).all()[KEY] == 3
+
+
+def test_deletes_persist_and_later_increments_survive(tmp_path):
+    db_path = tmp_path / "rounds.db"
+    store = FileRoundsStore(db_path, flush_interval=0.01)
+    store.increment(KEY)
+    store.increment(("session", "other", "file.txt"))
+    store.increment(("other_session", "conversation", "file.txt"))
+    store.delete("session", "conversation")
+    store.increment(KEY)
+    store.delete("other_session")
+    store.close()
+
+    reopened = FileRoundsStore(db_path)
+    try:
+        assert reopened.all() == {KEY: 1, ("session", "other", "file.txt"): 1}
+    finally:
+        reopened.close()
+
+
+def test_single_file_delete_keeps_siblings(tmp_path):
+    db_path = tmp_path / "rounds.db"
+    store = FileRoundsStore(db_path, flush_interval=0.01)
+    sibling = ("session", "conversation", "file_2.txt")
+    store.increment(KEY)
+    store.increment(sibling)
+    store.delete(*KEY)
+    assert store.get(KEY) == 0
+    assert store.all() == {sibling: 1}
+    store.delete("session", "conversation", "missing.txt")
+    store.delete("other_session", "conversation", "file_1.txt")
+    store.close()
+
+    reopened = FileRoundsStore(db_path)
+    try:
+        assert reopened.all() == {sibling: 1}
+    finally:
+        reopened.close()
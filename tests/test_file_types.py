@@ -0,0 +1,85 @@
+import zipfile
+
+import pytest
+
+import file_types
+from file_types import FileTypeDetector, detect_file_type, get_detector
+
+
+def write_zip(path, files):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+@pytest.mark.parametrize("files, expected", [
+    ({"[Content_Types].xml": "", "word/document.xml": ""}, "docx"),
+    ({"[Content_Types].xml": "", "xl/workbook.xml": ""}, "xlsx"),
+    ({"[Content_Types].xml": "", "ppt/presentation.xml": ""}, "pptx"),
+    ({"mimetype": "application/vnd.oasis.opendocument.text", "content.xml": ""}, "odt"),
+    ({"readme.txt": "hello"}, "zip"),
+])
+def test_zip_containers_are_told_apart(tmp_path, files, expected):
+    assert detect_file_type(write_zip(tmp_path / "upload", files)) == expected
+
+
+def test_signatures_win_over_misleading_names(tmp_path):
+    pdf = tmp_path / "report.txt"
+    pdf.write_bytes(b"%PDF-1.7\n...")
+    assert detect_file_type(str(pdf)) == "pdf"
+
+    ole = tmp_path / "legacy.bin"
+    ole.write_bytes(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + b"\x00" * 64 + "Workbook".encode("utf-16-le"))
+    assert detect_file_type(str(ole)) == "xls"
+
+    rtf = tmp_path / "note"
+    rtf.write_bytes(b"{\\rtf1\\ansi hello}")
+    assert detect_file_type(str(rtf)) == "rtf"
+
+
+def test_text_uses_upload_name_then_content(tmp_path):
+    path = tmp_path / "file_1700000000"
+    path.write_text("a,b\n1,2\n", encoding="utf-8")
+    assert detect_file_type(str(path), "data.csv") == "csv"
+    assert detect_file_type(str(path)) == "txt"
+    path.write_text('{"key": "value"}', encoding="utf-8")
+    assert detect_file_type(str(path)) == "json"
+    path.write_text("<!DOCTYPE html><html></html>", encoding="utf-8")
+    assert detect_file_type(str(path)) == "html"
+
+
+def test_unknown_binary_falls_back_to_name_without_magic(tmp_path, monkeypatch):
+    detector = FileTypeDetector()
+    monkeypatch.setattr(detector, "_get_magic", lambda: None)
+    path = tmp_path / "image.png"
+    path.write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(range(32)) * 8)
+    assert detector.detect(str(path)) == "png"
+
+
+def test_magic_is_created_once_and_shared(monkeypatch):
+    created = []
+
+    class FakeMagic:
+        def __init__(self, mime):
+            created.append(mime)
+
+        def from_buffer(self, head):
+            return "image/png"
+
+    fake_module = type("magic", (), {"Magic": FakeMagic})
+    monkeypatch.setitem(__import__("sys").modules, "magic", fake_module)
+    detector = FileTypeDetector()
+    assert detector._get_magic() is detector._get_magic()
+    assert created == [True]
+    assert get_detector() is get_detector()
+
+
+@pytest.mark.parametrize("mime, expected", [
+    ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", "docx"),
+    ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    ("application/x-tar", "tar"),
+    ("", None),
+])
+def test_mime_to_ext(mime, expected):
+    assert file_types._mime_to_ext(mime) == expected
@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import ingest_embedder  # noqa: E402
+from ingest_embedder import IngestEmbedder, IngestError, TokenBucket, indexed_chunk_indexes  # noqa: E402
+
+DIM = 4
+
+
+class FakeIndex:
+    d = DIM
+
+    def __init__(self):
+        self.ids = []
+
+    def add_with_ids(self, vectors, ids):
+        assert vectors.shape == (len(ids), DIM)
+        self.ids.extend(int(i) for i in ids)
+
+
+class FakeDocumentStorage:
+    def __init__(self):
+        self.docs = {}
+        self._next_id = 1
+
+    async def insert_documents_batch(self, doc_ids, texts, metadatas):
+        int_ids = []
+        for doc_id, text, metadata in zip(doc_ids, texts, metadatas):
+            self.docs[self._next_id] = {"id": self._next_id, "doc_id": doc_id, "text": text,
+                                        "metadata": json.dumps(metadata)}
+            int_ids.append(self._next_id)
+            self._next_id += 1
+        return int_ids
+
+    async def get_documents(self, metadata_filters, offset=None, limit=None):
+        return [doc for doc in self.docs.values()
+                if all(json.loads(doc["metadata"]).get(k) == v for k, v in metadata_filters.items())]
+
+    async def delete_document_by_doc_id(self, doc_id):
+        for int_id, doc in list(self.docs.items()):
+            if doc["doc_id"] == doc_id:
+                del self.docs[int_id]
+
+
+class FakeVecDB:
+    def __init__(self):
+        self.embedding_storage = type("Storage", (), {})()
+        self.embedding_storage.index = FakeIndex()
+        self.embedding_storage.path = "index.faiss"
+        self.document_storage = FakeDocumentStorage()
+
+
+class FakeProvider:
+    def __init__(self, fail_calls=()):
+        self.calls = 0
+        self.fail_calls = set(fail_calls)
+
+    async def get_embeddings(self, texts):
+        self.calls += 1
+        if self.calls in self.fail_calls or "all" in self.fail_calls and self.calls > 1:
+            raise RuntimeError("rate limited")
+        return [[float(len(text))] * DIM for text in texts]
+
+
+@pytest.fixture
+def saves(monkeypatch):
+    saved = []
+    monkeypatch.setattr(ingest_embedder, "_write_index", lambda storage: saved.append(list(storage.index.ids)))
+    monkeypatch.setattr(ingest_embedder, "_saved_ids", lambda vec_db: set(vec_db.embedding_storage.index.ids))
+    return saved
+
+
+def items(count, db_file="a.txt"):
+    return [(i, f"chunk {i}", {"db_file": db_file, "chunk_index": i}) for i in range(count)]
+
+
+def make_embedder(**kwargs):
+    options = dict(batch_size=16, max_parallel=2, limiter=TokenBucket(0, 1), max_retries=0, retry_base_delay=0)
+    options.update(kwargs)
+    return IngestEmbedder(**options)
+
+
+def test_index_is_saved_once_per_file(saves):
+    vec_db = FakeVecDB()
+    count = asyncio.run(make_embedder().ingest(FakeProvider(), vec_db, items(200)))
+    assert count == 200
+    assert len(saves) == 1
+    assert sorted(saves[0]) == list(range(1, 201))
+
+
+def test_large_files_are_checkpointed(saves):
+    vec_db = FakeVecDB()
+    embedder = make_embedder(batch_size=10, max_parallel=1, checkpoint_chunks=50)
+    asyncio.run(embedder.ingest(FakeProvider(), vec_db, items(200)))
+    assert [len(ids) for ids in saves] == [50, 100, 150, 200]
+
+
+def test_failed_batches_are_retried(saves):
+    vec_db = FakeVecDB()
+    provider = FakeProvider(fail_calls={1, 2})
+    asyncio.run(make_embedder(max_retries=2, max_parallel=1).ingest(provider, vec_db, items(20)))
+    assert provider.calls == 4
+    assert len(vec_db.embedding_storage.index.ids) == 20
+
+
+def test_exhausted_retries_keep_written_batches(saves):
+    vec_db = FakeVecDB()
+    with pytest.raises(IngestError) as info:
+        asyncio.run(make_embedder(max_parallel=1).ingest(FakeProvider(fail_calls={"all"}), vec_db, items(64)))
+    assert info.value.done == 16
+    # 中断前写入的批次也保存到磁盘，续传从这里继续
+    assert [len(ids) for ids in saves] == [16]
+
+
+def test_resume_skips_saved_chunks_and_redoes_unsaved_ones(saves):
+    vec_db = FakeVecDB()
+    asyncio.run(make_embedder(batch_size=5).ingest(FakeProvider(), vec_db, items(10)))
+    # 模拟上次在两次保存之间中断：后5块的文档已写入，向量未保存
+    vec_db.embedding_storage.index.ids = vec_db.embedding_storage.index.ids[:5]
+    asyncio.run(ingest_embedder.insert_suppressed(vec_db, [{"db_file": "a.txt", "chunk_index": 10,
+                                                            "duplicate_of": 0}]))
+
+    skip = asyncio.run(indexed_chunk_indexes(vec_db, "a.txt"))
+    assert skip == {0, 1, 2, 3, 4, 10}
+    assert len(vec_db.document_storage.docs) == 6
+
+    provider = FakeProvider()
+    count = asyncio.run(make_embedder(batch_size=5).ingest(provider, vec_db, items(11), skip=skip))
+    assert count == 11
+    assert provider.calls == 1
+    chunk_indexes = sorted(json.loads(doc["metadata"])["chunk_index"]
+                           for doc in vec_db.document_storage.docs.values())
+    assert chunk_indexes == list(range(11))
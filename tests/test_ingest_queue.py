@@ -0,0 +1,127 @@
+import asyncio
+
+from ingest_queue import CANCELLED, DONE, FAILED, QUEUED, IngestJob, IngestQueue, QueueFullError
+
+
+def make_queue(workers=1, max_queued_bytes=0, **kwargs):
+    order = []
+    gate = asyncio.Event()
+
+    async def runner(job):
+        order.append((job.session_id, job.file_name))
+        await gate.wait()
+        return job.data.get("error")
+
+    return IngestQueue(runner, workers, max_queued_bytes, **kwargs), order, gate
+
+
+def job(session_id, name, size=1, **data):
+    return IngestJob(session_id, name, size, data)
+
+
+async def drain(queue):
+    while queue.queued_count() or queue.running_count():
+        await asyncio.sleep(0)
+
+
+def test_sessions_take_turns():
+    async def scenario():
+        queue, order, gate = make_queue()
+        for name in ("a1", "a2", "a3"):
+            queue.submit(job("A", name))
+        queue.submit(job("B", "b1"))
+        queue.submit(job("C", "c1"))
+        gate.set()
+        await drain(queue)
+        await queue.shutdown()
+        assert [name for _, name in order] == ["a1", "b1", "c1", "a2", "a3"]
+
+    asyncio.run(scenario())
+
+
+def test_queue_rejects_jobs_over_the_size_limit():
+    async def scenario():
+        queue, _, gate = make_queue(max_queued_bytes=10)
+        queue.submit(job("A", "big", size=8))
+        try:
+            queue.submit(job("B", "more", size=8))
+        except QueueFullError:
+            pass
+        else:
+            raise AssertionError("应拒绝超出上限的任务")
+        gate.set()
+        await drain(queue)
+        await queue.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_cancel_session_cancels_queued_and_running_jobs():
+    async def scenario():
+        queue, order, gate = make_queue()
+        running = job("A", "a1")
+        queued = job("A", "a2")
+        other = job("B", "b1")
+        for item in (running, queued, other):
+            queue.submit(item)
+        await asyncio.sleep(0)
+        assert running.state != QUEUED
+
+        assert queue.cancel_session("A") == 2
+        gate.set()
+        await drain(queue)
+        await queue.shutdown()
+        assert running.state == CANCELLED
+        assert queued.state == CANCELLED
+        assert other.state == DONE
+        assert ("A", "a2") not in order
+        assert queue.queued_bytes == 0
+
+    asyncio.run(scenario())
+
+
+def test_failures_are_recorded_in_history():
+    async def scenario():
+        queue, _, gate = make_queue()
+        failing = job("A", "bad", error="解析超时")
+        queue.submit(failing)
+        gate.set()
+        await drain(queue)
+        await queue.shutdown()
+        assert failing.state == FAILED
+        assert queue.session_jobs("A")[DONE] == [failing]
+
+    asyncio.run(scenario())
+
+
+def test_history_keeps_only_recent_sessions():
+    async def scenario():
+        queue, _, gate = make_queue(history_size=2, max_sessions=2)
+        gate.set()
+        for session_id in ("A", "B", "A", "C"):
+            queue.submit(job(session_id, "f"))
+            await drain(queue)
+        await queue.shutdown()
+        assert queue.session_jobs("B")[DONE] == []
+        assert len(queue.session_jobs("A")[DONE]) == 2
+        assert len(queue.session_jobs("C")[DONE]) == 1
+
+    asyncio.run(scenario())
+
+
+def test_finished_jobs_drop_their_payload():
+    async def scenario():
+        queue, _, gate = make_queue()
+        finished = job("A", "a1", event=object())
+        cancelled = job("A", "a2", event=object())
+        queue.submit(finished)
+        queue.submit(cancelled)
+        await asyncio.sleep(0)
+        queue.cancel_session("A")
+        gate.set()
+        await drain(queue)
+        await queue.shutdown()
+        assert finished.data == {} and cancelled.data == {}
+        assert [item.file_name for item in queue.session_jobs("A")[DONE]] == ["a2", "a1"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,62 @@
+import gc
+
+from lexical_index import LexicalIndex, tokenize
+
+
+def test_tokenize_uses_cjk_bigrams_and_lowercase_words():
+    assert tokenize("Hello 文件解析 World") == ["hello", "文件", "件解", "解析", "world"]
+    assert tokenize("a字b") == ["a", "字", "b"]
+
+
+def build_index(tmp_path):
+    index = LexicalIndex(tmp_path / "lexical.db")
+    index.add(
+        [1, 2, 3],
+        ["向量检索与重排序", "关键词检索 BM25 keyword search", "天气预报"],
+        [{"db_file": "a.txt"}, {"db_file": "b.txt"}, {"db_file": "b.txt"}],
+    )
+    return index
+
+
+def test_search_ranks_matching_documents(tmp_path):
+    index = build_index(tmp_path)
+    hits = index.search("BM25 关键词", k=5)
+    assert [doc_key for doc_key, _ in hits] == [2]
+    assert [doc_key for doc_key, _ in index.search("检索", k=5)] in ([1, 2], [2, 1])
+    assert index.search("不相关", k=5) == []
+
+
+def test_delete_file_removes_its_chunks(tmp_path):
+    index = build_index(tmp_path)
+    index.delete_file("b.txt")
+    assert index.search("关键词", k=5) == []
+    assert [doc_key for doc_key, _ in index.search("检索", k=5)] == [1]
+
+
+def test_missing_index_returns_nothing(tmp_path):
+    index = LexicalIndex(tmp_path / "missing.db")
+    assert index.search("检索", k=5) == []
+    index.delete_file("a.txt")
+    assert not index.exists()
+
+
+def test_delete_docs_removes_only_given_keys(tmp_path):
+    index = build_index(tmp_path)
+    index.delete_docs([2])
+    assert index.search("关键词", k=5) == []
+    assert [doc_key for doc_key, _ in index.search("检索", k=5)] == [1]
+    assert [doc_key for doc_key, _ in index.search("天气", k=5)] == [3]
+
+
+def test_write_lock_is_shared_while_held(tmp_path):
+    first = LexicalIndex(tmp_path / "lexical.db")._write_lock()
+    assert LexicalIndex(tmp_path / "lexical.db")._write_lock() is first
+    assert LexicalIndex(tmp_path / "other.db")._write_lock() is not first
+
+
+def test_write_locks_are_released_after_writes(tmp_path):
+    for i in range(20):
+        (tmp_path / str(i)).mkdir()
+        build_index(tmp_path / str(i)).delete_docs([1])
+    gc.collect()
+    assert not any(str(tmp_path) in str(path) for path in LexicalIndex._write_locks.keys())
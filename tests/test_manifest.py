@@ -0,0 +1,69 @@
+import sqlite3
+
+from manifest import FileManifest, ManifestEntry
+
+
+def entry(session_id="s", conversation_id="c", file_name="a.txt", **kwargs):
+    fields = dict(original_name=file_name, upload_time=100, size_bytes=10, chunk_count=3,
+                  store_dir=f"vec/{session_id}/{file_name}")
+    fields.update(kwargs)
+    return ManifestEntry(session_id, conversation_id, file_name, **fields)
+
+
+def test_entries_survive_reopen(tmp_path):
+    db_path = tmp_path / "manifest.db"
+    manifest = FileManifest(db_path)
+    assert manifest.created
+    manifest.add(entry())
+    manifest.add_many([entry(file_name="b.txt", inline=True), entry("t", file_name="c.txt", complete=False)])
+    manifest.close()
+
+    reopened = FileManifest(db_path)
+    try:
+        assert not reopened.created
+        by_name = {item.file_name: item for item in reopened.entries()}
+        assert by_name["a.txt"] == entry()
+        assert by_name["b.txt"].inline is True
+        assert by_name["c.txt"].complete is False
+        assert sorted(reopened.sessions()) == ["s", "t"]
+    finally:
+        reopened.close()
+
+
+def test_remove_by_file_conversation_and_session(tmp_path):
+    manifest = FileManifest(tmp_path / "manifest.db")
+    manifest.add_many([
+        entry(file_name="a.txt"), entry(file_name="b.txt"),
+        entry(conversation_id="d", file_name="a.txt"), entry("t"),
+    ])
+    manifest.remove("s", "c", "a.txt")
+    assert sorted((e.conversation_id, e.file_name) for e in manifest.entries() if e.session_id == "s") == [
+        ("c", "b.txt"), ("d", "a.txt")]
+    manifest.remove("s", "c")
+    assert [(e.session_id, e.conversation_id) for e in manifest.entries()] in (
+        [("s", "d"), ("t", "c")], [("t", "c"), ("s", "d")])
+    manifest.remove("s")
+    assert manifest.sessions() == ["t"]
+    manifest.close()
+
+
+def test_old_manifest_gains_new_columns(tmp_path):
+    db_path = tmp_path / "manifest.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE file_manifest (
+            session_id TEXT NOT NULL, conversation_id TEXT NOT NULL, file_name TEXT NOT NULL,
+            original_name TEXT NOT NULL, upload_time INTEGER NOT NULL, size_bytes INTEGER DEFAULT 0,
+            chunk_count INTEGER DEFAULT 0, store_dir TEXT NOT NULL,
+            PRIMARY KEY (session_id, conversation_id, file_name)
+        )
+    ''')
+    conn.execute("INSERT INTO file_manifest VALUES ('s', 'c', 'a.txt', 'a.txt', 100, 10, 3, 'vec/s/a.txt')")
+    conn.commit()
+    conn.close()
+
+    manifest = FileManifest(db_path)
+    try:
+        assert manifest.entries() == [entry()]
+    finally:
+        manifest.close()
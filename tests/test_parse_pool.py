@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+import pytest
+
+from parse_pool import ParseCancelledError, ParsePool
+
+
+def sleep_then_return(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+def raise_value_error(message):
+    raise ValueError(message)
+
+
+def test_child_result_and_exception_propagate():
+    pool = ParsePool(workers=1, timeout=5, max_concurrent=2)
+
+    async def scenario():
+        assert await pool.run("s", sleep_then_return, 0, "text") == "text"
+        with pytest.raises(ValueError, match="损坏"):
+            await pool.run("s", raise_value_error, "文件损坏")
+
+    asyncio.run(scenario())
+    assert pool.pending_count() == 0
+
+
+def test_timeout_counts_from_start_and_only_affects_its_job():
+    # 单个子进程名额：后面的任务要排队，排队时间不计入超时
+    pool = ParsePool(workers=1, timeout=1.0, max_concurrent=4)
+
+    async def scenario():
+        return await asyncio.gather(
+            pool.run("a", sleep_then_return, 3, "slow"),
+            pool.run("b", sleep_then_return, 0.6, "b1"),
+            pool.run("b", sleep_then_return, 0.6, "b2"),
+            return_exceptions=True,
+        )
+
+    slow, first, second = asyncio.run(scenario())
+    assert isinstance(slow, asyncio.TimeoutError)
+    assert (first, second) == ("b1", "b2")
+
+
+def test_cancel_session_stops_running_and_queued_jobs():
+    pool = ParsePool(workers=1, timeout=10, max_concurrent=4)
+
+    async def scenario():
+        tasks = [
+            asyncio.ensure_future(pool.run("a", sleep_then_return, 5, "a1")),
+            asyncio.ensure_future(pool.run("a", sleep_then_return, 5, "a2")),
+            asyncio.ensure_future(pool.run("b", sleep_then_return, 0.1, "b1")),
+        ]
+        await asyncio.sleep(0.3)
+        assert pool.cancel_session("a") == 2
+        started = time.monotonic()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return results, time.monotonic() - started
+
+    (first, second, other), elapsed = asyncio.run(scenario())
+    assert isinstance(first, ParseCancelledError)
+    assert isinstance(second, ParseCancelledError)
+    assert other == "b1"
+    assert elapsed < 3
+    assert pool.pending_count() == 0
+
+
+def test_thread_mode_times_out():
+    pool = ParsePool(workers=0, timeout=0.2, max_concurrent=1)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run("s", sleep_then_return, 0.5, "late")
+        return await pool.run("s", sleep_then_return, 0, "ok")
+
+    assert asyncio.run(scenario()) == "ok"
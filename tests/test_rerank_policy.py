@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("astrbot")
+
+from retrieval import RerankPolicy  # noqa: E402
+
+
+def doc(doc_id, similarity=0.0):
+    return SimpleNamespace(similarity=similarity, data={"id": doc_id, "text": f"text {doc_id}"})
+
+
+class FakeRerankProvider:
+    def __init__(self, order=None, delay=0.0, error=None):
+        self.order = order
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def rerank(self, query, documents):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        order = self.order or list(range(len(documents)))
+        return [SimpleNamespace(index=index, relevance_score=len(order) - rank)
+                for rank, index in enumerate(order)]
+
+
+def ids(results):
+    return [result.data["id"] for result in results]
+
+
+def run_policy(policy, provider, candidates, k, **kwargs):
+    return asyncio.run(policy.rerank(provider, "query", candidates, k, **kwargs))
+
+
+def test_skips_when_candidates_fit_in_k():
+    policy = RerankPolicy()
+    provider = FakeRerankProvider()
+    result = run_policy(policy, provider, [doc(1, 0.9), doc(2, 0.8)], k=2)
+    assert ids(result) == [1, 2]
+    assert provider.calls == 0
+    assert policy.stats()["few_candidates"] == 1
+
+
+def test_skips_on_clear_similarity_margin():
+    policy = RerankPolicy(skip_margin=0.2)
+    provider = FakeRerankProvider(order=[2, 1, 0])
+    candidates = [doc(1, 0.9), doc(2, 0.85), doc(3, 0.5)]
+    assert ids(run_policy(policy, provider, candidates, k=2)) == [1, 2]
+    assert provider.calls == 0
+    assert policy.stats()["clear_margin"] == 1
+
+
+def test_margin_ignored_for_fused_scores():
+    policy = RerankPolicy(skip_margin=0.2)
+    provider = FakeRerankProvider(order=[2, 1, 0])
+    candidates = [doc(1, 0.9), doc(2, 0.85), doc(3, 0.5)]
+    assert ids(run_policy(policy, provider, candidates, k=2, use_margin=False)) == [3, 2]
+    assert policy.stats()["reranked"] == 1
+
+
+def test_margin_disabled_by_default():
+    policy = RerankPolicy()
+    provider = FakeRerankProvider(order=[2, 1, 0])
+    candidates = [doc(1, 0.9), doc(2, 0.85), doc(3, 0.1)]
+    assert ids(run_policy(policy, provider, candidates, k=2)) == [3, 2]
+    assert policy.stats()["reranked"] == 1
+
+
+def test_falls_back_to_initial_order_on_timeout_and_failure():
+    candidates = [doc(1, 0.9), doc(2, 0.8), doc(3, 0.7)]
+
+    policy = RerankPolicy(timeout=0.05)
+    slow = FakeRerankProvider(order=[2, 1, 0], delay=1.0)
+    assert ids(run_policy(policy, slow, candidates, k=2)) == [1, 2]
+
+    broken = FakeRerankProvider(error=RuntimeError("服务不可用"))
+    assert ids(run_policy(policy, broken, candidates, k=2)) == [1, 2]
+
+    stats = policy.stats()
+    assert stats["timeout"] == 1
+    assert stats["failed"] == 1
+    assert stats["reranked"] == 0
@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("astrbot")
+
+from retrieval import fuse_rrf  # noqa: E402
+
+
+def doc(doc_id, similarity=0.0):
+    return SimpleNamespace(similarity=similarity, data={"id": doc_id, "text": f"text {doc_id}"})
+
+
+def ids(results):
+    return [result.data["id"] for result in results]
+
+
+def test_rrf_prefers_documents_found_by_both_lists():
+    vector_results = [doc(1), doc(2), doc(3)]
+    keyword_results = [doc(3), doc(4), doc(1)]
+    fused = fuse_rrf([vector_results, keyword_results], k=3, rrf_k=60)
+    assert ids(fused) == [1, 3, 2]
+    assert fused[0].similarity == pytest.approx(1 / 61 + 1 / 63)
+
+
+def test_rrf_truncates_to_k():
+    assert ids(fuse_rrf([[doc(1), doc(2)], [doc(3)]], k=2)) == [1, 3]
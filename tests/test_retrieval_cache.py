@@ -0,0 +1,94 @@
+import retrieval_cache
+from retrieval_cache import RetrievalCache, normalize_query
+
+
+def cached(cache, query="问题", files=("a.txt",), session="s", conversation="c"):
+    return cache.get(session, conversation, cache.make_key(session, conversation, query, files, 5))
+
+
+def store(cache, results, query="问题", files=("a.txt",), session="s", conversation="c"):
+    cache.put(session, conversation, cache.make_key(session, conversation, query, files, 5), results)
+
+
+def test_normalized_query_and_file_order_hit_the_same_entry():
+    cache = RetrievalCache(ttl=60, max_entries=4)
+    store(cache, ["hit"], query="What  is\tthis? ", files=("a.txt", "b.txt"))
+    assert normalize_query(" what IS this? ") == "what is this?"
+    assert cached(cache, query="what is THIS?", files=("b.txt", "a.txt")) == ["hit"]
+    # 检索参数不同不命中
+    assert cache.get("s", "c", cache.make_key("s", "c", "what is this?", ("a.txt", "b.txt"), 10)) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_returned_results_are_copies():
+    cache = RetrievalCache(ttl=60, max_entries=4)
+    results = ["x"]
+    store(cache, results)
+    results.append("y")
+    cached(cache).append("z")
+    assert cached(cache) == ["x"]
+
+
+def test_bump_and_forget_invalidate_only_that_conversation():
+    cache = RetrievalCache(ttl=60, max_entries=4)
+    store(cache, ["old"])
+    store(cache, ["other"], conversation="c2")
+    cache.bump("s", "c", "a.txt")
+    assert cached(cache) is None
+    assert cached(cache, conversation="c2") == ["other"]
+
+    # 新版本的键与旧键不同，文件移除版本后又回到初始键
+    store(cache, ["new"])
+    assert cached(cache) == ["new"]
+    cache.forget("s", "c", "a.txt")
+    assert cached(cache) is None
+
+
+def test_drop_conversation_or_whole_session():
+    cache = RetrievalCache(ttl=60, max_entries=4)
+    for session, conversation in (("s", "c1"), ("s", "c2"), ("t", "c1")):
+        cache.bump(session, conversation, "a.txt")
+        store(cache, [conversation], session=session, conversation=conversation)
+    cache.drop("s", "c1")
+    assert cached(cache, session="s", conversation="c1") is None
+    assert cached(cache, session="s", conversation="c2") == ["c2"]
+    cache.drop("s")
+    assert cached(cache, session="s", conversation="c2") is None
+    assert cached(cache, session="t", conversation="c1") == ["c1"]
+    assert [key[:2] for key in cache._versions] == [("t", "c1")]
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(retrieval_cache.time, "time", lambda: now[0])
+    cache = RetrievalCache(ttl=60, max_entries=4)
+    store(cache, ["x"])
+    now[0] += 59
+    assert cached(cache) == ["x"]
+    now[0] += 2
+    assert cached(cache) is None
+
+
+def test_lru_limits_entries_and_conversations():
+    cache = RetrievalCache(ttl=60, max_entries=2, max_conversations=2)
+    for query in ("q1", "q2"):
+        store(cache, [query], query=query)
+    assert cached(cache, query="q1") == ["q1"]
+    store(cache, ["q3"], query="q3")
+    # q1 刚被命中，淘汰的是最久未用的 q2
+    assert cached(cache, query="q2") is None
+    assert cached(cache, query="q1") == ["q1"]
+
+    store(cache, ["c2"], conversation="c2")
+    assert cached(cache, query="q1") == ["q1"]
+    store(cache, ["c3"], conversation="c3")
+    assert cached(cache, conversation="c2") is None
+    assert cached(cache, query="q1") == ["q1"]
+
+
+def test_disabled_cache_stores_nothing():
+    for cache in (RetrievalCache(ttl=0, max_entries=4), RetrievalCache(ttl=60, max_entries=0)):
+        assert not cache.enabled
+        store(cache, ["x"])
+        assert cached(cache) is None
+        assert cache.misses == 0
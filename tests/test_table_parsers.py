@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from file_parsers import iter_table_row_groups
+
+
+def test_row_groups_repeat_the_header_and_track_rows():
+    rows = [("1", "alpha"), ("2", "beta"), ("", ""), ("3", "gamma")]
+    groups = list(iter_table_row_groups(("id", "name"), rows, max_chars=25, title="Sheet1"))
+    assert groups[0] == ("=== Sheet1 ===\nid | name\n1 | alpha", 1, 1)
+    assert all(text.startswith("=== Sheet1 ===\nid | name\n") for text, _, _ in groups)
+    # 空行不输出，但仍计入行号
+    assert [(start, end) for _, start, end in groups] == [(1, 1), (2, 3), (4, 4)]
+
+
+def test_oversized_row_gets_its_own_group():
+    rows = [("short",), ("x" * 100,), ("tail",)]
+    groups = list(iter_table_row_groups(("col",), rows, max_chars=30))
+    assert [text.splitlines()[1:] for text, _, _ in groups] == [["short"], ["x" * 100], ["tail"]]
+
+
+def test_cells_are_rendered_compactly():
+    groups = list(iter_table_row_groups(("a", "b", "c"), [(1.0, None, "line\nbreak"), (2.5, float("nan"), "")], 100))
+    assert groups[0][0] == "a | b | c\n1 |  | line break\n2.5 |  | "
+
+
+def test_csv_is_spooled_as_row_groups(tmp_path):
+    pytest.importorskip("pandas")
+    from file_parsers import read_csv_to_text, spool_table_chunks
+
+    csv_path = tmp_path / "data.csv"
+    csv_path.write_text("id,name\n" + "".join(f"{i},name {i}\n" for i in range(1, 101)), encoding="utf-8")
+    spool = tmp_path / "rows.jsonl"
+
+    count = spool_table_chunks(str(csv_path), "csv", 200, str(spool))
+    records = [json.loads(line) for line in spool.read_text(encoding="utf-8").splitlines()]
+    assert count == len(records) > 1
+    assert all(record["text"].startswith("id | name\n") and len(record["text"]) <= 200 for record in records)
+    assert records[0]["row_start"] == 1 and records[-1]["row_end"] == 100
+    assert all(a["row_end"] + 1 == b["row_start"] for a, b in zip(records, records[1:]))
+    assert read_csv_to_text(str(csv_path)).splitlines()[:2] == ["id | name", "1 | name 1"]
+
+
+def test_xlsx_sheets_are_streamed_with_their_own_headers(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    from file_parsers import iter_table_chunks, read_excel_to_text
+
+    workbook = openpyxl.Workbook()
+    first = workbook.active
+    first.title = "Orders"
+    first.append([None, None])
+    first.append(["order", "amount"])
+    first.append(["A-1", 10])
+    second = workbook.create_sheet("Empty")
+    second.append([None])
+    third = workbook.create_sheet("Users")
+    third.append(["user"])
+    third.append(["alice"])
+    path = tmp_path / "book.xlsx"
+    workbook.save(path)
+
+    chunks = list(iter_table_chunks(str(path), "xlsx", 1000))
+    assert [(chunk["sheet"], chunk["text"]) for chunk in chunks] == [
+        ("Orders", "=== Orders ===\norder | amount\nA-1 | 10"),
+        ("Users", "=== Users ===\nuser\nalice"),
+    ]
+    assert read_excel_to_text(str(path), "xlsx").startswith("=== Orders ===\norder | amount\nA-1 | 10")
@@ -0,0 +1,58 @@
+import codecs
+
+import pytest
+
+from file_parsers import detect_encoding, iter_decoded_blocks, iter_text_segments, read_txt_to_text
+
+
+def test_bom_decides_the_encoding(tmp_path):
+    path = tmp_path / "bom.txt"
+    path.write_bytes(codecs.BOM_UTF8 + "内容".encode("utf-8"))
+    assert detect_encoding(str(path)) == "utf-8-sig"
+    assert read_txt_to_text(str(path)) == "内容"
+    path.write_bytes("内容".encode("utf-16"))
+    assert detect_encoding(str(path)) == "utf-16"
+
+
+def test_sampled_utf8_tolerates_characters_split_at_sample_edges(tmp_path):
+    path = tmp_path / "large.txt"
+    # 三字节字符使采样边界落在字符中间
+    path.write_text("中文字符" * 30000, encoding="utf-8")
+    assert detect_encoding(str(path), sample_bytes=1000) == "utf-8"
+
+
+def test_non_utf8_text_is_detected_from_samples(tmp_path):
+    pytest.importorskip("chardet")
+    path = tmp_path / "gbk.txt"
+    text = "这是一个使用国标编码保存的中文文本文件，用于检测编码。\n" * 200
+    path.write_bytes(text.encode("gb18030"))
+    encoding = detect_encoding(str(path))
+    assert encoding != "utf-8"
+    assert read_txt_to_text(str(path)) == text
+
+
+def test_decoding_across_blocks_keeps_multibyte_characters(tmp_path):
+    path = tmp_path / "blocks.txt"
+    text = "ab中文" * 1000
+    path.write_text(text, encoding="utf-8")
+    blocks = list(iter_decoded_blocks(str(path), "utf-8", block_bytes=7))
+    assert len(blocks) > 1
+    assert "".join(blocks) == text
+    assert "�" not in "".join(blocks)
+
+
+def test_segments_prefer_line_breaks(tmp_path):
+    path = tmp_path / "lines.txt"
+    lines = [f"line {i:04d}\n" for i in range(300)]
+    path.write_text("".join(lines), encoding="utf-8")
+    segments = list(iter_text_segments(str(path), max_chars=1000))
+    assert "".join(segments) == "".join(lines)
+    assert all(len(segment) <= 1000 and segment.endswith("\n") for segment in segments)
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    assert detect_encoding(str(path)) == "utf-8"
+    assert read_txt_to_text(str(path)) == ""
+    assert list(iter_text_segments(str(path))) == []
@@ -0,0 +1,172 @@
+import asyncio
+
+from vector_db_pool import VectorDBPool
+
+
+class FakeDB:
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def make_pool(max_open=0, max_bytes=0):
+    opened = []
+
+    async def opener(store_dir):
+        db = FakeDB(store_dir)
+        opened.append(db)
+        return db
+
+    return VectorDBPool(opener, max_open, max_bytes), opened
+
+
+async def use(pool, store_dir):
+    db = await pool.acquire(store_dir)
+    await pool.release(store_dir)
+    return db
+
+
+def test_least_recently_used_idle_db_is_evicted_and_reopened():
+    async def scenario():
+        pool, opened = make_pool(max_open=2)
+        a = await use(pool, "a")
+        await use(pool, "b")
+        await use(pool, "a")
+        await use(pool, "c")
+        assert len(pool) == 2
+        assert [db.store_dir for db in opened if db.closed] == ["b"]
+        assert not a.closed
+        await use(pool, "b")
+        assert pool.evictions == 2
+        assert pool.reopens == 1
+
+    asyncio.run(scenario())
+
+
+def test_pinned_db_is_not_evicted():
+    async def scenario():
+        pool, _ = make_pool(max_open=1)
+        a = await pool.acquire("a")
+        b = await pool.acquire("b")
+        assert not a.closed and not b.closed
+        assert len(pool) == 2
+        await pool.release("a")
+        assert a.closed
+        assert not b.closed
+        await pool.release("b")
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_acquires_share_one_open():
+    async def scenario():
+        pool, opened = make_pool()
+        first, second = await asyncio.gather(pool.acquire("a"), pool.acquire("a"))
+        assert first is second
+        assert len(opened) == 1
+
+    asyncio.run(scenario())
+
+
+def test_close_waits_for_pins_and_blocks_reacquire():
+    async def scenario():
+        pool, _ = make_pool()
+        db = await pool.acquire("a")
+        closing = asyncio.ensure_future(pool.close("a"))
+        await asyncio.sleep(0.01)
+        assert not db.closed and not closing.done()
+
+        reacquire = asyncio.ensure_future(pool.acquire("a"))
+        await asyncio.sleep(0.01)
+        assert not reacquire.done()
+
+        await pool.release("a")
+        await closing
+        assert db.closed
+        fresh = await reacquire
+        assert fresh is not db and not fresh.closed
+
+    asyncio.run(scenario())
+
+
+def test_close_of_idle_db_closes_immediately():
+    async def scenario():
+        pool, _ = make_pool()
+        db = await use(pool, "a")
+        await pool.close("a")
+        assert db.closed
+        assert len(pool) == 0
+        assert pool.evictions == 0
+
+    asyncio.run(scenario())
+
+
+def make_slow_pool(delay=0.05, **kwargs):
+    opened = []
+
+    async def opener(store_dir):
+        await asyncio.sleep(delay)
+        db = FakeDB(store_dir)
+        opened.append(db)
+        return db
+
+    return VectorDBPool(opener, **{"max_open": 0, "max_bytes": 0, **kwargs}), opened
+
+
+def test_cancelled_opener_does_not_leak_or_fail_waiters():
+    async def scenario():
+        pool, opened = make_slow_pool()
+        first = asyncio.ensure_future(pool.acquire("a"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(pool.acquire("a"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        db = await second
+        assert first.cancelled()
+        assert len(opened) == 1 and db is opened[0]
+        assert len(pool) == 1
+        await pool.release("a")
+        # 被取消的调用方没有持有句柄，关闭不需要等待
+        await asyncio.wait_for(pool.close("a"), timeout=1)
+        assert db.closed
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_sole_opener_still_registers_handle():
+    async def scenario():
+        pool, opened = make_slow_pool()
+        with_timeout = asyncio.wait_for(pool.acquire("a"), timeout=0.01)
+        try:
+            await with_timeout
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(0.1)
+        assert len(pool) == 1 and pool.handles() == opened
+        await pool.close_all()
+        assert opened[0].closed
+
+    asyncio.run(scenario())
+
+
+def test_close_waits_for_pending_open():
+    async def scenario():
+        pool, opened = make_slow_pool()
+        opening = asyncio.ensure_future(pool.acquire("a"))
+        await asyncio.sleep(0)
+        closing = asyncio.ensure_future(pool.close("a"))
+        db = await opening
+        assert len(opened) == 1 and db is opened[0]
+        await asyncio.sleep(0.01)
+        # 打开完成后才开始关闭，关闭等待正在使用的调用方 release
+        assert not closing.done() and not db.closed
+        await pool.release("a")
+        await closing
+        assert db.closed
+        assert len(pool) == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,17 @@
+"""文本token数估算
+
+不依赖具体模型的分词器：中日韩字符大约每个字一个token，其他文字大约每4个字符一个token。
+只用于预算判断，不要求精确。
+"""
+
+import re
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
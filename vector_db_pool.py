@@ -0,0 +1,190 @@
+"""向量数据库句柄池
+
+按向量数据库目录缓存已打开的 FaissVecDB，限制同时打开的数量和估算的常驻内存，
+超出上限时关闭最久未检索的实例，再次使用时透明地重新打开。
+文件清理时关闭的实例若仍在使用中，等到最后一个使用者 release 后才真正关闭。
+打开操作在独立的任务中进行，等待打开的调用方被取消（如检索超时）时，打开仍会完成并登记到池中，不会泄漏。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+
+def estimate_resident_bytes(vec_db) -> int:
+    """估算向量数据库常驻内存（FAISS平铺索引约为 向量数 × 维度 × 4 字节）"""
+    try:
+        index = vec_db.embedding_storage.index
+        return int(index.ntotal) * int(index.d) * 4
+    except Exception:
+        pass
+    try:
+        return Path(vec_db.index_store_path).stat().st_size
+    except Exception:
+        return 0
+
+
+class _PoolEntry:
+    def __init__(self, vec_db):
+        self.vec_db = vec_db
+        self.pins = 0
+        self.size_bytes = estimate_resident_bytes(vec_db)
+        self.idle: Optional[asyncio.Event] = None  # 关闭时仍在使用：最后一个使用者 release 时设置
+        self.closed = asyncio.Event()
+
+
+class VectorDBPool:
+    """已打开向量数据库的LRU池
+
+    - max_open 为同时打开的向量数据库数量上限，0 表示不限制
+    - max_bytes 为估算常驻内存上限，0 表示不限制
+    - 正在使用（acquire 后尚未 release）的实例不会被淘汰，close 会等待其使用结束后再关闭
+    """
+
+    def __init__(self, opener: Callable[[Path], Awaitable], max_open: int, max_bytes: int):
+        self._opener = opener
+        self.max_open = max(0, max_open)
+        self.max_bytes = max(0, max_bytes)
+        self._entries: "OrderedDict[Path, _PoolEntry]" = OrderedDict()
+        self._opening: Dict[Path, asyncio.Task] = {}
+        self._closing: Dict[Path, _PoolEntry] = {}
+        self._evicted: Set[Path] = set()
+        self.evictions = 0
+        self.reopens = 0
+        self.reopen_seconds_total = 0.0
+        self.reopen_seconds_max = 0.0
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def handles(self) -> list:
+        return [entry.vec_db for entry in self._entries.values()]
+
+    async def acquire(self, store_dir: Path):
+        """取得（必要时打开）向量数据库并标记为使用中，用完后必须调用 release"""
+        while True:
+            closing = self._closing.get(store_dir)
+            if closing is not None:
+                # 等待正在关闭的实例关闭后再重新打开，同一目录不会同时打开两个实例
+                await closing.closed.wait()
+            entry = self._entries.get(store_dir)
+            if entry is None:
+                entry = await self._open(store_dir)
+                # 打开完成到这里恢复执行之间，实例可能已被淘汰或关闭
+                if self._entries.get(store_dir) is not entry:
+                    continue
+            break
+        entry.pins += 1
+        self._entries.move_to_end(store_dir)
+        await self._evict()
+        return entry.vec_db
+
+    async def release(self, store_dir: Path):
+        """结束使用向量数据库，并按最新大小检查是否需要淘汰"""
+        entry = self._entries.get(store_dir)
+        if entry is None:
+            closing = self._closing.get(store_dir)
+            if closing is not None:
+                closing.pins = max(0, closing.pins - 1)
+                if closing.pins == 0 and closing.idle is not None:
+                    closing.idle.set()
+            return
+        entry.pins = max(0, entry.pins - 1)
+        entry.size_bytes = estimate_resident_bytes(entry.vec_db)
+        await self._evict()
+
+    async def _open(self, store_dir: Path) -> _PoolEntry:
+        # 同一目录的并发打开请求共用一次打开操作；所有调用方（包括第一个）都只等待而不取消打开任务
+        task = self._opening.get(store_dir)
+        if task is None:
+            task = asyncio.ensure_future(self._open_entry(store_dir))
+            self._opening[store_dir] = task
+            task.add_done_callback(lambda done: self._opened(store_dir, done))
+        return await asyncio.shield(task)
+
+    def _opened(self, store_dir: Path, task: asyncio.Task):
+        if self._opening.get(store_dir) is task:
+            del self._opening[store_dir]
+        # 等待者都已取消时取回异常，避免未检索异常的警告
+        if not task.cancelled():
+            task.exception()
+
+    async def _open_entry(self, store_dir: Path) -> _PoolEntry:
+        start = time.perf_counter()
+        vec_db = await self._opener(store_dir)
+        elapsed = time.perf_counter() - start
+        if store_dir in self._evicted:
+            self._evicted.discard(store_dir)
+            self.reopens += 1
+            self.reopen_seconds_total += elapsed
+            self.reopen_seconds_max = max(self.reopen_seconds_max, elapsed)
+        entry = _PoolEntry(vec_db)
+        self._entries[store_dir] = entry
+        return entry
+
+    def _over_budget(self) -> bool:
+        if self.max_open and len(self._entries) > self.max_open:
+            return True
+        if self.max_bytes and self.resident_bytes > self.max_bytes:
+            return True
+        return False
+
+    async def _evict(self):
+        """按最久未使用顺序关闭空闲的向量数据库，直到回到上限以内"""
+        while self._over_budget():
+            victim = next((d for d, e in self._entries.items() if e.pins == 0), None)
+            if victim is None:
+                break
+            entry = self._entries.pop(victim)
+            self._evicted.add(victim)
+            self.evictions += 1
+            await entry.vec_db.close()
+
+    async def close(self, store_dir: Path):
+        """关闭并移出指定的向量数据库（用于文件清理，不计入淘汰统计）
+
+        实例仍在使用时先移出池（新的 acquire 等待关闭完成），等所有使用者 release 后再关闭。
+        """
+        self._evicted.discard(store_dir)
+        opening = self._opening.get(store_dir)
+        if opening is not None:
+            # 等正在进行的打开完成后再关闭，避免关闭后又登记一个已删除目录的实例
+            await asyncio.gather(asyncio.shield(opening), return_exceptions=True)
+        closing = self._closing.get(store_dir)
+        if closing is not None:
+            await closing.closed.wait()
+            return
+        entry = self._entries.pop(store_dir, None)
+        if entry is None:
+            return
+        self._closing[store_dir] = entry
+        try:
+            if entry.pins:
+                entry.idle = asyncio.Event()
+                await entry.idle.wait()
+            await entry.vec_db.close()
+        finally:
+            del self._closing[store_dir]
+            entry.closed.set()
+
+    async def close_all(self):
+        for store_dir in list(self._entries):
+            await self.close(store_dir)
+
+    def stats(self) -> dict:
+        return {
+            "open": len(self._entries),
+            "max_open": self.max_open,
+            "resident_bytes": self.resident_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "reopens": self.reopens,
+            "reopen_avg_ms": self.reopen_seconds_total / self.reopens * 1000 if self.reopens else 0.0,
+            "reopen_max_ms": self.reopen_seconds_max * 1000,
+        }